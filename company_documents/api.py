@@ -7,69 +7,177 @@ Version: 0.0.2.6
 
 Методы:
 -------
-1. get_project_document_overview(project)
+1. get_project_document_overview(project, [фильтры], [sort_by], [limit, cursor])
    - Flat список документов с files[]
+   - Фильтры, сортировка и keyset-пагинация выполняются в SQL
    - Для: таблиц, списков, Script Report
-   
+
 2. get_project_document_tree(project) 
    - Иерархическая структура по level_1..5
    - Для: Tree View, Custom Page с деревом
+
+3. get_project_document_view(project, [фильтры], [limit, cursor])
+   - Страница таблицы + структура папок проекта + названия папок и сотрудников
+   - Для: страницы Project Documents (один вызов вместо overview + tree)
+
+4. get_project_folder_rollup(project)
+   - Агрегаты по поддеревьям папок (nested set lft/rgt): документы, файлы,
+     ожидаемые файлы, статусы, просроченные
+   - Для: счётчиков по поддеревьям
+
+5. get_folder_children(project, [parent_fst], [limit, cursor])
+   - Дочерние папки со счётчиками + документы папки (keyset-пагинация)
+   - Для: ленивого дерева страницы Project Documents
+
+Ответы методов 1–5 кэшируются в Redis по проекту и версии (view_cache.py):
+версия увеличивается при изменении документов, файлов и папок FST.
 """
+from itertools import pairwise
+
 import frappe
 from frappe import _
 
+from company_documents.view_cache import cached_project_view
+
 
 # =============================================================================
 # МЕТОД 1: FLAT LIST (для таблиц и списков)
 # =============================================================================
 
-@frappe.whitelist()
-def get_project_document_overview(project):
-    """
-    Получить все документы проекта с полными данными.
-    Возвращает flat-список — подходит для таблиц, DataTable, Script Report.
+OVERVIEW_FIELDS = [
+    "name", "project",
+    "level_1", "level_2", "level_3", "level_4", "level_5",
+    "readiness_status",
+    "start_date", "planned_days", "planned_end_date",
+    "due_date", "overdue",
+    "expected_files", "files_count",
+    "responsible_employee"
+]
+
+# Поля сортировки: {ключ: (колонка, может ли быть NULL)}.
+# Сортировка и keyset-условие идут по самой колонке (без IFNULL), чтобы
+# работали индексы; NULL (в MariaDB — наименьшее значение) обрабатывается
+# отдельными условиями. creation / name и Int-колонки — NOT NULL.
+OVERVIEW_SORT_FIELDS = {
+    "creation": ("creation", False),
+    "name": ("name", False),
+    "readiness_status": ("readiness_status", True),
+    "files_count": ("files_count", False),
+    "start_date": ("start_date", True),
+    "planned_end_date": ("planned_end_date", True),
+    "planned_days": ("planned_days", False),
+    "due_date": ("due_date", True),
+    "responsible_employee": ("responsible_employee", True)
+}
+
+OVERVIEW_MAX_PAGE_SIZE = 500
+
+
+def _parse_list(value):
+    """Параметр-список из запроса: JSON-строка, строка через запятую или list"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = frappe.parse_json(value) if value.startswith("[") else value.split(",")
+    return [v for v in value if v]
+
+
+def _encode_cursor(value, name):
+    import base64
     
-    Оптимизировано: 2 SQL запроса вместо N+1
+    raw = frappe.as_json([str(value) if value is not None else None, name], indent=None)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    import base64
+    
+    try:
+        value, name = frappe.parse_json(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return value, name
+    except Exception:
+        frappe.throw(_("Invalid cursor"))
+
+
+def build_overview_conditions(project, filters):
+    """
+    WHERE для документов проекта по фильтрам страницы Project Documents.
     
     Args:
-        project: str - имя проекта
+        filters: dict — level_1..level_5, readiness_status (список),
+                 overdue (0/1), responsible_employee, search, date_from, date_to
     
     Returns:
-        list: [{name, project, level_1..5, files: [{file_name, file_url}], ...}]
+        tuple: (список условий, параметры)
     """
-    if not frappe.has_permission("Document", "read"):
-        frappe.throw(_("Insufficient permissions"), frappe.PermissionError)
-    
-    if not project:
-        frappe.throw(_("Project parameter is required"))
-    
-    # Запрос 1: Документы
-    docs = frappe.get_all(
-        "Document",
-        filters={"project": project},
-        fields=[
-            "name", "project",
-            "level_1", "level_2", "level_3", "level_4", "level_5",
-            "readiness_status",
-            "start_date", "planned_days", "planned_end_date",
-            "due_date", "overdue",
-            "expected_files", "files_count",
-            "responsible_employee"
-        ],
-        order_by="creation desc"
-    )
-    
+    conditions = ["`project` = %(project)s"]
+    values = {"project": project}
+    
+    for i in range(1, 6):
+        level = filters.get(f"level_{i}")
+        if level:
+            conditions.append(f"`level_{i}` = %(level_{i})s")
+            values[f"level_{i}"] = level
+    
+    statuses = _parse_list(filters.get("readiness_status"))
+    if statuses:
+        conditions.append("`readiness_status` IN %(readiness_status)s")
+        values["readiness_status"] = tuple(statuses)
+    
+    if filters.get("overdue") not in (None, ""):
+        conditions.append("`overdue` = %(overdue)s")
+        values["overdue"] = frappe.utils.cint(filters["overdue"])
+    
+    if filters.get("responsible_employee"):
+        conditions.append("`responsible_employee` = %(responsible_employee)s")
+        values["responsible_employee"] = filters["responsible_employee"]
+    
+    search = (filters.get("search") or "").strip()
+    if search:
+        # Поиск по имени документа или по названию любой папки пути
+        from company_documents.nextcloud_sync import get_fst_folder_names
+        
+        search_lower = search.lower()
+        fst_ids = tuple(
+            fst for fst, folder_name in get_fst_folder_names().items()
+            if search_lower in (folder_name or "").lower()
+        )
+        
+        search_conditions = ["`name` LIKE %(search)s"]
+        values["search"] = f"%{search}%"
+        if fst_ids:
+            values["search_fst"] = fst_ids
+            search_conditions += [f"`level_{i}` IN %(search_fst)s" for i in range(1, 6)]
+        conditions.append("(" + " OR ".join(search_conditions) + ")")
+    
+    date_from, date_to = filters.get("date_from"), filters.get("date_to")
+    if date_from or date_to:
+        # Хотя бы одна из дат документа попадает в период
+        date_conditions = []
+        for field in ("start_date", "planned_end_date", "due_date"):
+            parts = [f"`{field}` IS NOT NULL"]
+            if date_from:
+                parts.append(f"`{field}` >= %(date_from)s")
+            if date_to:
+                parts.append(f"`{field}` <= %(date_to)s")
+            date_conditions.append("(" + " AND ".join(parts) + ")")
+        conditions.append("(" + " OR ".join(date_conditions) + ")")
+        values.update({"date_from": date_from, "date_to": date_to})
+    
+    return conditions, values
+
+
+def attach_document_files(docs):
+    """Добавить files[] к документам — все файлы одним запросом"""
     if not docs:
-        return []
+        return docs
     
-    # Запрос 2: ВСЕ файлы одним запросом
-    doc_names = [d.name for d in docs]
     all_files = frappe.db.sql("""
         SELECT parent, file_name, file_url
         FROM `tabDocument File`
         WHERE parent IN %(names)s
         ORDER BY parent, uploaded_on DESC
-    """, {"names": doc_names}, as_dict=True)
+    """, {"names": [d.name for d in docs]}, as_dict=True)
     
     # Группируем файлы по документу
     files_map = {}
@@ -88,6 +196,138 @@ def get_project_document_overview(project):
     return docs
 
 
+@frappe.whitelist()
+def get_project_document_overview(project, level_1=None, level_2=None, level_3=None,
+                                  level_4=None, level_5=None, readiness_status=None,
+                                  overdue=None, responsible_employee=None, search=None,
+                                  date_from=None, date_to=None, sort_by=None,
+                                  sort_order=None, limit=None, cursor=None):
+    """
+    Получить документы проекта с полными данными.
+    Возвращает flat-список — подходит для таблиц, DataTable, Script Report.
+    
+    Фильтры и сортировка выполняются в SQL. Если передан limit или cursor,
+    возвращается одна страница (keyset-пагинация по (sort_by, name)).
+    
+    Оптимизировано: 2 SQL запроса вместо N+1 (+ COUNT для страницы)
+    
+    Args:
+        project: str - имя проекта
+        level_1..level_5: FST id папки на уровне
+        readiness_status: список статусов (JSON или через запятую)
+        overdue: 0/1
+        responsible_employee: Employee id
+        search: подстрока имени документа или названия папки
+        date_from, date_to: период для start_date / planned_end_date / due_date
+        sort_by: ключ OVERVIEW_SORT_FIELDS (по умолчанию creation)
+        sort_order: asc / desc (по умолчанию desc для creation, иначе asc)
+        limit: размер страницы (до OVERVIEW_MAX_PAGE_SIZE)
+        cursor: next_cursor предыдущей страницы
+    
+    Returns:
+        list: [{name, project, level_1..5, files: [{file_name, file_url}], ...}]
+        dict: {documents, total, next_cursor} — если передан limit или cursor
+    """
+    if not frappe.has_permission("Document", "read"):
+        frappe.throw(_("Insufficient permissions"), frappe.PermissionError)
+    
+    if not project:
+        frappe.throw(_("Project parameter is required"))
+    
+    filters = {
+        "level_1": level_1, "level_2": level_2, "level_3": level_3,
+        "level_4": level_4, "level_5": level_5,
+        "readiness_status": readiness_status, "overdue": overdue,
+        "responsible_employee": responsible_employee, "search": search,
+        "date_from": date_from, "date_to": date_to
+    }
+    args = dict(filters, sort_by=sort_by, sort_order=sort_order, limit=limit, cursor=cursor)
+    
+    return cached_project_view(
+        "overview", project, args,
+        lambda: query_project_document_overview(project, filters, sort_by, sort_order, limit, cursor)
+    )
+
+
+def _overview_keyset_condition(column, nullable, sort_order, cursor_value):
+    """
+    Keyset-условие: строки строго после (значение, name) последней строки
+    страницы в порядке ORDER BY `column` sort_order, `name` sort_order.
+    
+    Для nullable колонок NULL идут первыми при asc и последними при desc.
+    """
+    op = "<" if sort_order == "desc" else ">"
+    after_name = f"`name` {op} %(cursor_name)s"
+    
+    if cursor_value is None:
+        # Последняя строка страницы — с NULL: при asc дальше NULL с большим
+        # name и все не-NULL, при desc — только NULL с меньшим name
+        if sort_order == "desc":
+            return f"(`{column}` IS NULL AND {after_name})"
+        return f"(`{column}` IS NULL AND {after_name} OR `{column}` IS NOT NULL)"
+    
+    condition = f"`{column}` {op} %(cursor_value)s OR (`{column}` = %(cursor_value)s AND {after_name})"
+    if nullable and sort_order == "desc":
+        condition += f" OR `{column}` IS NULL"
+    return f"({condition})"
+
+
+def query_project_document_overview(project, filters, sort_by=None, sort_order=None, limit=None, cursor=None):
+    """Запросы get_project_document_overview без кэша (параметры — см. там)"""
+    conditions, values = build_overview_conditions(project, filters)
+    
+    sort_by = sort_by if sort_by in OVERVIEW_SORT_FIELDS else "creation"
+    if sort_order not in ("asc", "desc"):
+        sort_order = "desc" if sort_by == "creation" else "asc"
+    
+    column, nullable = OVERVIEW_SORT_FIELDS[sort_by]
+    
+    paged = bool(limit or cursor)
+    page_conditions = list(conditions)
+    
+    if cursor:
+        cursor_value, cursor_name = _decode_cursor(cursor)
+        page_conditions.append(_overview_keyset_condition(column, nullable, sort_order, cursor_value))
+        values.update({"cursor_value": cursor_value, "cursor_name": cursor_name})
+    
+    page_size = min(frappe.utils.cint(limit) or OVERVIEW_MAX_PAGE_SIZE, OVERVIEW_MAX_PAGE_SIZE)
+    limit_clause = f"LIMIT {page_size + 1}" if paged else ""
+    
+    # Запрос 1: Документы
+    docs = frappe.db.sql(f"""
+        SELECT {", ".join(f"`{field}`" for field in OVERVIEW_FIELDS)}, `{column}` AS _sort_value
+        FROM `tabDocument`
+        WHERE {" AND ".join(page_conditions)}
+        ORDER BY `{column}` {sort_order}, `name` {sort_order}
+        {limit_clause}
+    """, values, as_dict=True)
+    
+    next_cursor = None
+    if paged and len(docs) > page_size:
+        docs = docs[:page_size]
+        next_cursor = _encode_cursor(docs[-1]._sort_value, docs[-1].name)
+    
+    for doc in docs:
+        doc.pop("_sort_value", None)
+    
+    # Запрос 2: файлы только выбранных документов
+    attach_document_files(docs)
+    
+    if not paged:
+        return docs
+    
+    total = frappe.db.sql(
+        f"SELECT COUNT(*) FROM `tabDocument` WHERE {' AND '.join(conditions)}",
+        values
+    )[0][0]
+    
+    return {
+        "documents": docs,
+        "total": total,
+        "next_cursor": next_cursor
+    }
+
+
 # =============================================================================
 # МЕТОД 2: TREE STRUCTURE (для древовидного отображения)
 # =============================================================================
@@ -126,8 +366,13 @@ def get_project_document_tree(project):
     if not project:
         frappe.throw(_("Project parameter is required"))
     
+    return cached_project_view("tree", project, None, lambda: build_project_document_tree(project))
+
+
+def build_project_document_tree(project):
+    """Дерево get_project_document_tree без кэша"""
     # Получаем flat-данные (переиспользуем оптимизированный метод)
-    docs = get_project_document_overview(project)
+    docs = query_project_document_overview(project, {})
     
     if not docs:
         return {"project": project, "tree": {}, "folder_names": {}}
@@ -213,98 +458,467 @@ def get_project_document_tree(project):
 
 
 # =============================================================================
-# УТИЛИТЫ ДЛЯ ТЕСТИРОВАНИЯ
+# МЕТОД 3: VIEW (таблица + дерево одним запросом)
 # =============================================================================
 
+def get_folder_and_employee_names(rows):
+    """Названия папок (кэш FST) и имена сотрудников для строк документов"""
+    from company_documents.nextcloud_sync import get_fst_folder_names
+    
+    fst_names = get_fst_folder_names()
+    folder_names = {}
+    employee_ids = set()
+    
+    for row in rows:
+        for i in range(1, 6):
+            fst = row.get(f"level_{i}")
+            if fst:
+                folder_names[fst] = fst_names.get(fst, fst)
+        if row.get("responsible_employee"):
+            employee_ids.add(row["responsible_employee"])
+    
+    employee_names = {}
+    if employee_ids:
+        emp_data = frappe.get_all(
+            "Employee",
+            filters={"name": ["in", list(employee_ids)]},
+            fields=["name", "employee_name"]
+        )
+        employee_names = {e.name: e.employee_name for e in emp_data}
+    
+    return folder_names, employee_names
+
+
+def build_tree_index(rows):
+    """
+    Компактный индекс дерева папок по строкам с полями level_1..5
+    (документы в индекс не входят — их отдаёт get_folder_children).
+    
+    Returns:
+        dict: {
+            "roots": ["FST-0001", ...],                  # папки level_1 (и "_root")
+            "children": {"FST-0001": ["FST-0004"]}       # папка → дочерние папки
+        }
+    """
+    roots = []
+    children = {}
+    
+    for row in rows:
+        path = []
+        for i in range(1, 6):
+            level = row.get(f"level_{i}")
+            if not level:
+                break
+            path.append(level)
+        
+        if not path:
+            # Документ без папки — в корень
+            path = ["_root"]
+        
+        if path[0] not in children:
+            children[path[0]] = []
+            roots.append(path[0])
+        
+        for parent, child in pairwise(path):
+            siblings = children.setdefault(parent, [])
+            if child not in children:
+                children[child] = []
+                siblings.append(child)
+            elif child not in siblings:
+                siblings.append(child)
+    
+    return {
+        "roots": roots,
+        "children": {k: v for k, v in children.items() if v}
+    }
+
+
 @frappe.whitelist()
-def create_test_data(project_name="TEST-PROJECT", doc_count=50):
-    """Создать тестовые данные для проверки производительности."""
-    import random
-    from frappe.utils import today
+def get_project_document_view(project, limit=100, **filters):
+    """
+    Данные страницы Project Documents одним вызовом.
     
-    # Создать проект если не существует
-    if not frappe.db.exists("Project", project_name):
-        project = frappe.get_doc({
-            "doctype": "Project",
-            "project_name": project_name,
-            "status": "Open"
-        })
-        project.insert(ignore_permissions=True)
-        frappe.db.commit()
-    
-    # Получить FST для уровней
-    fst_roots = frappe.get_all(
-        "Folder Structure Template",
-        filters={"parent_folder_structure_template": ["is", "not set"]},
-        fields=["name"],
-        limit=3
-    )
+    Вместо пары overview + tree (tree повторно вызывал overview): строки
+    таблицы — одна страница get_project_document_overview (с теми же
+    фильтрами, сортировкой и cursor), дерево — только структура папок
+    проекта; документы папок дерево загружает через get_folder_children.
+    
+    Args:
+        project: str - имя проекта
+        limit: размер страницы таблицы
+        **filters: параметры get_project_document_overview (фильтры, sort_by, sort_order, cursor)
+    
+    Returns:
+        dict: {project, documents, total, next_cursor, project_total,
+               tree: {roots, children},
+               folder_names, employee_names}
+    """
+    if not frappe.has_permission("Document", "read"):
+        frappe.throw(_("Insufficient permissions"), frappe.PermissionError)
+    
+    if not project:
+        frappe.throw(_("Project parameter is required"))
+    
+    filters.pop("cmd", None)
     
-    fst_children = frappe.get_all(
-        "Folder Structure Template",
-        filters={"parent_folder_structure_template": ["is", "set"]},
-        fields=["name", "parent_folder_structure_template"],
-        limit=10
+    return cached_project_view(
+        "view", project, dict(filters, limit=limit),
+        lambda: build_project_document_view(project, limit, filters)
     )
+
+
+def build_project_document_view(project, limit, filters):
+    """Ответ get_project_document_view без кэша"""
+    filters = dict(filters)
+    sort_by = filters.pop("sort_by", None)
+    sort_order = filters.pop("sort_order", None)
+    cursor = filters.pop("cursor", None)
+    
+    page = query_project_document_overview(project, filters, sort_by, sort_order, limit or 100, cursor)
+    
+    # Индекс дерева: различные пути папок (и ответственные) без строк документов
+    rows = frappe.db.sql("""
+        SELECT level_1, level_2, level_3, level_4, level_5,
+            responsible_employee, COUNT(*) AS documents
+        FROM `tabDocument`
+        WHERE project = %(project)s
+        GROUP BY level_1, level_2, level_3, level_4, level_5, responsible_employee
+    """, {"project": project}, as_dict=True)
+    
+    folder_names, employee_names = get_folder_and_employee_names(rows)
+    tree = build_tree_index(rows)
+    if "_root" in tree["roots"]:
+        folder_names["_root"] = "(Без папки)"
     
-    if not fst_roots:
-        return {"error": "No Folder Structure Templates found"}
+    return {
+        "project": project,
+        "documents": page["documents"],
+        "total": page["total"],
+        "next_cursor": page["next_cursor"],
+        "project_total": sum(row.documents for row in rows),
+        "tree": tree,
+        "folder_names": folder_names,
+        "employee_names": employee_names
+    }
+
+
+# =============================================================================
+# МЕТОД 4: ROLLUP ПО ПОДДЕРЕВЬЯМ ПАПОК (nested set lft/rgt)
+# =============================================================================
+
+# Папка документа — последний заполненный уровень цепочки level_1 → level_5
+# (как в дереве: уровни после первого пустого не учитываются)
+DOCUMENT_LEAF_FOLDER_SQL = """
+    CASE
+        WHEN IFNULL(level_1, '') = '' THEN NULL
+        WHEN IFNULL(level_2, '') = '' THEN level_1
+        WHEN IFNULL(level_3, '') = '' THEN level_2
+        WHEN IFNULL(level_4, '') = '' THEN level_3
+        WHEN IFNULL(level_5, '') = '' THEN level_4
+        ELSE level_5
+    END
+"""
+
+
+def query_project_folder_rollup(project):
+    """
+    Агрегаты по поддеревьям папок проекта одним SQL запросом.
+    
+    1. agg: документы проекта сгруппированы по (папка документа, статус)
+    2. Каждая группа присоединяется ко всем предкам своей папки по
+       интервалам nested set (anc.lft <= leaf.lft AND anc.rgt >= leaf.rgt)
+    3. GROUP BY (предок, статус)
     
-    statuses = ["missing", "partial", "requested", "in_progress", "ready_for_review", "approved"]
-    created_docs = []
+    Returns:
+        list: строки {folder, readiness_status, documents, files, expected_files,
+              missing_files, overdue}; folder = '_root' (без папки) или '_total'
+    """
+    sums = """
+        SUM(agg.documents) AS documents,
+        SUM(agg.files) AS files,
+        SUM(agg.expected_files) AS expected_files,
+        SUM(agg.missing_files) AS missing_files,
+        SUM(agg.overdue) AS overdue
+    """
     
-    for i in range(int(doc_count)):
-        # Выбираем level_1 и опционально level_2
-        level_1 = random.choice(fst_roots).name
-        level_2 = None
+    return frappe.db.sql(f"""
+        WITH agg AS (
+            SELECT
+                {DOCUMENT_LEAF_FOLDER_SQL} AS leaf,
+                readiness_status,
+                COUNT(*) AS documents,
+                SUM(IFNULL(files_count, 0)) AS files,
+                SUM(IFNULL(expected_files, 0)) AS expected_files,
+                SUM(GREATEST(IFNULL(expected_files, 0) - IFNULL(files_count, 0), 0)) AS missing_files,
+                SUM(overdue) AS overdue
+            FROM `tabDocument`
+            WHERE project = %(project)s
+            GROUP BY leaf, readiness_status
+        )
+        SELECT anc.name AS folder, agg.readiness_status, {sums}
+        FROM agg
+        INNER JOIN `tabFolder Structure Template` leaf ON leaf.name = agg.leaf
+        INNER JOIN `tabFolder Structure Template` anc
+            ON anc.lft <= leaf.lft AND anc.rgt >= leaf.rgt
+        GROUP BY anc.name, agg.readiness_status
         
-        # 70% документов имеют level_2
-        matching_children = [f for f in fst_children if f.parent_folder_structure_template == level_1]
-        if matching_children and random.random() > 0.3:
-            level_2 = random.choice(matching_children).name
+        UNION ALL
         
-        doc = frappe.get_doc({
-            "doctype": "Document",
-            "project": project_name,
-            "level_1": level_1,
-            "level_2": level_2,
-            "readiness_status": random.choice(statuses),
-            "start_date": today(),
-            "planned_days": random.randint(5, 30),
-            "expected_files": random.randint(1, 5)
-        })
-        doc.insert(ignore_permissions=True)
+        SELECT '_root' AS folder, agg.readiness_status, {sums}
+        FROM agg
+        WHERE agg.leaf IS NULL
+        GROUP BY agg.readiness_status
         
-        # Добавить файлы (1-3)
-        file_count = random.randint(1, 3)
-        for j in range(file_count):
-            doc.append("files", {
-                "file_name": f"test_file_{i}_{j}.pdf",
-                "file_url": f"https://example.com/files/{doc.name}/file_{j}.pdf",
-                "file_synced": 0
-            })
+        UNION ALL
         
-        doc.save(ignore_permissions=True)
-        created_docs.append(doc.name)
+        SELECT '_total' AS folder, agg.readiness_status, {sums}
+        FROM agg
+        GROUP BY agg.readiness_status
+    """, {"project": project}, as_dict=True)
+
+
+def build_project_folder_rollup(project):
+    """Ответ get_project_folder_rollup без кэша"""
+    folders = {}
+    
+    # Строк не больше (папок × статусов) — свёртка статусов в Python
+    for row in query_project_folder_rollup(project):
+        stats = folders.setdefault(row.folder, {
+            "documents": 0, "files": 0, "expected_files": 0,
+            "missing_files": 0, "overdue": 0, "statuses": {}
+        })
+        for field in ("documents", "files", "expected_files", "missing_files", "overdue"):
+            stats[field] += frappe.utils.cint(row[field])
+        status = row.readiness_status or ""
+        stats["statuses"][status] = stats["statuses"].get(status, 0) + frappe.utils.cint(row.documents)
+    
+    totals = folders.pop("_total", None) or {
+        "documents": 0, "files": 0, "expected_files": 0,
+        "missing_files": 0, "overdue": 0, "statuses": {}
+    }
     
-    frappe.db.commit()
+    return {"project": project, "folders": folders, "totals": totals}
+
+
+@frappe.whitelist()
+def get_project_folder_rollup(project):
+    """
+    Агрегаты по каждой папке проекта с учётом всего поддерева
+    (Folder Structure Template — nested set lft/rgt).
+    
+    Args:
+        project: str - имя проекта
+    
+    Returns:
+        dict: {
+            "project": "PROJ-0001",
+            "folders": {
+                "FST-0001": {
+                    "documents": 120, "files": 310,
+                    "expected_files": 360, "missing_files": 55,
+                    "overdue": 7,
+                    "statuses": {"approved": 40, "missing": 20, ...}
+                },
+                "_root": {...}                   # документы без папки
+            },
+            "totals": {...}                      # весь проект
+        }
+    """
+    if not frappe.has_permission("Document", "read"):
+        frappe.throw(_("Insufficient permissions"), frappe.PermissionError)
+    
+    if not project:
+        frappe.throw(_("Project parameter is required"))
+    
+    return get_cached_folder_rollup(project)
+
+
+def get_cached_folder_rollup(project):
+    return cached_project_view("rollup", project, None, lambda: build_project_folder_rollup(project))
+
+
+# =============================================================================
+# МЕТОД 5: ДОЧЕРНИЕ ПАПКИ И ДОКУМЕНТЫ ПАПКИ (ленивое дерево)
+# =============================================================================
+
+FOLDER_DOCUMENT_FIELDS = ["name", "readiness_status", "overdue", "files_count", "expected_files"]
+
+
+def get_child_folder_ids(project, parent_fst, rollup_folders):
+    """
+    Дочерние папки parent_fst, в поддереве которых есть документы проекта
+    (корень: папки level_1 и "_root"), в порядке дерева FST (lft).
+    """
+    if parent_fst == "_root":
+        return []
+    
+    if parent_fst:
+        folder_ids = frappe.db.sql_list("""
+            SELECT name
+            FROM `tabFolder Structure Template`
+            WHERE parent_folder_structure_template = %(parent)s
+            ORDER BY lft
+        """, {"parent": parent_fst})
+        return [fst for fst in folder_ids if fst in rollup_folders]
+    
+    folder_ids = frappe.db.sql_list("""
+        SELECT fst.name
+        FROM `tabFolder Structure Template` fst
+        WHERE fst.name IN (
+            SELECT DISTINCT level_1 FROM `tabDocument`
+            WHERE project = %(project)s AND IFNULL(level_1, '') != ''
+        )
+        ORDER BY fst.lft
+    """, {"project": project})
+    
+    if "_root" in rollup_folders:
+        folder_ids.append("_root")
+    
+    return folder_ids
+
+
+def build_folder_children(project, parent_fst, limit, cursor):
+    """Ответ get_folder_children без кэша"""
+    from company_documents.nextcloud_sync import get_fst_folder_names
+    
+    rollup_folders = get_cached_folder_rollup(project)["folders"]
+    fst_names = get_fst_folder_names()
+    
+    folders = []
+    for fst in get_child_folder_ids(project, parent_fst, rollup_folders):
+        stats = rollup_folders[fst]
+        folders.append({
+            "name": fst,
+            "folder_name": "(Без папки)" if fst == "_root" else fst_names.get(fst, fst),
+            "documents": stats["documents"],
+            "files": stats["files"],
+            "expected_files": stats["expected_files"],
+            "overdue": stats["overdue"],
+            "statuses": stats["statuses"]
+        })
+    
+    result = {
+        "project": project,
+        "parent_fst": parent_fst or None,
+        "folders": folders,
+        "documents": [],
+        "next_cursor": None
+    }
+    
+    # В корне документов нет: документы без папки — в папке "_root"
+    if not parent_fst:
+        return result
+    
+    # Документы непосредственно в папке (последний заполненный уровень = parent_fst)
+    values = {"project": project, "parent": parent_fst}
+    conditions = ["project = %(project)s"]
+    if parent_fst == "_root":
+        conditions.append(f"({DOCUMENT_LEAF_FOLDER_SQL}) IS NULL")
+    else:
+        conditions.append(f"({DOCUMENT_LEAF_FOLDER_SQL}) = %(parent)s")
+    
+    if cursor:
+        values["cursor_name"] = _decode_cursor(cursor)[1]
+        conditions.append("name > %(cursor_name)s")
+    
+    page_size = min(frappe.utils.cint(limit) or OVERVIEW_MAX_PAGE_SIZE, OVERVIEW_MAX_PAGE_SIZE)
+    
+    documents = frappe.db.sql(f"""
+        SELECT {", ".join(f"`{field}`" for field in FOLDER_DOCUMENT_FIELDS)}
+        FROM `tabDocument`
+        WHERE {" AND ".join(conditions)}
+        ORDER BY name
+        LIMIT {page_size + 1}
+    """, values, as_dict=True)
+    
+    if len(documents) > page_size:
+        documents = documents[:page_size]
+        result["next_cursor"] = _encode_cursor(None, documents[-1].name)
+    
+    result["documents"] = documents
+    return result
+
+
+@frappe.whitelist()
+def get_folder_children(project, parent_fst=None, limit=100, cursor=None):
+    """
+    Один уровень дерева проекта: дочерние папки со счётчиками по поддереву
+    и документы, лежащие непосредственно в папке (страницами).
+    
+    Args:
+        project: str - имя проекта
+        parent_fst: папка (Folder Structure Template); пусто — корень проекта,
+                    "_root" — документы без папки
+        limit: размер страницы документов (максимум 500)
+        cursor: next_cursor предыдущего ответа (следующая страница документов)
+    
+    Returns:
+        dict: {
+            "project": "PROJ-0001",
+            "parent_fst": "FST-0001",
+            "folders": [
+                {"name": "FST-0004", "folder_name": "Architettonico",
+                 "documents": 42, "files": 80, "expected_files": 90,
+                 "overdue": 3, "statuses": {"approved": 10, ...}}
+            ],
+            "documents": [
+                {"name": "DOC-2025-00001", "readiness_status": "approved",
+                 "overdue": 0, "files_count": 2, "expected_files": 2}
+            ],
+            "next_cursor": "..."                 # None — последняя страница
+        }
+    """
+    if not frappe.has_permission("Document", "read"):
+        frappe.throw(_("Insufficient permissions"), frappe.PermissionError)
+    
+    if not project:
+        frappe.throw(_("Project parameter is required"))
+    
+    return cached_project_view(
+        "children", project, {"parent_fst": parent_fst, "limit": limit, "cursor": cursor},
+        lambda: build_folder_children(project, parent_fst, limit, cursor)
+    )
+
+
+# =============================================================================
+# УТИЛИТЫ ДЛЯ ТЕСТИРОВАНИЯ
+# =============================================================================
+
+@frappe.whitelist()
+def create_test_data(project_name="TEST-PROJECT", doc_count=50):
+    """
+    Создать тестовые данные для проверки производительности.
+    
+    Документы пишутся пакетным INSERT (bulk.generate_documents) без хуков
+    validate / on_update и без синхронизации с NextCloud; пути папок — из
+    всего дерева Folder Structure Template.
+    """
+    from company_documents.bulk import generate_documents
+    
+    frappe.only_for("System Manager")
+    result = generate_documents(project_name, doc_count)
     
     return {
         "project": project_name,
-        "documents_created": len(created_docs),
-        "document_names": created_docs[:5]
+        "documents_created": result["documents"],
+        "document_names": result["document_names"]
     }
 
 
 @frappe.whitelist()
 def cleanup_test_data(project_name="TEST-PROJECT"):
-    """Удалить тестовые данные."""
-    docs = frappe.get_all("Document", filters={"project": project_name})
-    for d in docs:
-        frappe.delete_doc("Document", d.name, force=True)
+    """
+    Удалить тестовые данные: документы проекта порциями (bulk.run_project_purge,
+    без хуков on_trash) и сам проект.
+    """
+    from company_documents.bulk import run_project_purge
     
-    if frappe.db.exists("Project", project_name):
-        frappe.delete_doc("Project", project_name, force=True)
+    frappe.only_for("System Manager")
+    if not frappe.db.exists("Project", project_name):
+        return {"deleted_documents": 0, "project_deleted": None}
     
-    frappe.db.commit()
-    return {"deleted_documents": len(docs), "project_deleted": project_name}
+    result = run_project_purge(project_name, delete_project=True)
+    return {
+        "deleted_documents": result["documents"],
+        "project_deleted": project_name if result["project_deleted"] else None
+    }
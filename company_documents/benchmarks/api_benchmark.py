@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк API страницы Project Documents на синтетических проектах.
+
+Проекты BENCH-1K / BENCH-10K / BENCH-100K (1–5 файлов на документ, пути
+папок — из реального дерева Folder Structure Template) создаются один раз
+и переиспользуются. Для каждого метода api измеряются:
+
+    time_ms        — время (медиана по repeat запускам)
+    queries        — число SQL запросов
+    rows_returned  — строк вернули запросы
+    rows_read      — строк прочитал движок (Handler_read_* сессии)
+    response_bytes — размер JSON ответа
+
+cold — вычисление без кэша (build_* / query_*), warm — whitelisted метод
+с прогретым кэшем view_cache.
+
+Запуск:
+    bench --site <site> execute company_documents.benchmarks.api_benchmark.run_api_benchmark
+    bench --site <site> execute company_documents.benchmarks.api_benchmark.run_api_benchmark --kwargs "{'sizes': '1k,10k,100k'}"
+
+Сравнение двух прогонов (например, до и после коммита):
+    bench --site <site> execute company_documents.benchmarks.api_benchmark.compare_benchmarks --kwargs "{'old': '...json', 'new': '...json'}"
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import time
+
+import frappe
+
+from company_documents.benchmarks.utils import capture_queries
+from company_documents.bulk import generate_documents
+
+BENCHMARK_SIZES = {"1k": 1000, "10k": 10000, "100k": 100000}
+BENCHMARK_PROJECT_PREFIX = "BENCH"
+
+
+# =============================================================================
+# ДАННЫЕ
+# =============================================================================
+
+
+def get_benchmark_project(label):
+	return f"{BENCHMARK_PROJECT_PREFIX}-{label.upper()}"
+
+
+def ensure_benchmark_project(label, doc_count, verbose=False):
+	"""
+	Проект с doc_count документами (недостающие создаются
+	bulk.generate_documents — пакетным INSERT без хуков Document).
+
+	Returns:
+	    str: имя проекта
+	"""
+	project = get_benchmark_project(label)
+
+	existing = frappe.db.count("Document", {"project": project})
+	if existing < doc_count:
+		result = generate_documents(project, doc_count - existing, max_files=5, seed=f"{project}:{existing}")
+		if verbose:
+			print(
+				f"{project}: +{result['documents']} документов, {result['files']} файлов, {result['elapsed_s']} с"
+			)
+
+	return project
+
+
+# =============================================================================
+# ИЗМЕРЕНИЕ
+# =============================================================================
+
+
+def get_rows_read():
+	"""Сумма счётчиков Handler_read_* текущей сессии MariaDB"""
+	return sum(int(value) for _, value in frappe.db.sql("SHOW SESSION STATUS LIKE 'Handler_read%%'"))
+
+
+def measure(call, repeat=3):
+	"""
+	Выполнить call() repeat раз.
+
+	Returns:
+	    dict: {time_ms (медиана), time_ms_min, queries, rows_returned, rows_read, response_bytes}
+	"""
+	# Собственные чтения SHOW SESSION STATUS вычитаются из rows_read
+	baseline = get_rows_read()
+	overhead = get_rows_read() - baseline
+
+	timings = []
+	result = None
+
+	for _ in range(max(frappe.utils.cint(repeat), 1)):
+		rows_before = get_rows_read()
+		with capture_queries() as captured:
+			started = time.perf_counter()
+			response = call()
+			elapsed = time.perf_counter() - started
+		rows_read = get_rows_read() - rows_before - overhead
+
+		timings.append(elapsed * 1000)
+		result = {
+			"queries": len(captured["queries"]),
+			"rows_returned": captured["rows_returned"],
+			"rows_read": max(rows_read, 0),
+			"response_bytes": len(frappe.as_json(response, indent=None).encode()),
+		}
+
+	result["time_ms"] = round(statistics.median(timings), 2)
+	result["time_ms_min"] = round(min(timings), 2)
+	return result
+
+
+def get_benchmark_cases(project):
+	"""{метод: (cold, warm)} — функции без аргументов"""
+	from company_documents import api
+	from company_documents.view_cache import bump_view_version
+
+	first_level = frappe.db.get_value("Document", {"project": project, "level_1": ["is", "set"]}, "level_1")
+
+	cases = {
+		"overview_all": (
+			lambda: api.query_project_document_overview(project, {}),
+			lambda: api.get_project_document_overview(project),
+		),
+		"overview_page": (
+			lambda: api.query_project_document_overview(project, {}, limit=100),
+			lambda: api.get_project_document_overview(project, limit=100),
+		),
+		"overview_filtered_page": (
+			lambda: api.query_project_document_overview(
+				project, {"level_1": first_level, "readiness_status": ["missing", "partial"]}, limit=100
+			),
+			lambda: api.get_project_document_overview(
+				project, level_1=first_level, readiness_status='["missing", "partial"]', limit=100
+			),
+		),
+		"tree": (
+			lambda: api.build_project_document_tree(project),
+			lambda: api.get_project_document_tree(project),
+		),
+		"view": (
+			lambda: api.build_project_document_view(project, 100, {}),
+			lambda: api.get_project_document_view(project, limit=100),
+		),
+		"folder_rollup": (
+			lambda: api.build_project_folder_rollup(project),
+			lambda: api.get_project_folder_rollup(project),
+		),
+		"folder_children_root": (
+			lambda: api.build_folder_children(project, None, 100, None),
+			lambda: api.get_folder_children(project),
+		),
+		"folder_children_level_1": (
+			lambda: api.build_folder_children(project, first_level, 100, None),
+			lambda: api.get_folder_children(project, first_level),
+		),
+	}
+
+	# Сброс кэша проекта: warm-замер начинается с прогрева
+	bump_view_version(project)
+	frappe.db.commit()
+
+	return cases
+
+
+def get_app_commit():
+	"""Текущий коммит приложения (для сравнения прогонов)"""
+	try:
+		return (
+			subprocess.check_output(
+				["git", "rev-parse", "--short", "HEAD"],
+				cwd=frappe.get_app_path("company_documents"),
+				stderr=subprocess.DEVNULL,
+			)
+			.decode()
+			.strip()
+		)
+	except Exception:
+		return None
+
+
+def run_api_benchmark(sizes="1k,10k", repeat=3, output=None, verbose=True):
+	"""
+	Создать (при необходимости) проекты нужных размеров и замерить методы api.
+
+	Args:
+	    sizes: размеры через запятую из BENCHMARK_SIZES (1k, 10k, 100k)
+	    repeat: запусков каждого метода
+	    output: путь JSON (по умолчанию <site>/benchmarks/api-<commit>-<время>.json)
+
+	Returns:
+	    str: путь к файлу результатов
+	"""
+	labels = (
+		[s.strip().lower() for s in sizes.split(",") if s.strip()] if isinstance(sizes, str) else list(sizes)
+	)
+	unknown = [label for label in labels if label not in BENCHMARK_SIZES]
+	if unknown:
+		frappe.throw(f"Неизвестные размеры: {', '.join(unknown)}")
+
+	commit = get_app_commit()
+	report = {
+		"benchmark": "api",
+		"commit": commit,
+		"created": frappe.utils.now(),
+		"repeat": frappe.utils.cint(repeat),
+		"projects": {},
+	}
+
+	for label in labels:
+		doc_count = BENCHMARK_SIZES[label]
+		project = ensure_benchmark_project(label, doc_count, verbose)
+
+		project_report = {
+			"project": project,
+			"documents": frappe.db.count("Document", {"project": project}),
+			"files": frappe.db.sql(
+				"""
+                SELECT COUNT(*) FROM `tabDocument File` df
+                INNER JOIN `tabDocument` d ON d.name = df.parent
+                WHERE d.project = %s
+            """,
+				project,
+			)[0][0],
+			"endpoints": {},
+		}
+
+		for endpoint, (cold, warm) in get_benchmark_cases(project).items():
+			# Прогрев: первый вызов вычисляет и кэширует ответ
+			warm()
+			project_report["endpoints"][endpoint] = {
+				"cold": measure(cold, repeat),
+				"warm": measure(warm, repeat),
+			}
+
+			if verbose:
+				c = project_report["endpoints"][endpoint]["cold"]
+				w = project_report["endpoints"][endpoint]["warm"]
+				print(
+					f"{label:>5} {endpoint:<26} cold {c['time_ms']:>9.1f} ms  q={c['queries']:<3} "
+					f"rows={c['rows_read']:<8} {c['response_bytes']:>10} B  | warm {w['time_ms']:>7.1f} ms  q={w['queries']}"
+				)
+
+		report["projects"][label] = project_report
+
+	if not output:
+		folder = frappe.get_site_path("benchmarks")
+		os.makedirs(folder, exist_ok=True)
+		output = os.path.join(folder, f"api-{commit or 'nocommit'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+	with open(output, "w") as f:
+		json.dump(report, f, indent=2, default=str)
+
+	if verbose:
+		print(f"Результаты: {output}")
+
+	return output
+
+
+def compare_benchmarks(old, new, metric="time_ms", verbose=True):
+	"""
+	Сравнить два JSON файла run_api_benchmark по метрике.
+
+	Returns:
+	    list: [{size, endpoint, mode, old, new, change (доля)}]
+	"""
+	with open(old) as f:
+		old_report = json.load(f)
+	with open(new) as f:
+		new_report = json.load(f)
+
+	rows = []
+	for size, project in new_report["projects"].items():
+		old_project = old_report["projects"].get(size) or {}
+		for endpoint, modes in project["endpoints"].items():
+			for mode, values in modes.items():
+				old_value = (((old_project.get("endpoints") or {}).get(endpoint) or {}).get(mode) or {}).get(
+					metric
+				)
+				new_value = values.get(metric)
+				change = None
+				if old_value and new_value is not None:
+					change = round((new_value - old_value) / old_value, 3)
+				rows.append(
+					{
+						"size": size,
+						"endpoint": endpoint,
+						"mode": mode,
+						"old": old_value,
+						"new": new_value,
+						"change": change,
+					}
+				)
+
+	if verbose:
+		print(f"{metric}: {old_report.get('commit')} → {new_report.get('commit')}")
+		for row in rows:
+			change = f"{row['change']:+.1%}" if row["change"] is not None else "—"
+			print(
+				f"{row['size']:>5} {row['endpoint']:<26} {row['mode']:<5} {row['old']!s:>10} → {row['new']!s:>10}  {change}"
+			)
+
+	return rows
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка планов запросов API страницы Project Documents.
+
+Запросы перехватываются при вызове методов api без кэша, для каждого
+SELECT выполняется EXPLAIN. Проверка падает, если по tabDocument или
+tabDocument File выполняется полный просмотр таблицы (type = ALL) —
+например, если индексы install.ensure_indexes не созданы.
+В CI проверку выполняет тест tests/test_query_plans.py.
+
+Запуск:
+    bench --site <site> execute company_documents.benchmarks.query_plans.check_query_plans
+    bench --site <site> execute company_documents.benchmarks.query_plans.check_query_plans --kwargs "{'project': 'PROJ-0001'}"
+"""
+
+import re
+
+import frappe
+
+from company_documents.benchmarks.utils import capture_queries, is_select_query
+
+CHECKED_TABLES = ("tabDocument", "tabDocument File")
+
+# На маленьких таблицах оптимизатор выбирает полный просмотр и при наличии
+# индекса — такие таблицы не проверяются
+MIN_TABLE_ROWS = 1000
+
+
+def get_endpoint_queries(project):
+	"""SELECT-запросы методов api (без кэша) для проекта: {метка: [(query, values)]}"""
+	from company_documents import api
+
+	first_level = frappe.db.get_value("Document", {"project": project, "level_1": ["is", "set"]}, "level_1")
+	page = api.query_project_document_overview(project, {}, limit=50)
+
+	cases = {
+		"overview": lambda: api.query_project_document_overview(project, {}),
+		"overview_page": lambda: api.query_project_document_overview(project, {}, limit=50),
+		"overview_next_page": lambda: (
+			api.query_project_document_overview(project, {}, limit=50, cursor=page["next_cursor"])
+			if page["next_cursor"]
+			else None
+		),
+		"overview_level_1": lambda: api.query_project_document_overview(
+			project, {"level_1": first_level}, limit=50
+		),
+		"overview_status": lambda: api.query_project_document_overview(
+			project, {"readiness_status": ["missing", "partial"]}, limit=50
+		),
+		"overview_overdue": lambda: api.query_project_document_overview(project, {"overdue": 1}, limit=50),
+		"tree": lambda: api.build_project_document_tree(project),
+		"view": lambda: api.build_project_document_view(project, 100, {}),
+		"rollup": lambda: api.build_project_folder_rollup(project),
+		"folder_children_root": lambda: api.build_folder_children(project, None, 100, None),
+		"folder_children_level_1": lambda: api.build_folder_children(project, first_level, 100, None),
+	}
+
+	result = {}
+	for label, call in cases.items():
+		with capture_queries() as captured:
+			call()
+		result[label] = [(query, values) for query, values in captured["queries"] if is_select_query(query)]
+	return result
+
+
+def explain(query, values):
+	"""EXPLAIN запроса: список строк плана (dict)"""
+	return frappe.db.sql(f"EXPLAIN {query}", values, as_dict=True)
+
+
+def get_table_rows(table):
+	return (
+		frappe.db.sql(
+			"SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+			table,
+		)[0][0]
+		or 0
+	)
+
+
+def check_query_plans(project=None, min_table_rows=MIN_TABLE_ROWS, verbose=True):
+	"""
+	EXPLAIN для каждого запроса методов api; исключение, если есть полный
+	просмотр tabDocument / tabDocument File.
+
+	Args:
+	    project: проект (по умолчанию — проект с наибольшим числом документов)
+	    min_table_rows: таблицы меньшего размера не проверяются
+
+	Returns:
+	    list: [{endpoint, table, type, key, rows, query}] — строки плана проверяемых таблиц
+	"""
+	if not project:
+		project = frappe.db.sql("""
+            SELECT project FROM `tabDocument`
+            GROUP BY project ORDER BY COUNT(*) DESC LIMIT 1
+        """)
+		project = project[0][0] if project else None
+
+	if not project:
+		frappe.throw("Нет документов для проверки планов запросов")
+
+	checked = {table: get_table_rows(table) >= frappe.utils.cint(min_table_rows) for table in CHECKED_TABLES}
+	plans = []
+	full_scans = []
+
+	for endpoint, queries in get_endpoint_queries(project).items():
+		for query, values in queries:
+			for row in explain(query, values):
+				table = row.get("table")
+				if table not in CHECKED_TABLES:
+					continue
+
+				plan = {
+					"endpoint": endpoint,
+					"table": table,
+					"type": row.get("type"),
+					"key": row.get("key"),
+					"rows": row.get("rows"),
+					"query": re.sub(r"\s+", " ", query).strip()[:200],
+				}
+				plans.append(plan)
+
+				if plan["type"] == "ALL" and checked[table]:
+					full_scans.append(plan)
+
+	if verbose:
+		for plan in plans:
+			marker = "FULL SCAN" if plan in full_scans else "ok"
+			print(
+				f"[{marker}] {plan['endpoint']}: {plan['table']} type={plan['type']} key={plan['key']} rows={plan['rows']}"
+			)
+
+	if full_scans:
+		raise AssertionError(
+			"Полный просмотр таблицы в запросах API: "
+			+ "; ".join(f"{p['endpoint']} → {p['table']}" for p in full_scans)
+		)
+
+	return plans
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк синхронизации с NextCloud на локальном WebDAV сервере (webdav_stub).
+
+Документы проекта BENCH-SYNC сохраняются обычным doc.insert() / doc.save(),
+то есть через все хуки on_update. Конфигурация NextCloud подменяется на
+сервер-заглушку только в текущем процессе (frappe.flags), настройки
+NextCloud Sync Settings не меняются. Синхронный режим (async_sync = 0).
+
+Сценарии:
+    upload — создать N документов с M файлами
+    move   — перенести документы в другую папку (level_1..5)
+    delete — удалить файлы из документов
+
+Метрики сценария: HTTP запросов на документ (по методам), отправлено байт,
+задержка сохранения документа (p50 / p95 / max), ошибки.
+
+Запуск:
+    bench --site <site> execute company_documents.benchmarks.sync_benchmark.run_sync_benchmark
+    bench --site <site> execute company_documents.benchmarks.sync_benchmark.run_sync_benchmark \\
+        --kwargs "{'documents': 50, 'files_per_doc': 3, 'file_kb': 512, 'latency_ms': 20, 'error_rate': 0.01}"
+"""
+
+import json
+import os
+import time
+from unittest.mock import patch
+
+import frappe
+
+from company_documents.benchmarks.api_benchmark import get_app_commit
+from company_documents.benchmarks.webdav_stub import start_webdav_stub
+from company_documents.bulk import get_fst_paths
+from company_documents.sync_metrics import percentile
+
+SYNC_BENCHMARK_PROJECT = "BENCH-SYNC"
+SYNC_SCENARIOS = ("upload", "move", "delete")
+
+
+def ensure_sync_project():
+	if not frappe.db.exists("Project", SYNC_BENCHMARK_PROJECT):
+		frappe.get_doc(
+			{"doctype": "Project", "project_name": SYNC_BENCHMARK_PROJECT, "status": "Open"}
+		).insert(ignore_permissions=True)
+		frappe.db.commit()
+	return SYNC_BENCHMARK_PROJECT
+
+
+def create_local_files(count, file_kb, prefix):
+	"""Случайные файлы в private/files: [(file_url, file_name, путь)]"""
+	folder = frappe.get_site_path("private", "files")
+	os.makedirs(folder, exist_ok=True)
+
+	files = []
+	for i in range(count):
+		file_name = f"{prefix}_{i}.bin"
+		path = os.path.join(folder, file_name)
+		with open(path, "wb") as f:
+			f.write(os.urandom(int(file_kb) * 1024))
+		files.append((f"/private/files/{file_name}", file_name, path))
+	return files
+
+
+def run_scenario(name, docs, action, server):
+	"""
+	Выполнить action(doc) для каждого документа, замеряя время и запросы к серверу.
+
+	Returns:
+	    dict: {documents, total_s, latency_ms: {p50, p95, max}, requests, requests_per_doc,
+	           by_method, bytes_sent, bytes_sent_per_doc, errors}
+	"""
+	server.reset_stats()
+	latencies = []
+	started = time.perf_counter()
+
+	for doc in docs:
+		doc_started = time.perf_counter()
+		action(doc)
+		frappe.db.commit()
+		latencies.append((time.perf_counter() - doc_started) * 1000)
+
+	total = time.perf_counter() - started
+	stats = server.get_stats()
+	count = len(docs) or 1
+
+	return {
+		"scenario": name,
+		"documents": len(docs),
+		"total_s": round(total, 3),
+		"latency_ms": {
+			"p50": round(percentile(latencies, 50) or 0, 1),
+			"p95": round(percentile(latencies, 95) or 0, 1),
+			"max": round(max(latencies or [0]), 1),
+		},
+		"requests": stats["requests"],
+		"requests_per_doc": round(stats["requests"] / count, 2),
+		"by_method": stats["by_method"],
+		"by_status": stats["by_status"],
+		"bytes_sent": stats["bytes_in"],
+		"bytes_sent_per_doc": round(stats["bytes_in"] / count),
+		"errors": sum(n for status, n in stats["by_status"].items() if status.startswith("5")),
+		"injected_errors": stats["injected_errors"],
+	}
+
+
+def run_sync_benchmark(
+	documents=20,
+	files_per_doc=3,
+	file_kb=256,
+	latency_ms=0,
+	jitter_ms=0,
+	error_rate=0.0,
+	scenarios="upload,move,delete",
+	output=None,
+	verbose=True,
+):
+	"""
+	Запустить WebDAV заглушку и сценарии синхронизации.
+
+	Args:
+	    documents: число документов (N)
+	    files_per_doc: файлов на документ (M)
+	    file_kb: размер файла, КБ
+	    latency_ms / jitter_ms: задержка каждого ответа сервера
+	    error_rate: доля ответов 503 (0..1)
+	    scenarios: сценарии через запятую (upload, move, delete); move и delete
+	               выполняются над документами сценария upload
+	    output: путь JSON (по умолчанию <site>/benchmarks/sync-<commit>-<время>.json)
+
+	Returns:
+	    str: путь к файлу результатов
+	"""
+	scenarios = (
+		[s.strip() for s in scenarios.split(",") if s.strip()]
+		if isinstance(scenarios, str)
+		else list(scenarios)
+	)
+	unknown = [s for s in scenarios if s not in SYNC_SCENARIOS]
+	if unknown:
+		frappe.throw(f"Неизвестные сценарии: {', '.join(unknown)}")
+
+	paths = get_fst_paths()
+	if len(paths) < 2:
+		frappe.throw("Для бенчмарка нужны минимум две папки Folder Structure Template")
+
+	source_levels = (paths[0] + [None] * 5)[:5]
+	target_levels = (paths[-1] + [None] * 5)[:5]
+
+	documents = frappe.utils.cint(documents)
+	files_per_doc = frappe.utils.cint(files_per_doc)
+	project = ensure_sync_project()
+	prefix = f"bench_sync_{frappe.generate_hash(length=6)}"
+
+	server = start_webdav_stub(
+		latency_ms=float(latency_ms), jitter_ms=float(jitter_ms), error_rate=float(error_rate)
+	)
+	# Заглушка вместо NextCloud Sync Settings только в этом процессе
+	config_patch = patch(
+		"company_documents.nextcloud_sync.get_nextcloud_config", return_value=server.nextcloud_config()
+	)
+	config_patch.start()
+	frappe.flags.mute_messages = True
+
+	local_files = create_local_files(documents * files_per_doc, file_kb, prefix)
+	docs = []
+	results = []
+
+	try:
+
+		def create(doc):
+			doc.insert(ignore_permissions=True)
+
+		def move(doc):
+			doc.reload()
+			for i, level in enumerate(target_levels, start=1):
+				doc.set(f"level_{i}", level)
+			doc.save(ignore_permissions=True)
+
+		def delete(doc):
+			doc.reload()
+			doc.set("files", [])
+			doc.save(ignore_permissions=True)
+
+		for i in range(documents):
+			doc_files = local_files[i * files_per_doc : (i + 1) * files_per_doc]
+			doc = frappe.get_doc(
+				{
+					"doctype": "Document",
+					"project": project,
+					"readiness_status": "in_progress",
+					"expected_files": files_per_doc,
+					"files": [
+						{"file": file_url, "file_name": file_name, "file_synced": 0}
+						for file_url, file_name, _ in doc_files
+					],
+				}
+			)
+			for level_index, level in enumerate(source_levels, start=1):
+				doc.set(f"level_{level_index}", level)
+			docs.append(doc)
+
+		# Без upload документы создаются до замеров
+		if "upload" not in scenarios:
+			for doc in docs:
+				create(doc)
+			frappe.db.commit()
+
+		actions = {"upload": create, "move": move, "delete": delete}
+		for scenario in SYNC_SCENARIOS:
+			if scenario not in scenarios:
+				continue
+
+			result = run_scenario(scenario, docs, actions[scenario], server)
+			result["remote_files"] = server.count_files(f"Projects/{project}")
+			results.append(result)
+
+			if verbose:
+				print(
+					f"{scenario:<7} docs={result['documents']:<4} req/doc={result['requests_per_doc']:<6} "
+					f"bytes/doc={result['bytes_sent_per_doc']:<10} p50={result['latency_ms']['p50']} ms "
+					f"p95={result['latency_ms']['p95']} ms errors={result['errors']} remote_files={result['remote_files']}"
+				)
+				print(f"        {result['by_method']}")
+
+	finally:
+		config_patch.stop()
+		frappe.flags.mute_messages = False
+		server.stop()
+
+		for doc in docs:
+			if doc.name and frappe.db.exists("Document", doc.name):
+				frappe.delete_doc("Document", doc.name, ignore_permissions=True, force=True)
+		frappe.db.commit()
+
+		for _, _, path in local_files:
+			if os.path.exists(path):
+				os.remove(path)
+
+	commit = get_app_commit()
+	report = {
+		"benchmark": "sync",
+		"commit": commit,
+		"created": frappe.utils.now(),
+		"params": {
+			"documents": documents,
+			"files_per_doc": files_per_doc,
+			"file_kb": frappe.utils.cint(file_kb),
+			"latency_ms": float(latency_ms),
+			"jitter_ms": float(jitter_ms),
+			"error_rate": float(error_rate),
+		},
+		"scenarios": results,
+	}
+
+	if not output:
+		folder = frappe.get_site_path("benchmarks")
+		os.makedirs(folder, exist_ok=True)
+		output = os.path.join(folder, f"sync-{commit or 'nocommit'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+	with open(output, "w") as f:
+		json.dump(report, f, indent=2, default=str)
+
+	if verbose:
+		print(f"Результаты: {output}")
+
+	return output
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Общие помощники бенчмарков: перехват запросов frappe.db.sql"""
+
+from contextlib import contextmanager
+
+import frappe
+
+
+def is_select_query(query):
+	"""SELECT или WITH ... SELECT"""
+	return query.lstrip().upper().startswith(("SELECT", "WITH"))
+
+
+@contextmanager
+def capture_queries():
+	"""
+	Записать запросы, выполненные через frappe.db.sql внутри блока.
+
+	Yields:
+	    dict: {queries: [(query, values)], rows_returned: строк вернули запросы}
+	"""
+	captured = {"queries": [], "rows_returned": 0}
+	original_sql = frappe.db.sql
+
+	def recording_sql(query, values=(), *args, **kwargs):
+		result = original_sql(query, values, *args, **kwargs)
+		captured["queries"].append((query, values))
+		if isinstance(result, (list, tuple)):
+			captured["rows_returned"] += len(result)
+		return result
+
+	frappe.db.sql = recording_sql
+	try:
+		yield captured
+	finally:
+		frappe.db.sql = original_sql
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+Локальный WebDAV сервер вместо NextCloud для бенчмарков синхронизации.
+
+Поддерживает пути и методы, которые использует nextcloud_sync.py:
+
+    /remote.php/dav/files/<user>/...     MKCOL, PUT, PROPFIND (Depth 0/1), MOVE, DELETE
+    /remote.php/dav/uploads/<user>/...   chunking v2: MKCOL, PUT <n>, MOVE .file
+
+Файлы хранятся в памяти; PROPFIND возвращает oc:fileid, getetag,
+getcontentlength, resourcetype и oc:checksums (из заголовка OC-Checksum).
+SEARCH не поддерживается (501) — клиенты переходят на обход PROPFIND.
+
+Задержка (latency_ms ± jitter_ms) и доля ошибок 503 (error_rate)
+настраиваются при запуске и меняются на лету.
+
+Использование:
+    server = start_webdav_stub(latency_ms=20, error_rate=0.01)
+    config = server.nextcloud_config()     # для nextcloud_sync
+    ...
+    print(server.get_stats())
+    server.stop()
+
+Без frappe, можно запустить отдельно:
+    python -m company_documents.benchmarks.webdav_stub --port 8090 --latency-ms 20
+"""
+
+import argparse
+import itertools
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlparse
+from xml.sax.saxutils import escape
+
+DAV_PREFIX = "/remote.php/dav"
+STUB_USER = "bench"
+STUB_PASSWORD = "bench"
+
+
+class WebDAVStore:
+	"""Дерево файлов в памяти: {путь без завершающего '/': узел}"""
+
+	def __init__(self, user):
+		self.lock = threading.Lock()
+		self.nodes = {}
+		self.file_ids = itertools.count(1000)
+		for root in (
+			DAV_PREFIX,
+			f"{DAV_PREFIX}/files",
+			f"{DAV_PREFIX}/uploads",
+			f"{DAV_PREFIX}/files/{user}",
+			f"{DAV_PREFIX}/uploads/{user}",
+		):
+			self.nodes[root] = self.new_node(is_dir=True)
+
+	def new_node(self, is_dir=False, data=b"", checksum=None):
+		file_id = next(self.file_ids)
+		return {
+			"is_dir": is_dir,
+			"data": data,
+			"file_id": str(file_id),
+			"etag": f"{file_id:x}{int(time.time() * 1000):x}",
+			"checksum": checksum,
+		}
+
+	@staticmethod
+	def parent(path):
+		return path.rsplit("/", 1)[0]
+
+	def children(self, path):
+		prefix = path + "/"
+		return [p for p in self.nodes if p.startswith(prefix) and "/" not in p[len(prefix) :]]
+
+	def subtree(self, path):
+		prefix = path + "/"
+		return [p for p in self.nodes if p == path or p.startswith(prefix)]
+
+
+class WebDAVStubHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	server_version = "WebDAVStub/1.0"
+
+	# -------------------------------------------------------------------------
+	# Обработка запроса
+	# -------------------------------------------------------------------------
+
+	def log_message(self, format, *args):
+		pass
+
+	def handle_one_request(self):
+		"""Клиент, закрывший соединение, не выводит traceback в консоль"""
+		try:
+			super().handle_one_request()
+		except ConnectionError:
+			self.close_connection = True
+
+	def _path(self):
+		return unquote(urlparse(self.path).path).rstrip("/")
+
+	def _read_body(self):
+		if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+			body = b""
+			while True:
+				size = int(self.rfile.readline().strip() or b"0", 16)
+				if not size:
+					self.rfile.readline()
+					break
+				body += self.rfile.read(size)
+				self.rfile.readline()
+			return body
+		length = int(self.headers.get("Content-Length") or 0)
+		return self.rfile.read(length) if length else b""
+
+	def _send(self, status, body=b"", content_type="text/plain; charset=utf-8"):
+		if isinstance(body, str):
+			body = body.encode("utf-8")
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		if self.command != "HEAD":
+			self.wfile.write(body)
+		self.server.record(self.command, status, self.bytes_in, len(body))
+
+	def _dispatch(self):
+		body = self._read_body()
+		self.bytes_in = len(body)
+		server = self.server
+
+		if server.latency_ms or server.jitter_ms:
+			delay = server.latency_ms + random.uniform(-server.jitter_ms, server.jitter_ms)
+			time.sleep(max(delay, 0) / 1000)
+
+		if server.error_rate and random.random() < server.error_rate:
+			with server.stats_lock:
+				server.stats["injected_errors"] += 1
+			return self._send(503, "Injected error")
+
+		handler = getattr(self, f"dav_{self.command}", None)
+		if handler is None:
+			return self._send(501, "Not implemented")
+
+		with server.store.lock:
+			return handler(self._path(), body)
+
+	do_MKCOL = do_PUT = do_PROPFIND = do_MOVE = do_DELETE = do_SEARCH = do_GET = do_HEAD = _dispatch
+
+	# -------------------------------------------------------------------------
+	# Методы WebDAV (вызываются под store.lock)
+	# -------------------------------------------------------------------------
+
+	def dav_MKCOL(self, path, body):
+		store = self.server.store
+		if path in store.nodes:
+			return self._send(405, "Already exists")
+		if store.parent(path) not in store.nodes:
+			return self._send(409, "Parent missing")
+		store.nodes[path] = store.new_node(is_dir=True)
+		return self._send(201)
+
+	def dav_PUT(self, path, body):
+		store = self.server.store
+		parent = store.nodes.get(store.parent(path))
+		if not parent or not parent["is_dir"]:
+			return self._send(409, "Parent missing")
+
+		existing = store.nodes.get(path)
+		if existing and existing["is_dir"]:
+			return self._send(405, "Is a collection")
+
+		checksum = self.headers.get("OC-Checksum")
+		node = store.new_node(data=body, checksum=checksum)
+		if existing:
+			node["file_id"] = existing["file_id"]
+		store.nodes[path] = node
+		return self._send(204 if existing else 201)
+
+	def dav_GET(self, path, body):
+		node = self.server.store.nodes.get(path)
+		if not node or node["is_dir"]:
+			return self._send(404, "Not found")
+		return self._send(200, node["data"], "application/octet-stream")
+
+	dav_HEAD = dav_GET
+
+	def dav_DELETE(self, path, body):
+		store = self.server.store
+		if path not in store.nodes:
+			return self._send(404, "Not found")
+		for p in store.subtree(path):
+			del store.nodes[p]
+		return self._send(204)
+
+	def dav_MOVE(self, path, body):
+		store = self.server.store
+		destination = unquote(urlparse(self.headers.get("Destination", "")).path).rstrip("/")
+		overwrite = self.headers.get("Overwrite", "T").upper() != "F"
+
+		source = store.parent(path) if path.endswith("/.file") else path
+		if source not in store.nodes:
+			return self._send(404, "Not found")
+		if not destination or store.parent(destination) not in store.nodes:
+			return self._send(409, "Parent missing")
+
+		existed = destination in store.nodes
+		if existed and not overwrite:
+			return self._send(412, "Destination exists")
+
+		# Chunking v2: MOVE <upload>/.file собирает чанки в файл назначения
+		if path.endswith("/.file"):
+			upload = source
+			chunks = sorted(p for p in store.children(upload) if p.rsplit("/", 1)[-1].isdigit())
+			data = b"".join(store.nodes[p]["data"] for p in chunks)
+			node = store.new_node(data=data, checksum=self.headers.get("OC-Checksum"))
+			if existed:
+				node["file_id"] = store.nodes[destination]["file_id"]
+			for p in store.subtree(upload):
+				del store.nodes[p]
+			store.nodes[destination] = node
+			return self._send(204 if existed else 201)
+
+		if existed:
+			for p in store.subtree(destination):
+				del store.nodes[p]
+
+		for p in sorted(store.subtree(path)):
+			store.nodes[destination + p[len(path) :]] = store.nodes.pop(p)
+		return self._send(204 if existed else 201)
+
+	def dav_PROPFIND(self, path, body):
+		store = self.server.store
+		node = store.nodes.get(path)
+		if not node:
+			return self._send(404, "Not found")
+
+		paths = [path]
+		if self.headers.get("Depth", "1") != "0" and node["is_dir"]:
+			paths += sorted(store.children(path))
+
+		responses = "".join(self._propfind_response(p, store.nodes[p]) for p in paths)
+		xml = (
+			'<?xml version="1.0"?>'
+			'<d:multistatus xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns" xmlns:nc="http://nextcloud.org/ns">'
+			f"{responses}</d:multistatus>"
+		)
+		return self._send(207, xml, "application/xml; charset=utf-8")
+
+	@staticmethod
+	def _propfind_response(path, node):
+		href = quote(path) + ("/" if node["is_dir"] else "")
+		props = [
+			f"<oc:fileid>{node['file_id']}</oc:fileid>",
+			f'<d:getetag>"{node["etag"]}"</d:getetag>',
+		]
+		if node["is_dir"]:
+			props.append("<d:resourcetype><d:collection/></d:resourcetype>")
+		else:
+			props.append(f"<d:getcontentlength>{len(node['data'])}</d:getcontentlength>")
+			props.append("<d:resourcetype/>")
+			if node["checksum"]:
+				props.append(
+					f"<oc:checksums><oc:checksum>{escape(node['checksum'])}</oc:checksum></oc:checksums>"
+				)
+		return (
+			f"<d:response><d:href>{href}</d:href><d:propstat><d:prop>{''.join(props)}</d:prop>"
+			"<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>"
+		)
+
+
+class WebDAVStubServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, address, user=STUB_USER, latency_ms=0, jitter_ms=0, error_rate=0.0):
+		super().__init__(address, WebDAVStubHandler)
+		self.user = user
+		self.latency_ms = latency_ms
+		self.jitter_ms = jitter_ms
+		self.error_rate = error_rate
+		self.store = WebDAVStore(user)
+		self.stats_lock = threading.Lock()
+		self.thread = None
+		self.reset_stats()
+
+	@property
+	def url(self):
+		host, port = self.server_address[:2]
+		return f"http://{host}:{port}"
+
+	def record(self, method, status, bytes_in, bytes_out):
+		with self.stats_lock:
+			self.stats["requests"] += 1
+			self.stats["by_method"][method] = self.stats["by_method"].get(method, 0) + 1
+			self.stats["by_status"][str(status)] = self.stats["by_status"].get(str(status), 0) + 1
+			self.stats["bytes_in"] += bytes_in
+			self.stats["bytes_out"] += bytes_out
+
+	def reset_stats(self):
+		with self.stats_lock:
+			self.stats = {
+				"requests": 0,
+				"by_method": {},
+				"by_status": {},
+				"bytes_in": 0,
+				"bytes_out": 0,
+				"injected_errors": 0,
+			}
+
+	def get_stats(self):
+		with self.stats_lock:
+			return {
+				key: dict(value) if isinstance(value, dict) else value for key, value in self.stats.items()
+			}
+
+	def count_files(self, prefix=""):
+		"""Число файлов в /files/<user>/<prefix>"""
+		root = f"{DAV_PREFIX}/files/{self.user}/{prefix}".rstrip("/")
+		with self.store.lock:
+			return sum(
+				1
+				for path, node in self.store.nodes.items()
+				if not node["is_dir"] and path.startswith(root + "/")
+			)
+
+	def nextcloud_config(self, **overrides):
+		"""Конфигурация в формате nextcloud_sync.get_nextcloud_config()"""
+		config = {
+			"url": self.url,
+			"user": self.user,
+			"username": self.user,
+			"password": STUB_PASSWORD,
+			"root_path": None,
+			"webdav_url": f"{self.url}/remote.php/dav/files/{self.user}",
+			"pool_size": 10,
+			"connect_timeout": 10,
+			"timeout": 30,
+			"upload_timeout": 120,
+			"upload_concurrency": 4,
+			"chunk_size": 10,
+			"chunk_threshold": 50,
+			"async_sync": 0,
+		}
+		config.update(overrides)
+		return config
+
+	def start(self):
+		self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self.thread.start()
+		return self
+
+	def stop(self):
+		self.shutdown()
+		self.server_close()
+
+
+def start_webdav_stub(host="127.0.0.1", port=0, latency_ms=0, jitter_ms=0, error_rate=0.0, user=STUB_USER):
+	"""Запустить сервер в фоновом потоке (port=0 — свободный порт)"""
+	return WebDAVStubServer(
+		(host, port), user=user, latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate
+	).start()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Локальный WebDAV сервер вместо NextCloud")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8090)
+	parser.add_argument("--user", default=STUB_USER)
+	parser.add_argument("--latency-ms", type=float, default=0)
+	parser.add_argument("--jitter-ms", type=float, default=0)
+	parser.add_argument("--error-rate", type=float, default=0.0)
+	args = parser.parse_args()
+
+	server = WebDAVStubServer(
+		(args.host, args.port),
+		user=args.user,
+		latency_ms=args.latency_ms,
+		jitter_ms=args.jitter_ms,
+		error_rate=args.error_rate,
+	)
+	print(f"WebDAV stub: {server.url}/remote.php/dav/files/{args.user}/ (пароль: {STUB_PASSWORD})")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		server.server_close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетные операции над документами без хуков Document: генерация
+синтетических документов и удаление документов проекта.
+
+Строки tabDocument и tabDocument File пишутся frappe.db.bulk_insert
+порциями. То, что при обычном сохранении считают хуки, вычисляется здесь:
+
+    name              — следующие номера правила Document Naming Rule
+                        (DOC-YYYY-#####), счётчик правила увеличивается
+                        на размер порции
+    planned_end_date  — start_date + planned_days (как validate())
+    files_count       — число строк Document File
+    overdue           — как validate(): today > planned_end_date и статус не approved
+
+Пути level_1..level_5 берутся из всего дерева Folder Structure Template
+(nested set): документы чаще лежат в конечных папках, чем в промежуточных.
+Синхронизация с NextCloud не выполняется (file_synced = 0).
+
+Использование:
+    bench --site <site> execute company_documents.bulk.generate_documents \\
+        --kwargs "{'project': 'PERF-1M', 'doc_count': 1000000}"
+    bench --site <site> execute company_documents.bulk.run_project_purge \\
+        --kwargs "{'project': 'PERF-1M', 'delete_project': 1}"
+"""
+
+import random
+import time
+from datetime import timedelta
+
+import frappe
+from frappe.utils import getdate, now, today
+
+BULK_CHUNK_SIZE = 10000
+BULK_STATUSES = ("missing", "partial", "requested", "in_progress", "ready_for_review", "approved")
+
+# Во сколько раз конечная папка FST вероятнее промежуточной
+LEAF_FOLDER_WEIGHT = 4
+
+DOCUMENT_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"modified_by",
+	"owner",
+	"docstatus",
+	"naming_series",
+	"project",
+	"data",
+	"status",
+	"level_1",
+	"level_2",
+	"level_3",
+	"level_4",
+	"level_5",
+	"readiness_status",
+	"start_date",
+	"planned_days",
+	"planned_end_date",
+	"expected_files",
+	"files_count",
+	"overdue",
+)
+
+DOCUMENT_FILE_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"modified_by",
+	"owner",
+	"docstatus",
+	"parent",
+	"parenttype",
+	"parentfield",
+	"idx",
+	"file_name",
+	"file_url",
+	"file_synced",
+)
+
+
+def get_fst_paths():
+	"""
+	Все пути корень → папка дерева FST (до 5 уровней) по nested set:
+	[[FST-0001], [FST-0001, FST-0004], ...] в порядке lft.
+	"""
+	rows = frappe.db.sql(
+		"""
+        SELECT name, lft, rgt
+        FROM `tabFolder Structure Template`
+        ORDER BY lft
+    """,
+		as_dict=True,
+	)
+
+	paths = []
+	stack = []
+	for row in rows:
+		# Предки строки — открытые интервалы, содержащие её lft
+		while stack and stack[-1].rgt < row.lft:
+			stack.pop()
+		stack.append(row)
+
+		if len(stack) <= 5:
+			paths.append([node.name for node in stack])
+
+	return paths
+
+
+def get_path_weights(paths):
+	"""Накопленные веса путей для random.choices: конечные папки вероятнее"""
+	parents = {path[-2] for path in paths if len(path) > 1}
+
+	cum_weights = []
+	total = 0
+	for path in paths:
+		total += 1 if path[-1] in parents else LEAF_FOLDER_WEIGHT
+		cum_weights.append(total)
+	return cum_weights
+
+
+def get_document_naming_rule():
+	"""Правило нумерации Document (с наибольшим приоритетом, без условий)"""
+	rules = frappe.get_all(
+		"Document Naming Rule",
+		filters={"document_type": "Document", "disabled": 0},
+		fields=["name", "prefix", "prefix_digits"],
+		order_by="priority desc",
+	)
+
+	for rule in rules:
+		if not frappe.get_all("Document Naming Rule Condition", filters={"parent": rule.name}, limit=1):
+			return rule
+	return None
+
+
+def reserve_document_names(rule, count):
+	"""
+	Зарезервировать count номеров правила (одна блокировка строки правила).
+
+	Returns:
+	    list: [DOC-2026-00011, ...]
+	"""
+	from frappe.model.naming import parse_naming_series
+
+	counter = frappe.db.get_value("Document Naming Rule", rule.name, "counter", for_update=True) or 0
+	frappe.db.set_value("Document Naming Rule", rule.name, "counter", counter + count, update_modified=False)
+
+	prefix = parse_naming_series(rule.prefix)
+	digits = rule.prefix_digits or 5
+	return [f"{prefix}{number:0{digits}d}" for number in range(counter + 1, counter + count + 1)]
+
+
+def ensure_project(project):
+	if not frappe.db.exists("Project", project):
+		frappe.get_doc({"doctype": "Project", "project_name": project, "status": "Open"}).insert(
+			ignore_permissions=True
+		)
+		frappe.db.commit()
+
+
+def generate_documents(
+	project,
+	doc_count,
+	min_files=1,
+	max_files=3,
+	max_age_days=90,
+	chunk_size=BULK_CHUNK_SIZE,
+	seed=None,
+):
+	"""
+	Создать doc_count документов проекта пакетным INSERT (без хуков).
+
+	Args:
+	    project: проект (создаётся, если не существует)
+	    doc_count: число документов
+	    min_files / max_files: файлов на документ (случайно в диапазоне)
+	    max_age_days: start_date — от today - max_age_days до today
+	    chunk_size: документов в одной порции (INSERT + commit)
+	    seed: зерно генератора (одинаковые данные при повторном запуске)
+
+	Returns:
+	    dict: {project, documents, files, document_names (первые 5), elapsed_s}
+	"""
+	started = time.perf_counter()
+	doc_count = frappe.utils.cint(doc_count)
+	chunk_size = max(frappe.utils.cint(chunk_size), 1)
+	min_files, max_files = frappe.utils.cint(min_files), frappe.utils.cint(max_files)
+
+	paths = get_fst_paths()
+	if not paths:
+		frappe.throw("Нет Folder Structure Template для генерации документов")
+
+	rule = get_document_naming_rule()
+	if not rule:
+		frappe.throw("Нет правила Document Naming Rule для Document")
+
+	ensure_project(project)
+
+	rng = random.Random(seed)
+	cum_weights = get_path_weights(paths)
+	levels_by_path = [tuple(path + [None] * (5 - len(path))) for path in paths]
+
+	current = getdate(today())
+	start_dates = [current - timedelta(days=days) for days in range(frappe.utils.cint(max_age_days) + 1)]
+	timestamp = now()
+	user = frappe.session.user
+
+	created = 0
+	files_created = 0
+	first_names = []
+
+	for chunk_start in range(0, doc_count, chunk_size):
+		count = min(chunk_size, doc_count - chunk_start)
+		names = reserve_document_names(rule, count)
+		chosen = rng.choices(levels_by_path, cum_weights=cum_weights, k=count)
+		docs = []
+		files = []
+
+		for name, levels in zip(names, chosen, strict=True):
+			status = rng.choice(BULK_STATUSES)
+			start_date = rng.choice(start_dates)
+			planned_days = rng.randint(5, 30)
+			planned_end_date = start_date + timedelta(days=planned_days)
+			files_count = rng.randint(min_files, max_files)
+
+			docs.append(
+				(
+					name,
+					timestamp,
+					timestamp,
+					user,
+					user,
+					0,
+					rule.prefix,
+					project,
+					current,
+					"Draft",
+					*levels,
+					status,
+					start_date,
+					planned_days,
+					planned_end_date,
+					rng.randint(1, 5),
+					files_count,
+					1 if current > planned_end_date and status != "approved" else 0,
+				)
+			)
+
+			for idx in range(1, files_count + 1):
+				files.append(
+					(
+						f"{name}-{idx}",
+						timestamp,
+						timestamp,
+						user,
+						user,
+						0,
+						name,
+						"Document",
+						"files",
+						idx,
+						f"file_{idx}.pdf",
+						f"https://example.com/files/{name}/file_{idx}.pdf",
+						0,
+					)
+				)
+
+		frappe.db.bulk_insert("Document", DOCUMENT_FIELDS, docs, chunk_size=chunk_size)
+		frappe.db.bulk_insert("Document File", DOCUMENT_FILE_FIELDS, files, chunk_size=chunk_size)
+		frappe.db.commit()
+
+		created += len(docs)
+		files_created += len(files)
+		if len(first_names) < 5:
+			first_names.extend(names[: 5 - len(first_names)])
+
+	if created:
+		from company_documents.view_cache import bump_view_version
+
+		bump_view_version(project)
+		frappe.db.commit()
+
+	return {
+		"project": project,
+		"documents": created,
+		"files": files_created,
+		"document_names": first_names,
+		"elapsed_s": round(time.perf_counter() - started, 1),
+	}
+
+
+# =============================================================================
+# УДАЛЕНИЕ ДОКУМЕНТОВ ПРОЕКТА
+# =============================================================================
+# Документы проекта удаляются порциями: на порцию — несколько DELETE по
+# списку имён (Document File, Task Document Link, Comment, Version,
+# Document) и commit. Хуки on_trash не вызываются, файлы в NextCloud по
+# одному не удаляются — по желанию удаляется вся папка проекта одним
+# WebDAV DELETE. Прогресс — событием realtime PROJECT_PURGE_EVENT.
+
+PURGE_CHUNK_SIZE = 5000
+PROJECT_PURGE_EVENT = "project_purge"
+
+# Строки, ссылающиеся на документы порции: (таблица, условие)
+PURGE_LINKED_ROWS = (
+	("tabDocument File", "parenttype = 'Document' AND parent IN %(names)s"),
+	("tabTask Document Link", "document IN %(names)s"),
+	("tabComment", "reference_doctype = 'Document' AND reference_name IN %(names)s"),
+	("tabVersion", "ref_doctype = 'Document' AND docname IN %(names)s"),
+)
+
+
+def delete_attached_files(names):
+	"""
+	Вложения (File) документов порции. Удаляются через frappe.delete_doc —
+	иначе файлы останутся на диске; у синтетических данных вложений нет.
+	"""
+	attached = frappe.get_all(
+		"File", filters={"attached_to_doctype": "Document", "attached_to_name": ["in", names]}, pluck="name"
+	)
+	for file_name in attached:
+		frappe.delete_doc("File", file_name, ignore_permissions=True, force=True)
+	return len(attached)
+
+
+def delete_project_folder(project_name):
+	"""
+	Удалить папку проекта Projects/<project_name> в NextCloud одним DELETE.
+
+	Returns:
+	    str: deleted | not_found | skipped | failed
+	"""
+	from company_documents.nextcloud_sync import forget_known_folders, get_nextcloud_config, sanitize_path
+	from company_documents.webdav_client import get_webdav_client
+
+	config = get_nextcloud_config()
+	if not config or not project_name:
+		return "skipped"
+
+	folder_path = f"Projects/{sanitize_path(project_name)}"
+	try:
+		response = get_webdav_client(config).delete(folder_path)
+	except Exception as e:
+		frappe.log_error(title="Project Folder Delete Error", message=str(e))
+		return "failed"
+
+	forget_known_folders(config, folder_path)
+
+	if response.status_code in (200, 204):
+		return "deleted"
+	if response.status_code == 404:
+		return "not_found"
+
+	frappe.log_error(
+		title="Project Folder Delete Error", message=f"{folder_path}: HTTP {response.status_code}"
+	)
+	return "failed"
+
+
+@frappe.whitelist()
+def purge_project(project, delete_project=0, delete_remote_folder=0):
+	"""
+	Удалить все документы проекта (фоновая задача).
+
+	Args:
+	    delete_project: удалить и сам Project
+	    delete_remote_folder: удалить папку проекта в NextCloud
+
+	Returns:
+	    dict: {success, queued, job_id}
+	"""
+	frappe.only_for("System Manager")
+
+	if not frappe.db.exists("Project", project):
+		frappe.throw(f"Проект {project} не найден")
+
+	job_id = f"project_purge::{project}"
+	frappe.enqueue(
+		"company_documents.bulk.run_project_purge",
+		queue="long",
+		timeout=4 * 60 * 60,
+		job_id=job_id,
+		deduplicate=True,
+		project=project,
+		delete_project=frappe.utils.cint(delete_project),
+		delete_remote_folder=frappe.utils.cint(delete_remote_folder),
+		user=frappe.session.user,
+	)
+
+	return {"success": True, "queued": True, "job_id": job_id}
+
+
+def publish_project_purge_progress(progress, user=None):
+	frappe.publish_realtime(PROJECT_PURGE_EVENT, progress, user=user or frappe.session.user)
+
+
+def run_project_purge(
+	project, delete_project=False, delete_remote_folder=False, user=None, chunk_size=PURGE_CHUNK_SIZE
+):
+	"""
+	Удалить документы проекта порциями по chunk_size.
+
+	Returns:
+	    dict: прогресс {project, status, total, documents, attachments,
+	          remote_folder, project_deleted}
+	"""
+	from company_documents.view_cache import bump_view_version
+
+	chunk_size = max(frappe.utils.cint(chunk_size), 1)
+	project_name = frappe.db.get_value("Project", project, "project_name")
+	progress = {
+		"project": project,
+		"status": "deleting",
+		"total": frappe.db.count("Document", {"project": project}),
+		"documents": 0,
+		"attachments": 0,
+		"remote_folder": None,
+		"project_deleted": False,
+	}
+	publish_project_purge_progress(progress, user)
+
+	try:
+		while True:
+			names = frappe.db.sql_list(
+				"""
+                SELECT name FROM `tabDocument`
+                WHERE project = %(project)s
+                LIMIT %(limit)s
+            """,
+				{"project": project, "limit": chunk_size},
+			)
+
+			if not names:
+				break
+
+			values = {"names": tuple(names)}
+			progress["attachments"] += delete_attached_files(names)
+
+			for table, condition in PURGE_LINKED_ROWS:
+				frappe.db.sql(f"DELETE FROM `{table}` WHERE {condition}", values)
+
+			frappe.db.sql("DELETE FROM `tabDocument` WHERE name IN %(names)s", values)
+			progress["documents"] += len(names)
+
+			bump_view_version(project)
+			frappe.db.commit()
+			publish_project_purge_progress(progress, user)
+
+		if delete_remote_folder:
+			progress["remote_folder"] = delete_project_folder(project_name)
+
+		if delete_project and frappe.db.exists("Project", project):
+			frappe.delete_doc("Project", project, ignore_permissions=True, force=True)
+			frappe.db.commit()
+			progress["project_deleted"] = True
+
+		progress["status"] = "finished"
+
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(title="Project Purge Error", message=frappe.get_traceback())
+		progress["status"] = "failed"
+		progress["error"] = str(e)
+
+	publish_project_purge_progress(progress, user)
+	return progress
@@ -23,3 +23,85 @@ def validate(doc, method):
         doc.overdue = 1 if is_overdue else 0
     else:
         doc.overdue = 0
+
+
+# =============================================================================
+# ЕЖЕДНЕВНЫЙ ПЕРЕСЧЁТ overdue (scheduler_events → daily)
+# =============================================================================
+
+OVERDUE_CHUNK_SIZE = 5000
+
+# То же, что в validate(): просрочен, если today > (due_date или planned_end_date)
+# и статус не approved
+OVERDUE_SQL = """
+    (IFNULL(due_date, planned_end_date) IS NOT NULL
+     AND %(today)s > IFNULL(due_date, planned_end_date)
+     AND IFNULL(readiness_status, '') != 'approved')
+"""
+
+PLANNED_END_MISSING_SQL = """
+    (planned_end_date IS NULL AND start_date IS NOT NULL AND IFNULL(planned_days, 0) != 0)
+"""
+
+
+def update_overdue_documents(chunk_size=OVERDUE_CHUNK_SIZE):
+    """
+    Пересчитать overdue (и planned_end_date, если не заполнена) без doc.save():
+    документы, которые никто не сохраняет, тоже становятся просроченными.
+    
+    Обрабатываются только строки, у которых значение изменится, порциями по
+    chunk_size: два UPDATE на порцию, commit, сброс кэша страницы Project
+    Documents для затронутых проектов. Хуки и Version не создаются,
+    modified не меняется.
+    
+    Returns:
+        dict: {documents, projects}
+    """
+    from company_documents.view_cache import bump_view_version
+    
+    values = {"today": getdate(today())}
+    last_name = ""
+    updated = 0
+    projects = set()
+    
+    while True:
+        rows = frappe.db.sql(f"""
+            SELECT name, project
+            FROM `tabDocument`
+            WHERE name > %(last_name)s
+                AND ({PLANNED_END_MISSING_SQL} OR overdue != IF({OVERDUE_SQL}, 1, 0))
+            ORDER BY name
+            LIMIT %(limit)s
+        """, dict(values, last_name=last_name, limit=chunk_size), as_dict=True)
+        
+        if not rows:
+            break
+        
+        chunk = dict(values, names=tuple(row.name for row in rows))
+        
+        # Сначала planned_end_date — overdue считается уже по ней
+        frappe.db.sql(f"""
+            UPDATE `tabDocument`
+            SET planned_end_date = DATE_ADD(start_date, INTERVAL planned_days DAY)
+            WHERE name IN %(names)s AND {PLANNED_END_MISSING_SQL}
+        """, chunk)
+        
+        frappe.db.sql(f"""
+            UPDATE `tabDocument`
+            SET overdue = IF({OVERDUE_SQL}, 1, 0)
+            WHERE name IN %(names)s
+        """, chunk)
+        
+        chunk_projects = {row.project for row in rows if row.project}
+        if chunk_projects:
+            bump_view_version(*chunk_projects)
+        frappe.db.commit()
+        
+        updated += len(rows)
+        projects.update(chunk_projects)
+        last_name = rows[-1].name
+        
+        if len(rows) < chunk_size:
+            break
+    
+    return {"documents": updated, "projects": len(projects)}
@@ -1,5 +1,7 @@
 // Project Documents Page v0.0.3.9 - Native Frappe Select Controls
 // ============================================================================
+// Таблица загружается страницами: фильтры, сортировка и keyset-пагинация
+// выполняются на сервере (api.get_project_document_overview).
 // Улучшения:
 // - Нативные Frappe Select контролы в sidebar (frappe.ui.form.make_control)
 // - Выглядит как стандартные поля ERPNext
@@ -32,31 +34,20 @@ class FolderFilterManager {
         this.controls = {}; // Frappe контролы
     }
 
-    // Получить уникальные папки для уровня с учётом выбора на предыдущих уровнях
+    // Получить папки для уровня с учётом выбора на предыдущих уровнях (из дерева проекта)
     getFoldersForLevel(level) {
-        const folders = new Map();
-        const data = this.controller.tableData;
-
-        data.forEach(doc => {
-            let matches = true;
-            for (let i = 1; i < level; i++) {
-                const selectedId = this.selectedFolders["level_" + i];
-                if (selectedId && doc["level_" + i] !== selectedId) {
-                    matches = false;
-                    break;
-                }
-            }
+        let nodes = this.controller.treeData || {};
 
-            if (matches && doc["level_" + level]) {
-                const fstId = doc["level_" + level];
-                if (!folders.has(fstId)) {
-                    const name = this.controller.folderNames[fstId] || fstId;
-                    folders.set(fstId, { id: fstId, name: name });
-                }
-            }
-        });
+        for (let i = 1; i < level; i++) {
+            const selectedId = this.selectedFolders["level_" + i];
+            if (!selectedId || !nodes[selectedId]) return [];
+            nodes = nodes[selectedId].children || {};
+        }
 
-        return Array.from(folders.values()).sort((a, b) => a.name.localeCompare(b.name));
+        return Object.keys(nodes)
+            .filter(fstId => fstId !== "_root")
+            .map(fstId => ({ id: fstId, name: this.controller.folderNames[fstId] || nodes[fstId].name || fstId }))
+            .sort((a, b) => a.name.localeCompare(b.name));
     }
 
     // Получить ID папки по имени
@@ -104,17 +95,14 @@ class FolderFilterManager {
         return parts;
     }
 
-    // Фильтровать данные по выбранным папкам
-    applyFilter(data) {
-        return data.filter(doc => {
-            for (let i = 1; i <= 5; i++) {
-                const selectedId = this.selectedFolders["level_" + i];
-                if (selectedId && doc["level_" + i] !== selectedId) {
-                    return false;
-                }
-            }
-            return true;
-        });
+    // Параметры запроса для фильтра по выбранным папкам (фильтрация в SQL)
+    getQueryArgs() {
+        const args = {};
+        for (let i = 1; i <= 5; i++) {
+            const selectedId = this.selectedFolders["level_" + i];
+            if (selectedId) args["level_" + i] = selectedId;
+        }
+        return args;
     }
 
     // Рендер боковой панели (только контейнер, контролы создаются отдельно)
@@ -203,8 +191,7 @@ class FolderFilterManager {
                 control.set_value('');
                 $container.removeClass('has-value');
                 self.selectFolder(level, null);
-                self.controller.applyAllFilters();
-                self.controller.updateTableAndFilters();
+                self.controller.refreshTable(true);
             });
             
             // Установить текущее значение
@@ -226,8 +213,7 @@ class FolderFilterManager {
                 }
                 
                 self.selectFolder(level, fstId);
-                self.controller.applyAllFilters();
-                self.controller.updateTableAndFilters();
+                self.controller.refreshTable(true);
             });
         }
     }
@@ -248,23 +234,13 @@ class TableFilterManager {
     }
 
     getStatusOptions() {
-        const statuses = new Set();
-        this.controller.tableData.forEach(doc => {
-            if (doc.readiness_status) statuses.add(doc.readiness_status);
-        });
-        return Array.from(statuses);
+        return ["missing", "partial", "requested", "in_progress", "ready_for_review", "approved"];
     }
 
+    // Ответственные проекта (employee_names приходит вместе с деревом)
     getEmployeeOptions() {
-        const employees = new Map();
-        this.controller.tableData.forEach(doc => {
-            if (doc.responsible_employee && !employees.has(doc.responsible_employee)) {
-                const name = this.controller.employeeNames[doc.responsible_employee] || doc.responsible_employee;
-                employees.set(doc.responsible_employee, name);
-            }
-        });
-        return Array.from(employees.entries())
-            .map(([id, name]) => ({ id, name }))
+        return Object.entries(this.controller.employeeNames || {})
+            .map(([id, name]) => ({ id, name: name || id }))
             .sort((a, b) => a.name.localeCompare(b.name));
     }
 
@@ -280,57 +256,20 @@ class TableFilterManager {
         return labels[status] || status;
     }
 
-    applyFilters(data) {
-        return data.filter(doc => {
-            // Поиск по имени
-            if (this.filters.search) {
-                const searchLower = this.filters.search.toLowerCase();
-                const nameMatch = doc.name.toLowerCase().includes(searchLower);
-                // Также ищем по полному пути
-                let pathMatch = false;
-                for (let i = 1; i <= 5; i++) {
-                    const fstId = doc["level_" + i];
-                    if (fstId) {
-                        const folderName = this.controller.folderNames[fstId] || "";
-                        if (folderName.toLowerCase().includes(searchLower)) {
-                            pathMatch = true;
-                            break;
-                        }
-                    }
-                }
-                if (!nameMatch && !pathMatch) return false;
-            }
-
-            // Статус
-            if (this.filters.readiness_status.length > 0) {
-                if (!this.filters.readiness_status.includes(doc.readiness_status)) {
-                    return false;
-                }
-            }
-
-            // Ответственный
-            if (this.filters.responsible_employee) {
-                if (doc.responsible_employee !== this.filters.responsible_employee) {
-                    return false;
-                }
-            }
-
-            // Date Range
-            if (this.filters.date_range && this.filters.date_range.length === 2) {
-                const [from, to] = this.filters.date_range;
-                const dates = [doc.start_date, doc.planned_end_date, doc.due_date].filter(d => d);
-                if (dates.length === 0) return false;
-                
-                const inRange = dates.some(d => {
-                    if (from && d < from) return false;
-                    if (to && d > to) return false;
-                    return true;
-                });
-                if (!inRange) return false;
-            }
-
-            return true;
-        });
+    // Параметры запроса для get_project_document_overview (фильтрация в SQL)
+    getQueryArgs() {
+        const args = {};
+        if (this.filters.search) args.search = this.filters.search;
+        if (this.filters.readiness_status.length > 0) {
+            args.readiness_status = JSON.stringify(this.filters.readiness_status);
+        }
+        if (this.filters.responsible_employee) args.responsible_employee = this.filters.responsible_employee;
+        if (this.filters.date_range && this.filters.date_range.length === 2) {
+            const [from, to] = this.filters.date_range;
+            if (from) args.date_from = from;
+            if (to) args.date_to = to;
+        }
+        return args;
     }
 
     hasActiveFilters() {
@@ -372,10 +311,11 @@ class SortManager {
         };
     }
 
-    sort(data, columnIndex) {
+    // Переключить сортировку по колонке (сортирует сервер)
+    toggle(columnIndex) {
         const columns = this.getSortableColumns();
         const col = columns[columnIndex];
-        if (!col) return data;
+        if (!col) return;
 
         if (this.sortField === col.field) {
             this.sortOrder = this.sortOrder === "asc" ? "desc" : "asc";
@@ -383,25 +323,11 @@ class SortManager {
             this.sortField = col.field;
             this.sortOrder = "asc";
         }
+    }
 
-        return [...data].sort((a, b) => {
-            let valA = a[col.field];
-            let valB = b[col.field];
-
-            if (valA == null) valA = col.type === "number" ? -Infinity : "";
-            if (valB == null) valB = col.type === "number" ? -Infinity : "";
-
-            let result = 0;
-            if (col.type === "number") {
-                result = Number(valA) - Number(valB);
-            } else if (col.type === "date") {
-                result = new Date(valA || 0) - new Date(valB || 0);
-            } else {
-                result = String(valA).localeCompare(String(valB));
-            }
-
-            return this.sortOrder === "desc" ? -result : result;
-        });
+    getQueryArgs() {
+        if (!this.sortField) return {};
+        return { sort_by: this.sortField, sort_order: this.sortOrder };
     }
 
     getSortIndicator(columnIndex) {
@@ -428,6 +354,11 @@ class ProjectDocumentsController {
         this.tableData = [];
         this.folderNames = {};
         this.employeeNames = {};
+        this.pageSize = 100;
+        this.nextCursor = null;
+        this.totalCount = 0;
+        this.projectTotal = 0;
+        this.treeChildren = {};
         
         this.folderFilter = new FolderFilterManager(this);
         this.tableFilter = new TableFilterManager(this);
@@ -442,11 +373,55 @@ class ProjectDocumentsController {
         this.injectStyles();
         this.setupHeader();
         this.setupContent();
+        this.setupRealtime();
         this.renderProjectSelector();
     }
 
     setupHeader() {
         this.page.add_inner_button("Обновить", () => this.loadData());
+        this.page.add_inner_button("Синхронизировать с NextCloud", () => this.syncProject());
+    }
+
+    // Прогресс фоновой синхронизации проекта (nextcloud_sync.run_project_sync)
+    setupRealtime() {
+        frappe.realtime.on("nextcloud_project_sync", (data) => {
+            if (!data || data.project !== this.currentProject) return;
+
+            const title = "Синхронизация с NextCloud";
+            const description = "Загружено: " + data.uploaded + ", без изменений: " + data.unchanged +
+                ", не найдено: " + data.missing + ", ошибок: " + data.failed;
+
+            if (data.status === "planning" || data.status === "uploading") {
+                frappe.show_progress(title, data.processed, data.total || 1, description);
+                return;
+            }
+
+            frappe.hide_progress();
+            frappe.show_alert({
+                message: (data.status === "finished" ? "✅ " : "⚠️ ") + description,
+                indicator: data.status === "finished" ? "green" : "orange"
+            }, 10);
+            this.loadData();
+        });
+    }
+
+    syncProject() {
+        if (!this.currentProject) {
+            frappe.show_alert({ message: "Выберите проект", indicator: "orange" });
+            return;
+        }
+
+        frappe.call({
+            method: "company_documents.nextcloud_sync.sync_project_to_nextcloud",
+            args: { project: this.currentProject }
+        }).then(r => {
+            const result = r.message || {};
+            if (result.queued) {
+                frappe.show_alert({ message: "Синхронизация проекта поставлена в очередь", indicator: "blue" });
+            } else {
+                frappe.show_alert({ message: result.message || "Синхронизация недоступна", indicator: "orange" });
+            }
+        });
     }
 
     injectStyles() {
@@ -1157,76 +1132,149 @@ class ProjectDocumentsController {
         
         this.$content.html('<div class="pd-loading"><span class="spinner-border spinner-border-sm"></span> Загрузка...</div>');
         
-        Promise.all([
-            frappe.call({ method: "company_documents.api.get_project_document_overview", args: { project: this.currentProject } }),
-            frappe.call({ method: "company_documents.api.get_project_document_tree", args: { project: this.currentProject } })
-        ]).then(([tableResp, treeResp]) => {
-            this.tableData = tableResp.message || [];
-            const treeResult = treeResp.message || {};
-            this.treeData = treeResult.tree || {};
-            this.folderNames = treeResult.folder_names || {};
-            this.employeeNames = treeResult.employee_names || {};
-            
-            // Сброс фильтров при загрузке нового проекта
-            this.folderFilter.reset();
-            this.tableFilter.reset();
+        // Сброс фильтров при загрузке нового проекта
+        this.folderFilter.reset();
+        this.tableFilter.reset();
+        
+        // Одним вызовом: первая страница таблицы + индекс дерева + названия
+        frappe.call({
+            method: "company_documents.api.get_project_document_view",
+            args: this.getQueryArgs()
+        }).then(r => {
+            const result = r.message || {};
+            this.setPage(result, false);
+            this.projectTotal = result.project_total || 0;
+            this.folderNames = result.folder_names || {};
+            this.employeeNames = result.employee_names || {};
+            this.treeData = this.buildTree(result.tree || {});
+            this.treeChildren = {};
             
-            this.applyAllFilters();
             this.render();
+            if (this.currentView === "tree") this.loadTreeRoot();
         }).catch(err => {
             console.error("Load error:", err);
             this.$content.html('<div class="pd-empty"><div class="pd-empty-icon">⚠️</div><div>Ошибка загрузки данных</div></div>');
         });
     }
 
-    applyAllFilters() {
-        let data = this.tableData;
-        data = this.folderFilter.applyFilter(data);
-        data = this.tableFilter.applyFilters(data);
+    // Один уровень дерева: дочерние папки со счётчиками + документы папки
+    fetchFolderChildren(parentFst, cursor) {
+        return frappe.call({
+            method: "company_documents.api.get_folder_children",
+            args: { project: this.currentProject, parent_fst: parentFst || null, limit: this.pageSize, cursor: cursor || null }
+        }).then(r => r.message || { folders: [], documents: [] });
+    }
+
+    loadTreeRoot() {
+        const project = this.currentProject;
+        this.fetchFolderChildren("").then(result => {
+            if (project !== this.currentProject) return;
+            this.treeChildren[""] = result;
+            if (this.currentView === "tree") this.render();
+        });
+    }
+
+    // Вложенное дерево папок {fst: {name, children}} из компактного индекса (для sidebar)
+    buildTree(index) {
+        const children = index.children || {};
         
-        // Применить сортировку
-        if (this.sortManager.sortField) {
-            const columns = this.sortManager.getSortableColumns();
-            const colIndex = Object.keys(columns).find(k => columns[k].field === this.sortManager.sortField);
-            if (colIndex !== undefined) {
-                const savedOrder = this.sortManager.sortOrder;
-                this.sortManager.sortField = null;
-                data = this.sortManager.sort(data, parseInt(colIndex));
-                this.sortManager.sortOrder = savedOrder;
+        const buildNode = (fstId) => {
+            const node = {
+                name: this.folderNames[fstId] || fstId,
+                children: {}
+            };
+            (children[fstId] || []).forEach(childId => {
+                node.children[childId] = buildNode(childId);
+            });
+            return node;
+        };
+        
+        const tree = {};
+        (index.roots || []).forEach(fstId => {
+            tree[fstId] = buildNode(fstId);
+        });
+        return tree;
+    }
+
+    // Параметры запроса: фильтры папок, фильтры таблицы, сортировка
+    getQueryArgs() {
+        return Object.assign(
+            { project: this.currentProject, limit: this.pageSize },
+            this.folderFilter.getQueryArgs(),
+            this.tableFilter.getQueryArgs(),
+            this.sortManager.getQueryArgs()
+        );
+    }
+
+    // Загрузить одну страницу таблицы (keyset: cursor = next_cursor предыдущей страницы)
+    fetchPage(cursor) {
+        const args = this.getQueryArgs();
+        if (cursor) args.cursor = cursor;
+        return frappe.call({ method: "company_documents.api.get_project_document_overview", args: args })
+            .then(r => r.message || { documents: [], total: 0, next_cursor: null });
+    }
+
+    setPage(page, append) {
+        this.tableData = append ? this.tableData.concat(page.documents) : page.documents;
+        this.filteredData = this.tableData;
+        this.totalCount = page.total;
+        this.nextCursor = page.next_cursor;
+    }
+
+    // Перезапросить первую страницу после смены фильтров / сортировки
+    refreshTable(updateSidebar) {
+        const requestId = (this.tableRequestId || 0) + 1;
+        this.tableRequestId = requestId;
+        
+        return this.fetchPage(null).then(page => {
+            // Ответ на устаревший запрос (фильтр уже изменился)
+            if (requestId !== this.tableRequestId) return;
+            this.setPage(page, false);
+            if (updateSidebar) {
+                this.updateTableAndFilters();
+            } else {
+                this.updateTable();
             }
+        });
+    }
+
+    loadMore() {
+        if (!this.nextCursor) return;
+        const requestId = this.tableRequestId || 0;
+        
+        this.fetchPage(this.nextCursor).then(page => {
+            if (requestId !== (this.tableRequestId || 0)) return;
+            this.setPage(page, true);
+            this.updateTable();
+        });
+    }
+
+    renderTableRows() {
+        if (this.filteredData.length === 0) {
+            return '<tr><td colspan="9" style="text-align:center;padding:20px;color:var(--text-muted)">Нет документов по фильтрам</td></tr>';
         }
         
-        this.filteredData = data;
+        let html = '';
+        this.filteredData.forEach(doc => {
+            html += '<tr>';
+            html += '<td><a href="/app/document/' + doc.name + '">' + doc.name + '</a></td>';
+            html += '<td>' + this.buildFullPath(doc) + '</td>';
+            html += '<td>' + this.renderStatusBadge(doc.readiness_status) + '</td>';
+            html += '<td>' + this.renderFilesCell(doc) + '</td>';
+            html += '<td>' + this.renderDate(doc.start_date) + '</td>';
+            html += '<td>' + this.renderDate(doc.planned_end_date) + '</td>';
+            html += '<td>' + this.renderPlannedDays(doc.planned_days) + '</td>';
+            html += '<td>' + this.renderDueDate(doc) + '</td>';
+            html += '<td>' + this.renderResponsible(doc.responsible_employee) + '</td>';
+            html += '</tr>';
+        });
+        return html;
     }
 
     // Обновить таблицу и sidebar контролы БЕЗ полного перерендера
     updateTableAndFilters() {
-        // Обновить таблицу
-        const $tbody = this.$content.find(".pd-table tbody");
-        if ($tbody.length) {
-            let html = '';
-            if (this.filteredData.length === 0) {
-                html = '<tr><td colspan="9" style="text-align:center;padding:20px;color:var(--text-muted)">Нет документов по фильтрам</td></tr>';
-            } else {
-                this.filteredData.forEach(doc => {
-                    html += '<tr>';
-                    html += '<td><a href="/app/document/' + doc.name + '">' + doc.name + '</a></td>';
-                    html += '<td>' + this.buildFullPath(doc) + '</td>';
-                    html += '<td>' + this.renderStatusBadge(doc.readiness_status) + '</td>';
-                    html += '<td>' + this.renderFilesCell(doc) + '</td>';
-                    html += '<td>' + this.renderDate(doc.start_date) + '</td>';
-                    html += '<td>' + this.renderDate(doc.planned_end_date) + '</td>';
-                    html += '<td>' + this.renderPlannedDays(doc.planned_days) + '</td>';
-                    html += '<td>' + this.renderDueDate(doc) + '</td>';
-                    html += '<td>' + this.renderResponsible(doc.responsible_employee) + '</td>';
-                    html += '</tr>';
-                });
-            }
-            $tbody.html(html);
-        }
-        
-        // Обновить info bar
-        this.$content.find(".pd-info-bar").replaceWith(this.renderInfoBar());
+        // Обновить таблицу и info bar
+        this.updateTable();
         
         // Обновить sidebar контролы (каскад)
         this.folderFilter.initControls();
@@ -1272,8 +1320,7 @@ class ProjectDocumentsController {
     }
 
     renderInfoBar() {
-        const total = this.tableData.length;
-        const filtered = this.filteredData.length;
+        const shown = this.filteredData.length;
         const path = this.folderFilter.getSelectedPath();
         
         let html = '<div class="pd-info-bar">';
@@ -1282,13 +1329,17 @@ class ProjectDocumentsController {
             html += '<span class="pd-path">📂 ' + path.join(' › ') + '</span>';
         }
         html += '</div>';
-        html += '<div>Показано ' + filtered + ' из ' + total + '</div>';
+        html += '<div>Показано ' + shown + ' из ' + this.totalCount;
+        if (this.nextCursor) {
+            html += ' <button type="button" class="btn btn-xs btn-default pd-load-more">Загрузить ещё</button>';
+        }
+        html += '</div>';
         html += '</div>';
         return html;
     }
 
     renderTableView() {
-        if (!this.tableData.length) {
+        if (!this.projectTotal) {
             return '<div class="pd-empty"><div class="pd-empty-icon">📭</div><div>Нет документов в проекте</div></div>';
         }
 
@@ -1353,23 +1404,7 @@ class ProjectDocumentsController {
         
         // Body
         html += '<tbody>';
-        if (this.filteredData.length === 0) {
-            html += '<tr><td colspan="9" style="text-align:center;padding:20px;color:var(--text-muted)">Нет документов по фильтрам</td></tr>';
-        } else {
-            this.filteredData.forEach(doc => {
-                html += '<tr>';
-                html += '<td><a href="/app/document/' + doc.name + '">' + doc.name + '</a></td>';
-                html += '<td>' + this.buildFullPath(doc) + '</td>';
-                html += '<td>' + this.renderStatusBadge(doc.readiness_status) + '</td>';
-                html += '<td>' + this.renderFilesCell(doc) + '</td>';
-                html += '<td>' + this.renderDate(doc.start_date) + '</td>';
-                html += '<td>' + this.renderDate(doc.planned_end_date) + '</td>';
-                html += '<td>' + this.renderPlannedDays(doc.planned_days) + '</td>';
-                html += '<td>' + this.renderDueDate(doc) + '</td>';
-                html += '<td>' + this.renderResponsible(doc.responsible_employee) + '</td>';
-                html += '</tr>';
-            });
-        }
+        html += this.renderTableRows();
         html += '</tbody></table></div>';
         
         return html;
@@ -1384,8 +1419,7 @@ class ProjectDocumentsController {
             clearTimeout(searchTimeout);
             searchTimeout = setTimeout(() => {
                 self.tableFilter.filters.search = $(this).val().trim();
-                self.applyAllFilters();
-                self.updateTable();
+                self.refreshTable();
             }, 300);
         });
 
@@ -1408,8 +1442,7 @@ class ProjectDocumentsController {
                 self.tableFilter.filters.readiness_status = self.tableFilter.filters.readiness_status.filter(s => s !== value);
             }
             self.updateStatusToggle();
-            self.applyAllFilters();
-            self.updateTable();
+            self.refreshTable();
         });
 
         // Close dropdown on outside click
@@ -1458,8 +1491,7 @@ class ProjectDocumentsController {
                     self.tableFilter.filters.responsible_employee = emp ? emp.id : "";
                     $employeeWrap.addClass("has-value");
                 }
-                self.applyAllFilters();
-                self.updateTable();
+                self.refreshTable();
             });
             
             // Обработчик очистки
@@ -1468,8 +1500,7 @@ class ProjectDocumentsController {
                 self.employeeControl.set_value("");
                 self.tableFilter.filters.responsible_employee = "";
                 $employeeWrap.removeClass("has-value");
-                self.applyAllFilters();
-                self.updateTable();
+                self.refreshTable();
             });
         }
 
@@ -1492,8 +1523,7 @@ class ProjectDocumentsController {
                 self.tableFilter.filters.date_range = (val && val.length === 2) ? val : null;
                 // Показать/скрыть кнопку сброса
                 $dateReset.toggleClass("visible", !!self.tableFilter.filters.date_range);
-                self.applyAllFilters();
-                self.updateTable();
+                self.refreshTable();
             });
             
             // Кнопка сброса дат
@@ -1501,8 +1531,7 @@ class ProjectDocumentsController {
                 self.dateRangeControl.set_value("");
                 self.tableFilter.filters.date_range = null;
                 $(this).removeClass("visible");
-                self.applyAllFilters();
-                self.updateTable();
+                self.refreshTable();
             });
             
             if (this.tableFilter.filters.date_range) {
@@ -1524,27 +1553,7 @@ class ProjectDocumentsController {
 
     updateTable() {
         // Обновить только tbody и info bar
-        const $tbody = this.$content.find(".pd-table tbody");
-        let html = '';
-        
-        if (this.filteredData.length === 0) {
-            html = '<tr><td colspan="9" style="text-align:center;padding:20px;color:var(--text-muted)">Нет документов по фильтрам</td></tr>';
-        } else {
-            this.filteredData.forEach(doc => {
-                html += '<tr>';
-                html += '<td><a href="/app/document/' + doc.name + '">' + doc.name + '</a></td>';
-                html += '<td>' + this.buildFullPath(doc) + '</td>';
-                html += '<td>' + this.renderStatusBadge(doc.readiness_status) + '</td>';
-                html += '<td>' + this.renderFilesCell(doc) + '</td>';
-                html += '<td>' + this.renderDate(doc.start_date) + '</td>';
-                html += '<td>' + this.renderDate(doc.planned_end_date) + '</td>';
-                html += '<td>' + this.renderPlannedDays(doc.planned_days) + '</td>';
-                html += '<td>' + this.renderDueDate(doc) + '</td>';
-                html += '<td>' + this.renderResponsible(doc.responsible_employee) + '</td>';
-                html += '</tr>';
-            });
-        }
-        $tbody.html(html);
+        this.$content.find(".pd-table tbody").html(this.renderTableRows());
         
         // Update info bar
         this.$content.find(".pd-info-bar").replaceWith(this.renderInfoBar());
@@ -1557,6 +1566,7 @@ class ProjectDocumentsController {
         this.$content.find(".pd-view-tab").on("click", function() {
             self.currentView = $(this).data("view");
             self.render();
+            if (self.currentView === "tree" && !self.treeChildren[""]) self.loadTreeRoot();
         });
         
         // Project reset button
@@ -1575,35 +1585,35 @@ class ProjectDocumentsController {
         // Folder reset (контролы обрабатываются через onchange в initControls)
         this.$content.find(".pd-folder-reset").on("click", function() {
             self.folderFilter.reset();
-            self.applyAllFilters();
-            self.render();
+            self.refreshTable().then(() => self.render());
         });
 
-        // Table sort
+        // Table sort (сортирует сервер)
         this.$content.find(".pd-table th.sortable").on("click", function() {
             const col = parseInt($(this).data("col"));
-            self.filteredData = self.sortManager.sort(self.filteredData, col);
-            self.render();
+            self.sortManager.toggle(col);
+            self.refreshTable().then(() => self.render());
         });
 
-        // Tree events
-        this.$content.find(".pd-tree-node-content").on("click", function(e) {
+        // Следующая страница (keyset)
+        this.$content.off("click.pdmore").on("click.pdmore", ".pd-load-more", () => this.loadMore());
+
+        // Tree events (делегирование: узлы добавляются при раскрытии папок)
+        const $tree = this.$content.find(".pd-tree-container");
+        
+        $tree.on("click", ".pd-tree-node-content", function(e) {
             e.stopPropagation();
-            const $toggle = $(this).find(".pd-tree-toggle");
-            if ($toggle.hasClass("empty")) return;
-            const $node = $(this).closest(".pd-tree-node");
-            const $children = $node.find("> .pd-tree-children");
-            if ($children.is(":visible")) {
-                $children.slideUp(150);
-                $toggle.removeClass("expanded");
-            } else {
-                $children.slideDown(150);
-                $toggle.addClass("expanded");
-            }
+            if ($(this).find(".pd-tree-toggle").hasClass("empty")) return;
+            self.toggleTreeNode($(this).closest(".pd-tree-node"));
+        });
+        
+        $tree.on("click", ".pd-tree-more", function(e) {
+            e.stopPropagation();
+            self.loadMoreTreeDocuments($(this));
         });
 
         // Hover на документ - подсветка цепочки папок
-        this.$content.find(".pd-tree-document").on("mouseenter", function() {
+        $tree.on("mouseenter", ".pd-tree-document", function() {
             const $doc = $(this);
             $doc.addClass("hovered");
             
@@ -1613,7 +1623,7 @@ class ProjectDocumentsController {
                 const depthClass = "depth-" + Math.min(index + 1, 6);
                 $(this).addClass("in-path " + depthClass);
             });
-        }).on("mouseleave", function() {
+        }).on("mouseleave", ".pd-tree-document", function() {
             const $doc = $(this);
             $doc.removeClass("hovered");
             
@@ -1622,14 +1632,16 @@ class ProjectDocumentsController {
         });
         
         // Клик на документ - переход
-        this.$content.find(".pd-tree-document").on("click", function(e) {
+        $tree.on("click", ".pd-tree-document", function(e) {
             e.stopPropagation();
             frappe.set_route("Form", "Document", $(this).data("name"));
         });
 
+        // Раскрыть уже загруженные папки (без запросов к серверу)
         this.$content.find(".pd-btn-expand-all").on("click", () => {
-            this.$content.find(".pd-tree-children").slideDown(150);
-            this.$content.find(".pd-tree-toggle").addClass("expanded");
+            const $loaded = this.$content.find(".pd-tree-node[data-loaded]");
+            $loaded.find("> .pd-tree-children").slideDown(150);
+            $loaded.find("> .pd-tree-node-content .pd-tree-toggle").addClass("expanded");
         });
         this.$content.find(".pd-btn-collapse-all").on("click", () => {
             this.$content.find(".pd-tree-children").slideUp(150);
@@ -1707,51 +1719,92 @@ class ProjectDocumentsController {
     // === TREE VIEW ===
     
     renderTreeView() {
-        if (!this.treeData || !Object.keys(this.treeData).length) {
+        const root = this.treeChildren[""];
+        if (!root) {
+            return '<div class="pd-loading"><span class="spinner-border spinner-border-sm"></span> Загрузка...</div>';
+        }
+        if (!root.folders.length) {
             return '<div class="pd-empty"><div class="pd-empty-icon">🌲</div><div>Структура пуста</div></div>';
         }
         let html = '<div class="pd-tree-toolbar">';
-        html += '<button class="btn btn-xs btn-default pd-btn-expand-all">Развернуть всё</button> ';
+        html += '<button class="btn btn-xs btn-default pd-btn-expand-all">Развернуть загруженные</button> ';
         html += '<button class="btn btn-xs btn-default pd-btn-collapse-all">Свернуть всё</button>';
         html += '</div>';
         html += '<div class="pd-tree-container">';
-        Object.entries(this.treeData).forEach(([fstId, folder]) => {
-            html += this.renderTreeNode(fstId, folder, 0);
-        });
+        html += this.renderTreeLevel(root, 0);
         html += '</div>';
         return html;
     }
 
-    renderTreeNode(fstId, node, level) {
-        const folderName = node.name || this.folderNames[fstId] || fstId;
-        const hasChildren = node.children && Object.keys(node.children).length > 0;
-        const hasDocuments = node.documents && node.documents.length > 0;
-        const isEmpty = !hasChildren && !hasDocuments;
-        const childCount = this.countNodeItems(node);
+    // Папки и документы одного ответа get_folder_children (+ кнопка следующей страницы)
+    renderTreeLevel(result, level) {
+        let html = "";
+        (result.folders || []).forEach(folder => {
+            html += this.renderTreeNode(folder, level);
+        });
+        (result.documents || []).forEach(doc => {
+            html += this.renderTreeDocument(doc, level);
+        });
+        if (result.next_cursor) {
+            html += '<div class="pd-tree-more" data-fst="' + result.parent_fst + '" data-level="' + level + '" data-cursor="' + result.next_cursor + '" style="padding: 4px 12px 4px ' + (12 + level * 20) + 'px; cursor: pointer;">';
+            html += '<span class="pd-tree-toggle empty"></span><a>Загрузить ещё</a>';
+            html += '</div>';
+        }
+        return html;
+    }
+
+    renderTreeNode(folder, level) {
         const indent = level * 20;
 
-        let html = '<div class="pd-tree-node" data-fst="' + fstId + '">';
+        let html = '<div class="pd-tree-node" data-fst="' + folder.name + '" data-level="' + level + '">';
         html += '<div class="pd-tree-node-content" style="padding-left: ' + (12 + indent) + 'px;">';
-        html += '<span class="pd-tree-toggle' + (isEmpty ? ' empty' : '') + '">▶</span>';
+        html += '<span class="pd-tree-toggle' + (folder.documents ? '' : ' empty') + '">▶</span>';
         html += '<span class="pd-tree-icon">📁</span>';
-        html += '<span class="pd-tree-label">' + folderName + '</span>';
-        if (childCount > 0) html += ' <span class="pd-tree-count">[' + childCount + ']</span>';
+        html += '<span class="pd-tree-label">' + folder.folder_name + '</span>';
+        if (folder.documents > 0) html += ' <span class="pd-tree-count">[' + folder.documents + ']</span>';
+        html += ' <span class="pd-tree-count" title="Файлы: загружено / ожидается">📎 ' + folder.files + '/' + folder.expected_files + '</span>';
+        if (folder.overdue > 0) html += ' <span class="pd-tree-count" style="color:#dc2626" title="Просрочено">⏰ ' + folder.overdue + '</span>';
+        html += '</div>';
+        html += '<div class="pd-tree-children" style="display: none;"></div>';
         html += '</div>';
-        html += '<div class="pd-tree-children" style="display: none;">';
+        return html;
+    }
 
-        if (hasChildren) {
-            Object.entries(node.children).forEach(([childFstId, childNode]) => {
-                html += this.renderTreeNode(childFstId, childNode, level + 1);
-            });
+    // Раскрыть папку: содержимое загружается при первом раскрытии
+    toggleTreeNode($node) {
+        const $toggle = $node.find("> .pd-tree-node-content .pd-tree-toggle");
+        const $children = $node.find("> .pd-tree-children");
+        
+        if ($children.is(":visible")) {
+            $children.slideUp(150);
+            $toggle.removeClass("expanded");
+            return;
         }
-        if (hasDocuments) {
-            node.documents.forEach(doc => {
-                html += this.renderTreeDocument(doc, level + 1);
-            });
+        
+        if ($node.attr("data-loaded")) {
+            $children.slideDown(150);
+            $toggle.addClass("expanded");
+            return;
         }
+        
+        if ($node.attr("data-loading")) return;
+        $node.attr("data-loading", 1);
+        
+        this.fetchFolderChildren($node.data("fst")).then(result => {
+            $node.removeAttr("data-loading").attr("data-loaded", 1);
+            $children.html(this.renderTreeLevel(result, $node.data("level") + 1)).slideDown(150);
+            $toggle.addClass("expanded");
+        }, () => $node.removeAttr("data-loading"));
+    }
 
-        html += '</div></div>';
-        return html;
+    loadMoreTreeDocuments($more) {
+        if ($more.attr("data-loading")) return;
+        $more.attr("data-loading", 1);
+        
+        this.fetchFolderChildren($more.data("fst"), $more.data("cursor")).then(result => {
+            // Папки уже показаны на первой странице — добавить только документы
+            $more.replaceWith(this.renderTreeLevel(Object.assign({}, result, { folders: [] }), $more.data("level")));
+        }, () => $more.removeAttr("data-loading"));
     }
 
     renderTreeDocument(doc, level) {
@@ -1775,12 +1828,4 @@ class ProjectDocumentsController {
         const styles = { missing: "background:#fee2e2;color:#dc2626;", partial: "background:#ffedd5;color:#ea580c;", requested: "background:#fef3c7;color:#d97706;", in_progress: "background:#e0e7ff;color:#4f46e5;", ready_for_review: "background:#dbeafe;color:#2563eb;", approved: "background:#dcfce7;color:#16a34a;" };
         return styles[status] || styles.missing;
     }
-
-    countNodeItems(node) {
-        let count = node.documents ? node.documents.length : 0;
-        if (node.children) {
-            Object.values(node.children).forEach(child => { count += this.countNodeItems(child); });
-        }
-        return count;
-    }
 }
@@ -0,0 +1,11 @@
+frappe.query_reports['NextCloud Sync Metrics'] = {
+    filters: [
+        {
+            fieldname: 'hours',
+            label: __('Часов'),
+            fieldtype: 'Int',
+            default: 24,
+            reqd: 1
+        }
+    ]
+};
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Отчёт NextCloud Sync Metrics: WebDAV запросы по методам и сохранения
+документов за последние N часов (данные sync_metrics.get_sync_metrics).
+"""
+
+import frappe
+
+from company_documents.sync_metrics import get_sync_metrics
+
+
+def execute(filters=None):
+	filters = frappe._dict(filters or {})
+	metrics = get_sync_metrics(filters.hours or 24)
+
+	columns = [
+		{"fieldname": "scope", "label": "Метод / сохранение", "fieldtype": "Data", "width": 200},
+		{"fieldname": "requests", "label": "Запросов", "fieldtype": "Int", "width": 100},
+		{"fieldname": "errors", "label": "Ошибок", "fieldtype": "Int", "width": 90},
+		{"fieldname": "avg_ms", "label": "Среднее, мс", "fieldtype": "Float", "width": 110},
+		{"fieldname": "p50_ms", "label": "p50, мс", "fieldtype": "Float", "width": 100},
+		{"fieldname": "p95_ms", "label": "p95, мс", "fieldtype": "Float", "width": 100},
+		{"fieldname": "bytes_sent", "label": "Отправлено, байт", "fieldtype": "Int", "width": 140},
+		{"fieldname": "bytes_received", "label": "Получено, байт", "fieldtype": "Int", "width": 140},
+	]
+
+	data = []
+	for method, stats in sorted(metrics["methods"].items()):
+		data.append(dict(stats, scope=method))
+
+	# Сохранения документа: запросов на сохранение и длительность хуков
+	saves = metrics["saves"]
+	if saves["count"]:
+		data.append(
+			{
+				"scope": f"Сохранение p50 (всего {saves['count']})",
+				"requests": saves["requests_p50"],
+				"p50_ms": saves["duration_p50_ms"],
+			}
+		)
+		data.append(
+			{"scope": "Сохранение p95", "requests": saves["requests_p95"], "p95_ms": saves["duration_p95_ms"]}
+		)
+
+	chart = {
+		"data": {
+			"labels": [row["hour"][-5:] for row in metrics["hours"]],
+			"datasets": [
+				{"name": "Запросы", "values": [row["requests"] for row in metrics["hours"]]},
+				{"name": "Ошибки", "values": [row["errors"] for row in metrics["hours"]]},
+			],
+		},
+		"type": "bar",
+	}
+
+	return columns, data, None, chart
@@ -15,11 +15,52 @@ doc_events = {
             "company_documents.nextcloud_sync.track_folder_changes",
             "company_documents.nextcloud_sync.track_file_deletions",
             "company_documents.nextcloud_sync.upload_to_nextcloud",
-            "company_documents.nextcloud_sync.delete_from_nextcloud"
+            "company_documents.nextcloud_sync.delete_from_nextcloud",
+            "company_documents.nextcloud_sync.enqueue_nextcloud_sync",
+            "company_documents.view_cache.clear_document_view_cache"
+        ],
+        "on_trash": "company_documents.view_cache.clear_document_view_cache",
+        "after_rename": "company_documents.view_cache.clear_document_view_cache"
+    },
+    "Document File": {
+        "on_update": "company_documents.view_cache.clear_document_file_view_cache",
+        "on_trash": "company_documents.view_cache.clear_document_file_view_cache"
+    },
+    "Folder Structure Template": {
+        "on_update": [
+            "company_documents.nextcloud_sync.clear_folder_path_cache",
+            "company_documents.view_cache.clear_folder_view_cache",
+            "company_documents.nextcloud_sync.queue_folder_rename"
+        ],
+        "after_rename": [
+            "company_documents.nextcloud_sync.clear_folder_path_cache",
+            "company_documents.view_cache.clear_folder_view_cache"
+        ],
+        "on_trash": [
+            "company_documents.nextcloud_sync.clear_folder_path_cache",
+            "company_documents.view_cache.clear_folder_view_cache"
         ]
+    },
+    "NextCloud Sync Settings": {
+        "on_update": "company_documents.nextcloud_sync.clear_nextcloud_config_cache"
+    },
+    "Project": {
+        "on_update": "company_documents.nextcloud_sync.clear_folder_path_cache",
+        "after_rename": "company_documents.nextcloud_sync.clear_folder_path_cache",
+        "on_trash": "company_documents.nextcloud_sync.clear_folder_path_cache"
     }
 }
 
+# Индексы под запросы API (install.py): на новых сайтах патчи не выполняются
+after_install = "company_documents.install.ensure_indexes"
+after_migrate = "company_documents.install.ensure_indexes"
+
+scheduler_events = {
+    "daily": [
+        "company_documents.custom.document.update_overdue_documents"
+    ]
+}
+
 fixtures = [
     # 1. DocTypes (фильтр по app - экспортирует ТОЛЬКО наши 5 DocTypes)
     {
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Составные индексы под горячие запросы страницы Project Documents и синхронизации.
+
+Создаются хуками after_install (новые сайты: install_app помечает патчи
+patches.txt выполненными, не запуская их) и after_migrate; патчи v0_0_3
+вызывают то же для существующих сайтов. Повторный вызов ничего не меняет.
+
+tabDocument:
+    (project, creation)                — документы проекта, ORDER BY creation DESC
+    (project, level_1, level_2)        — фильтр по папкам
+    (project, readiness_status)        — фильтр по статусу
+    (project, responsible_employee)    — фильтр по ответственному
+    (project, overdue)                 — фильтр просроченных
+
+tabDocument File:
+    (parent, uploaded_on)              — файлы документов, parent IN (...) ORDER BY parent, uploaded_on
+    (parent, file_synced)              — несинхронизированные файлы проекта
+
+tabFolder Structure Template:
+    (lft, rgt)                         — соединение по интервалам nested set (api.get_project_folder_rollup)
+"""
+
+import frappe
+
+DOCUMENT_INDEXES = {
+	"Document": [
+		("project", "creation"),
+		("project", "level_1", "level_2"),
+		("project", "readiness_status"),
+		("project", "responsible_employee"),
+		("project", "overdue"),
+	],
+	"Document File": [
+		("parent", "uploaded_on"),
+		("parent", "file_synced"),
+	],
+	"Folder Structure Template": [
+		("lft", "rgt"),
+	],
+}
+
+
+def ensure_indexes(doctypes=None):
+	"""Создать недостающие индексы DOCUMENT_INDEXES (хуки after_install / after_migrate)"""
+	for doctype, indexes in DOCUMENT_INDEXES.items():
+		if doctypes and doctype not in doctypes:
+			continue
+		if not frappe.db.table_exists(doctype):
+			continue
+
+		for fields in indexes:
+			# add_index не создаёт индекс повторно, если имя уже есть
+			frappe.db.add_index(doctype, list(fields), index_name="_".join(fields) + "_index")
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Сверка строк Document File проекта с содержимым NextCloud.
+
+Дерево проекта читается одним запросом WebDAV SEARCH (depth infinity);
+если сервер его не поддерживает — PROPFIND Depth: 1 на каждую папку
+(число запросов = число папок, а не файлов). Сравнение выполняется в памяти.
+
+Расхождения:
+    missing_remote — строка синхронизирована (file_synced = 1), файла нет в NextCloud
+    orphan_remote  — файл в папке проекта, которому не соответствует ни одна строка
+    wrong_url      — файл есть, но file_url / nc_file_id строки устарели
+
+Использование:
+    reconcile_project('PROJ-0001')              # только отчёт
+    reconcile_project('PROJ-0001', apply=True)  # исправить расхождения
+"""
+
+import os
+
+import frappe
+
+from company_documents.nextcloud_sync import (
+	build_nextcloud_file_url,
+	ensure_nextcloud_folders,
+	forget_known_folders,
+	get_nextcloud_config,
+	get_project_folder_name,
+	list_nextcloud_folder,
+	resolve_folder_path,
+	sanitize_path,
+	update_document_file_rows,
+)
+from company_documents.webdav_client import get_webdav_client, parse_folder_listing
+
+RECONCILE_BATCH_SIZE = 500
+RECONCILE_REPORTS_KEY = "nextcloud_reconcile_reports"
+# Сколько расхождений каждого типа возвращать в ответе (счётчики — полные)
+RECONCILE_SAMPLE_SIZE = 100
+
+
+def get_project_root(project):
+	"""Папка проекта в NextCloud: Projects/<project_name>"""
+	project_name = get_project_folder_name(project)
+	return f"Projects/{sanitize_path(project_name)}" if project_name else None
+
+
+def list_nextcloud_tree(folder_path, config):
+	"""
+	Все файлы поддерева NextCloud.
+
+	Returns:
+	    dict: {путь относительно NextCloud root: {name, file_id, etag, size}}
+	          или None, если папки нет
+	"""
+	client = get_webdav_client(config)
+
+	try:
+		response = client.search_tree(folder_path)
+		if response.status_code == 207:
+			files = {}
+			for href, entry in parse_folder_listing(response.content).items():
+				path = client.relative_path(href)
+				if path and not entry.get("is_dir"):
+					files[path] = entry
+			return files
+	except Exception as e:
+		frappe.log_error(title="NextCloud Search Error", message=str(e))
+
+	# Fallback: обход папок PROPFIND Depth: 1
+	files = {}
+	pending = [folder_path]
+
+	while pending:
+		current = pending.pop()
+		listing = list_nextcloud_folder(current, config)
+		if listing is None:
+			if current == folder_path:
+				return None
+			continue
+
+		for name, entry in listing.items():
+			if entry.get("is_dir"):
+				pending.append(f"{current}/{name}")
+			else:
+				files[f"{current}/{name}"] = entry
+
+	return files
+
+
+def get_project_file_rows(project):
+	"""Все строки Document File проекта с файлом (один запрос)"""
+	return frappe.db.sql(
+		"""
+        SELECT
+            df.name, df.parent, df.file, df.file_url, df.file_synced, df.nc_file_id,
+            d.level_1, d.level_2, d.level_3, d.level_4, d.level_5
+        FROM `tabDocument File` df
+        INNER JOIN `tabDocument` d ON d.name = df.parent
+        WHERE df.parenttype = 'Document'
+            AND d.project = %(project)s
+            AND IFNULL(df.file, '') != ''
+    """,
+		{"project": project},
+		as_dict=True,
+	)
+
+
+def diff_project(project, config):
+	"""
+	Сравнить строки Document File проекта с деревом NextCloud.
+
+	Returns:
+	    dict: {root, remote_files, rows, missing_remote, orphan_remote, wrong_url}
+	          missing_remote: [{row, parent, path}]
+	          orphan_remote:  [{path, file_id}]
+	          wrong_url:      [{row, parent, path, file_url, nc_file_id}]
+	"""
+	root = get_project_root(project)
+	remote = (list_nextcloud_tree(root, config) or {}) if root else {}
+	rows = get_project_file_rows(project)
+
+	diff = {
+		"root": root,
+		"remote_files": len(remote),
+		"rows": len(rows),
+		"missing_remote": [],
+		"orphan_remote": [],
+		"wrong_url": [],
+	}
+	expected = set()
+
+	for row in rows:
+		folder_path = resolve_folder_path(
+			project, [row.level_1, row.level_2, row.level_3, row.level_4, row.level_5]
+		)
+		if not folder_path:
+			continue
+
+		path = f"{folder_path}/{os.path.basename(row.file)}"
+		expected.add(path)
+
+		if not row.file_synced:
+			continue
+
+		entry = remote.get(path)
+		if not entry:
+			diff["missing_remote"].append({"row": row.name, "parent": row.parent, "path": path})
+			continue
+
+		file_id = entry.get("file_id")
+		file_url = build_nextcloud_file_url(config, folder_path, file_id)
+		if row.file_url != file_url or (row.nc_file_id or None) != file_id:
+			diff["wrong_url"].append(
+				{
+					"row": row.name,
+					"parent": row.parent,
+					"path": path,
+					"file_url": file_url,
+					"nc_file_id": file_id,
+					"etag": entry.get("etag"),
+				}
+			)
+
+	diff["orphan_remote"] = [
+		{"path": path, "file_id": entry.get("file_id")}
+		for path, entry in remote.items()
+		if path not in expected
+	]
+
+	return diff
+
+
+def apply_diff(diff, config, delete_orphans=False, batch_size=RECONCILE_BATCH_SIZE):
+	"""
+	Исправить расхождения.
+
+	- wrong_url: file_url / nc_file_id обновляются пакетным UPDATE
+	- missing_remote: если в проекте есть единственный «сирота» с тем же
+	  именем файла (например, после неудачного move_files_in_nextcloud),
+	  он перемещается на ожидаемый путь (MOVE сохраняет file_id); иначе
+	  строке ставится file_synced = 0 — файл загрузит следующая синхронизация
+	- orphan_remote: удаляются только при delete_orphans
+
+	Изменения записываются и коммитятся пакетами по batch_size строк.
+
+	Returns:
+	    dict: {fixed_urls, moved, reset, deleted, errors}
+	"""
+	client = get_webdav_client(config)
+	result = {"fixed_urls": 0, "moved": 0, "reset": 0, "deleted": 0, "errors": []}
+	updates = {}
+
+	def flush(force=False):
+		if updates and (force or len(updates) >= batch_size):
+			update_document_file_rows(updates)
+			frappe.db.commit()
+			updates.clear()
+
+	for item in diff["wrong_url"]:
+		updates[item["row"]] = {
+			"file_url": item["file_url"],
+			"nc_file_id": item["nc_file_id"],
+			"nc_etag": item["etag"],
+		}
+		result["fixed_urls"] += 1
+		flush()
+
+	orphans_by_name = {}
+	for orphan in diff["orphan_remote"]:
+		orphans_by_name.setdefault(os.path.basename(orphan["path"]), []).append(orphan)
+
+	for item in diff["missing_remote"]:
+		folder_path, filename = item["path"].rsplit("/", 1)
+		candidates = orphans_by_name.get(filename) or []
+
+		if len(candidates) == 1:
+			orphan = candidates.pop()
+			try:
+				ensure_nextcloud_folders(folder_path, config)
+				response = client.move(orphan["path"], item["path"])
+				if response.status_code == 409:
+					forget_known_folders(config, folder_path)
+					ensure_nextcloud_folders(folder_path, config, force=True)
+					response = client.move(orphan["path"], item["path"])
+
+				if response.status_code in [201, 204]:
+					orphan["moved"] = True
+					updates[item["row"]] = {
+						"file_url": build_nextcloud_file_url(config, folder_path, orphan["file_id"]),
+						"nc_file_id": orphan["file_id"],
+					}
+					result["moved"] += 1
+					flush()
+					continue
+			except Exception as e:
+				result["errors"].append(f"{orphan['path']}: {e}")
+
+		updates[item["row"]] = {"file_synced": 0, "nc_file_id": None, "nc_etag": None}
+		result["reset"] += 1
+		flush()
+
+	flush(force=True)
+
+	if delete_orphans:
+		for orphan in diff["orphan_remote"]:
+			if orphan.get("moved"):
+				continue
+			try:
+				if client.delete(orphan["path"]).status_code in [204, 404]:
+					result["deleted"] += 1
+			except Exception as e:
+				result["errors"].append(f"{orphan['path']}: {e}")
+
+	return result
+
+
+def reconcile_project(project, apply=False, delete_orphans=False):
+	"""
+	Сверить проект с NextCloud и (при apply) исправить расхождения.
+
+	При apply отчёт (с applied_at) сохраняется в RECONCILE_REPORTS_KEY —
+	его возвращает reconcile_project_with_nextcloud в поле last_apply.
+
+	Returns:
+	    dict: {project, root, remote_files, rows, counts: {...},
+	           missing_remote, orphan_remote, wrong_url (первые RECONCILE_SAMPLE_SIZE),
+	           applied: {...}, applied_at при apply}
+	"""
+	config = get_nextcloud_config()
+	if not config:
+		return {"project": project, "error": "NextCloud не настроен"}
+
+	diff = diff_project(project, config)
+	applied = apply_diff(diff, config, delete_orphans=delete_orphans) if apply else None
+
+	report = {
+		"project": project,
+		"root": diff["root"],
+		"remote_files": diff["remote_files"],
+		"rows": diff["rows"],
+		"counts": {key: len(diff[key]) for key in ("missing_remote", "orphan_remote", "wrong_url")},
+	}
+	for key in ("missing_remote", "orphan_remote", "wrong_url"):
+		report[key] = diff[key][:RECONCILE_SAMPLE_SIZE]
+
+	if applied is not None:
+		report["applied"] = applied
+		report["applied_at"] = frappe.utils.now()
+		frappe.cache.hset(RECONCILE_REPORTS_KEY, project, report)
+
+	return report
+
+
+@frappe.whitelist()
+def reconcile_project_with_nextcloud(project, apply=0, delete_orphans=0):
+	"""
+	Отчёт о расхождениях между Document File и NextCloud для проекта
+	(last_apply — результат последнего исправления).
+	apply=1 ставит исправление в очередь long (только System Manager).
+	"""
+	frappe.has_permission("Project", "read", project, throw=True)
+
+	if not frappe.utils.cint(apply):
+		report = reconcile_project(project)
+		report["last_apply"] = frappe.cache.hget(RECONCILE_REPORTS_KEY, project)
+		return report
+
+	frappe.only_for("System Manager")
+
+	job_id = f"nextcloud_reconcile::{project}"
+	frappe.enqueue(
+		"company_documents.nextcloud_reconcile.reconcile_project",
+		queue="long",
+		timeout=4 * 60 * 60,
+		job_id=job_id,
+		deduplicate=True,
+		project=project,
+		apply=True,
+		delete_orphans=bool(frappe.utils.cint(delete_orphans)),
+	)
+
+	return {"queued": True, "job_id": job_id}
@@ -1,10 +1,79 @@
 # -*- coding: utf-8 -*-
 import frappe
-import requests
-from requests.auth import HTTPBasicAuth
+import json
 from urllib.parse import quote
 from frappe.utils.password import get_decrypted_password
 import os
+import time
+
+from company_documents.sync_metrics import instrument_sync
+from company_documents.view_cache import clear_view_cache_for_file_rows
+from company_documents.webdav_client import (
+    DEFAULT_CHUNK_THRESHOLD_MB,
+    FOLDER_PROPFIND_XML,
+    file_checksum,
+    get_all_clients,
+    get_webdav_client,
+    parse_folder_listing
+)
+
+
+DEFAULT_UPLOAD_CONCURRENCY = 4
+
+# Статусы _upload_pending_files, после которых строка считается синхронизированной
+SYNCED_STATUSES = ('uploaded', 'unchanged')
+
+
+FILEID_PROPFIND_XML = '''<?xml version="1.0"?>
+<d:propfind xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns" xmlns:nc="http://nextcloud.org/ns">
+  <d:prop>
+    <oc:fileid/>
+    <nc:fileid/>
+  </d:prop>
+</d:propfind>'''
+
+
+def parse_nextcloud_file_id(content):
+    """Извлечь file_id из ответа PROPFIND (207 Multi-Status)"""
+    import xml.etree.ElementTree as ET
+    
+    root = ET.fromstring(content)
+    
+    # ✅ ПОПРОБОВАТЬ ОБА ВАРИАНТА namespace!
+    # ВАРИАНТ 1: oc:fileid (OwnCloud / старый NextCloud)
+    ns_oc = {'d': 'DAV:', 'oc': 'http://owncloud.org/ns'}
+    fileid_elem = root.find('.//oc:fileid', ns_oc)
+    
+    if fileid_elem is not None and fileid_elem.text:
+        return fileid_elem.text
+    
+    # ВАРИАНТ 2: nc:fileid (NextCloud 25+)
+    ns_nc = {'d': 'DAV:', 'nc': 'http://nextcloud.org/ns'}
+    fileid_elem = root.find('.//nc:fileid', ns_nc)
+    
+    if fileid_elem is not None and fileid_elem.text:
+        return fileid_elem.text
+    
+    # ВАРИАНТ 3: без namespace (fallback)
+    for elem in root.iter():
+        if 'fileid' in elem.tag.lower() and elem.text:
+            return elem.text
+    
+    return None
+
+
+def fetch_nextcloud_file_id(client, file_path):
+    """
+    PROPFIND file_id через WebDAV клиент. Не обращается к frappe,
+    поэтому безопасна в рабочих потоках; ошибки пробрасываются.
+    """
+    # root_path учитывает WebDAV клиент
+    response = client.propfind(file_path, FILEID_PROPFIND_XML, depth='0')
+    
+    if response.status_code == 207:
+        return parse_nextcloud_file_id(response.content)
+    
+    return None
 
 
 def get_nextcloud_file_id(file_path, config):
@@ -18,78 +87,126 @@ def get_nextcloud_file_id(file_path, config):
     Returns:
         file_id (str) или None
     """
-    import xml.etree.ElementTree as ET
-    
-    # ✅ УЧИТЫВАЕМ root_path!
-    full_path = file_path
-    if config.get('root_path') and config['root_path'] != '/':
-        full_path = f"{config['root_path'].rstrip('/')}/{file_path}"
-    
-    safe_path = quote(full_path.encode('utf-8'))
-    url = f"{config['url']}/remote.php/dav/files/{config['user']}/{safe_path}"
+    try:
+        return fetch_nextcloud_file_id(get_webdav_client(config), file_path)
     
-    propfind_xml = '''<?xml version="1.0"?>
-<d:propfind xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns" xmlns:nc="http://nextcloud.org/ns">
-  <d:prop>
-    <oc:fileid/>
-    <nc:fileid/>
-  </d:prop>
-</d:propfind>'''
+    except Exception as e:
+        frappe.log_error(title='Get NextCloud File ID Error', message=str(e))
+        return None
+
+
+def list_nextcloud_folder(folder_path, config):
+    """
+    Содержимое папки одним PROPFIND Depth: 1 (oc:fileid, getetag, getcontentlength, oc:checksums).
     
+    Returns:
+        dict: {имя файла: {file_id, etag, size, is_dir, checksums}} или None, если папки нет / ошибка
+    """
     try:
-        response = requests.request(
-            'PROPFIND',
-            url,
-            data=propfind_xml,
-            headers={'Depth': '0'},
-            auth=HTTPBasicAuth(config['user'], config['password']),
-            timeout=10
-        )
+        client = get_webdav_client(config)
+        response = client.propfind(folder_path, FOLDER_PROPFIND_XML, depth='1')
         
-        if response.status_code == 207:
-            root = ET.fromstring(response.content)
-            
-            # ✅ ПОПРОБОВАТЬ ОБА ВАРИАНТА namespace!
-            # ВАРИАНТ 1: oc:fileid (OwnCloud / старый NextCloud)
-            ns_oc = {'d': 'DAV:', 'oc': 'http://owncloud.org/ns'}
-            fileid_elem = root.find('.//oc:fileid', ns_oc)
-            
-            if fileid_elem is not None and fileid_elem.text:
-                return fileid_elem.text
-            
-            # ВАРИАНТ 2: nc:fileid (NextCloud 25+)
-            ns_nc = {'d': 'DAV:', 'nc': 'http://nextcloud.org/ns'}
-            fileid_elem = root.find('.//nc:fileid', ns_nc)
-            
-            if fileid_elem is not None and fileid_elem.text:
-                return fileid_elem.text
-            
-            # ВАРИАНТ 3: без namespace (fallback)
-            for elem in root.iter():
-                if 'fileid' in elem.tag.lower() and elem.text:
-                    return elem.text
+        if response.status_code != 207:
+            return None
         
-        return None
+        entries = parse_folder_listing(response.content)
+        folder_href = client.remote_path(folder_path).rstrip('/')
+        
+        return {
+            entry['name']: entry
+            for href, entry in entries.items()
+            if not href.endswith(f"/{folder_href}")
+        }
     
     except Exception as e:
-        frappe.log_error(title='Get NextCloud File ID Error', message=str(e))
+        frappe.log_error(title='NextCloud List Folder Error', message=str(e))
         return None
 
 
+# =============================================================================
+# КЭШ КОНФИГУРАЦИИ NextCloud
+# =============================================================================
+# Настройки читаются из БД один раз и хранятся в Redis (без пароля).
+# Пароль расшифровывается один раз на процесс; in-process копия сверяется
+# с версией в Redis. Кэш сбрасывает хук NextCloud Sync Settings.on_update.
+# Если синхронизация выключена, хуки Document завершаются после одного
+# чтения из Redis, не обращаясь к БД.
+
+NEXTCLOUD_CONFIG_KEY = 'company_documents_nextcloud_config'
+
+# In-process кэш: {site: (version, config)}
+_config_cache = {}
+
+
+def _load_nextcloud_settings():
+    """
+    Прочитать NextCloud Sync Settings из БД (без пароля) для кэша.
+    
+    Значения берутся из tabSingles как есть: поле без строки (настройки
+    сохранены до появления поля) — None, а не 0, и получает значение по
+    умолчанию из кода, а не из истории установки.
+    """
+    settings = frappe._dict(frappe.db.get_singles_dict("NextCloud Sync Settings", cast=True))
+    
+    if not settings.enabled or not settings.nc_url or not settings.nc_username:
+        return {'enabled': 0}
+    
+    # Пароль должен быть задан, но в Redis он не хранится
+    if not get_decrypted_password(
+        "NextCloud Sync Settings",
+        "NextCloud Sync Settings",
+        "nc_password",
+        raise_exception=False
+    ):
+        return {'enabled': 0}
+    
+    base_url = settings.nc_url.rstrip('/')
+    username = settings.nc_username
+    root_path = (settings.nc_root_path or '').rstrip('/')
+    
+    webdav_url = f"{base_url}/remote.php/dav/files/{username}"
+    
+    return {
+        'enabled': 1,
+        'version': frappe.generate_hash(length=12),
+        'url': base_url,
+        'user': username,
+        'username': username,
+        'root_path': root_path if root_path != '' else None,
+        'webdav_url': webdav_url,
+        # Пул соединений WebDAV клиента
+        'pool_size': settings.get('nc_pool_size') or 10,
+        'connect_timeout': settings.get('nc_connect_timeout') or 10,
+        'timeout': settings.get('nc_timeout') or 30,
+        'upload_timeout': settings.get('nc_upload_timeout') or 120,
+        'upload_concurrency': settings.get('upload_concurrency') or DEFAULT_UPLOAD_CONCURRENCY,
+        # Chunked upload (МБ); явно сохранённый chunk_threshold = 0 отключает
+        # загрузку по частям, несохранённый порог — DEFAULT_CHUNK_THRESHOLD_MB
+        'chunk_size': settings.get('chunk_size_mb') or 10,
+        'chunk_threshold': (
+            settings.chunk_threshold_mb if settings.chunk_threshold_mb is not None else DEFAULT_CHUNK_THRESHOLD_MB
+        ),
+        # По умолчанию (как default поля) — фоновая синхронизация
+        'async_sync': frappe.utils.cint(settings.async_sync if settings.async_sync is not None else 1)
+    }
 
 
 def get_nextcloud_config():
-    """Получить конфигурацию NextCloud из NextCloud Sync Settings"""
+    """Получить конфигурацию NextCloud из NextCloud Sync Settings (кэшируется)"""
     try:
-        settings = frappe.get_single("NextCloud Sync Settings")
+        cached = frappe.cache.get_value(NEXTCLOUD_CONFIG_KEY)
+        if cached is None:
+            cached = _load_nextcloud_settings()
+            frappe.cache.set_value(NEXTCLOUD_CONFIG_KEY, cached)
         
-        if not settings.enabled:
+        if not cached.get('enabled'):
             return None
         
-        if not settings.nc_url or not settings.nc_username:
-            return None
+        local = _config_cache.get(frappe.local.site)
+        if local and local[0] == cached['version']:
+            return local[1]
         
-        # Расшифровываем пароль
+        # Расшифровываем пароль (один раз на процесс и версию настроек)
         nc_password = get_decrypted_password(
             "NextCloud Sync Settings", 
             "NextCloud Sync Settings", 
@@ -100,25 +217,30 @@ def get_nextcloud_config():
         if not nc_password:
             return None
         
-        base_url = settings.nc_url.rstrip('/')
-        username = settings.nc_username
-        root_path = (settings.nc_root_path or '').rstrip('/')
+        config = {k: v for k, v in cached.items() if k not in ('enabled', 'version')}
+        config['password'] = nc_password
         
-        webdav_url = f"{base_url}/remote.php/dav/files/{username}"
-        
-        return {
-            'url': base_url,
-            'user': username,
-            'username': username,
-            'password': nc_password,
-            'root_path': root_path if root_path != '' else None,
-            'webdav_url': webdav_url
-        }
+        _config_cache[frappe.local.site] = (cached['version'], config)
+        return config
     except Exception as e:
         frappe.log_error(title='NextCloud Config Error', message=str(e))
         return None
 
 
+def clear_nextcloud_config_cache(doc=None, method=None):
+    """Сбросить кэш конфигурации. Хук: NextCloud Sync Settings.on_update"""
+    _delete_nextcloud_config_cache()
+    
+    # Ещё раз после commit: параллельный запрос до commit закэшировал бы
+    # старые URL и учётные данные до следующего сохранения настроек
+    frappe.db.after_commit.add(_delete_nextcloud_config_cache)
+
+
+def _delete_nextcloud_config_cache():
+    frappe.cache.delete_value(NEXTCLOUD_CONFIG_KEY)
+    _config_cache.pop(frappe.local.site, None)
+
+
 def sanitize_path(name):
     """Очистить имя папки от недопустимых символов"""
     return name.replace('/', '_').replace('\\', '_').strip()
@@ -127,16 +249,7 @@ def sanitize_path(name):
 def create_nextcloud_folder(path, config):
     """Создать папку в NextCloud (если не существует)"""
     try:
-        full_path = f"{config.get('root_path', '').rstrip('/')}/{path}" if config.get('root_path') and config['root_path'] != '/' else path
-        safe_path = quote(full_path.encode('utf-8'))
-        url = f"{config['url']}/remote.php/dav/files/{config['user']}/{safe_path}"
-        
-        response = requests.request(
-            'MKCOL',
-            url,
-            auth=HTTPBasicAuth(config['user'], config['password']),
-            timeout=30
-        )
+        response = get_webdav_client(config).mkcol(path)
         
         return response.status_code in [201, 405]
     except Exception as e:
@@ -144,6 +257,65 @@ def create_nextcloud_folder(path, config):
         return False
 
 
+# =============================================================================
+# КЭШ ПУТЕЙ ПАПОК (Folder Structure Template / Project)
+# =============================================================================
+# get_folder_path() вызывается несколько раз за сохранение (старый и новый
+# документ, upload, delete). Вместо frappe.get_doc() на каждый уровень:
+# - карта FST id → folder_name (один запрос, хранится в Redis)
+# - project → project_name (Redis hash)
+# - (project, level_1..level_5) → готовый путь (Redis hash)
+# Кэш сбрасывается хуками Folder Structure Template и Project.
+
+FST_FOLDER_NAMES_KEY = 'company_documents_fst_folder_names'
+PROJECT_FOLDER_NAMES_KEY = 'company_documents_project_folder_names'
+FOLDER_PATHS_KEY = 'company_documents_folder_paths'
+
+
+def get_fst_folder_names():
+    """Карта {FST id: folder_name} всех Folder Structure Template"""
+    return frappe.cache.get_value(
+        FST_FOLDER_NAMES_KEY,
+        generator=lambda: dict(frappe.get_all(
+            'Folder Structure Template',
+            fields=['name', 'folder_name'],
+            as_list=True
+        ))
+    )
+
+
+def get_project_folder_name(project):
+    """project_name проекта (имя папки проекта в NextCloud)"""
+    return frappe.cache.hget(
+        PROJECT_FOLDER_NAMES_KEY,
+        project,
+        generator=lambda: frappe.db.get_value('Project', project, 'project_name')
+    )
+
+
+def resolve_folder_path(project, levels):
+    """
+    Путь Projects/ProjectName/Level1/.../LevelN для проекта и уровней.
+    Уровни после первого пустого игнорируются.
+    """
+    project_name = get_project_folder_name(project)
+    if not project_name:
+        return None
+    
+    folder_names = get_fst_folder_names()
+    path_parts = ['Projects', sanitize_path(project_name)]
+    
+    for level_value in levels:
+        if not level_value:
+            break
+        
+        folder_name = folder_names.get(level_value)
+        if folder_name:
+            path_parts.append(sanitize_path(folder_name))
+    
+    return '/'.join(path_parts) if len(path_parts) > 2 else None
+
+
 def get_folder_path(doc):
     """
     Генерирует путь к папке на основе иерархии level_1...level_5.
@@ -152,35 +324,546 @@ def get_folder_path(doc):
     if not doc.project:
         return None
     
+    return get_cached_folder_path(doc.project, [doc.get(f'level_{i}') for i in range(1, 6)])
+
+
+def get_cached_folder_path(project, levels):
+    """resolve_folder_path() через Redis-кэш FOLDER_PATHS_KEY"""
     try:
-        project = frappe.get_doc('Project', doc.project)
-        path_parts = ['Projects', sanitize_path(project.project_name)]
-        
-        for i in range(1, 6):
-            level_field = f'level_{i}'
-            level_value = doc.get(level_field)
-            
-            if level_value:
-                try:
-                    template = frappe.get_doc('Folder Structure Template', level_value)
-                    path_parts.append(sanitize_path(template.folder_name))
-                except Exception:
-                    pass
-            else:
-                break
+        key = '|'.join([project] + [level or '' for level in levels])
         
-        return '/'.join(path_parts) if len(path_parts) > 2 else None
+        return frappe.cache.hget(
+            FOLDER_PATHS_KEY,
+            key,
+            generator=lambda: resolve_folder_path(project, levels)
+        )
     
     except Exception as e:
         frappe.log_error(title='Get Folder Path Error', message=str(e))
         return None
 
 
+def clear_folder_path_cache(doc=None, method=None, *args):
+    """
+    Сбросить кэш путей папок.
+    Хуки: Folder Structure Template (on_update, after_rename, on_trash),
+    Project (on_update при смене project_name, after_rename, on_trash).
+    """
+    if doc and doc.doctype == 'Project' and method == 'on_update' and not doc.has_value_changed('project_name'):
+        return
+    
+    _delete_folder_path_cache()
+    
+    # Ещё раз после commit: параллельный запрос между сбросом и commit
+    # закэшировал бы старые имена (кэш без TTL)
+    frappe.db.after_commit.add(_delete_folder_path_cache)
+
+
+def _delete_folder_path_cache():
+    frappe.cache.delete_value([FST_FOLDER_NAMES_KEY, PROJECT_FOLDER_NAMES_KEY, FOLDER_PATHS_KEY])
+
+
+def build_nextcloud_file_url(config, folder_path, file_id=None):
+    """Ссылка на файл в NextCloud Files UI (или на папку, если file_id неизвестен)"""
+    if file_id:
+        # NextCloud Files UI формат (с openfile=true)
+        return f"{config['url']}/apps/files/files/{file_id}?dir=/{quote(folder_path)}&openfile=true"
+    
+    # Fallback: ссылка на папку
+    return f"{config['url']}/apps/files/?dir={quote(folder_path)}"
+
+
+# =============================================================================
+# КЭШ ИЗВЕСТНЫХ ПАПОК (Redis)
+# =============================================================================
+# Папки, которые уже существуют в NextCloud, запоминаются в Redis hash
+# (ключ: сайт + NextCloud URL/пользователь/root_path, значение: время проверки).
+# Повторные сохранения не отправляют MKCOL для известных папок.
+
+KNOWN_FOLDERS_KEY = 'nextcloud_known_folders'
+KNOWN_FOLDERS_TTL = 24 * 60 * 60
+
+
+def _known_folders_key(config):
+    return f"{KNOWN_FOLDERS_KEY}::{config['url']}|{config['user']}|{config.get('root_path') or '/'}"
+
+
+def get_known_folders(config):
+    """Известные папки: {путь: время последней проверки}"""
+    folders = frappe.cache.hgetall(_known_folders_key(config)) or {}
+    return {frappe.safe_decode(path): checked_at for path, checked_at in folders.items()}
+
+
+def mark_folders_known(config, paths):
+    """Запомнить, что папки существуют в NextCloud"""
+    if not paths:
+        return
+    
+    key = _known_folders_key(config)
+    now = time.time()
+    for path in paths:
+        frappe.cache.hset(key, path, now)
+    frappe.cache.expire(frappe.cache.make_key(key), KNOWN_FOLDERS_TTL)
+
+
+def forget_known_folders(config, folder_path):
+    """Убрать папку и все вложенные папки из кэша (после удаления / перемещения)"""
+    key = _known_folders_key(config)
+    prefix = f"{folder_path}/"
+    
+    for path in get_known_folders(config):
+        if path == folder_path or path.startswith(prefix):
+            frappe.cache.hdel(key, path)
+
+
+def ensure_nextcloud_folders(folder_path, config, force=False):
+    """
+    Создать цепочку папок Projects → Project → Level1 → ...
+    MKCOL отправляется только для папок, которых нет в кэше (или кэш устарел).
+    
+    Args:
+        force: игнорировать кэш (папка пропала на сервере)
+    """
+    known = {} if force else get_known_folders(config)
+    now = time.time()
+    created = []
+    
+    path_parts = folder_path.split('/')
+    for i in range(1, len(path_parts) + 1):
+        partial_path = '/'.join(path_parts[:i])
+        
+        checked_at = known.get(partial_path)
+        if checked_at and now - checked_at < KNOWN_FOLDERS_TTL:
+            continue
+        
+        if create_nextcloud_folder(partial_path, config):
+            created.append(partial_path)
+    
+    mark_folders_known(config, created)
+
+
+def is_background_sync(config):
+    """Включён ли фоновый режим синхронизации (NextCloud Sync Settings → async_sync)"""
+    return bool(config and config.get('async_sync'))
+
+
+def update_document_file_rows(updates):
+    """
+    Записать результаты синхронизации в строки Document File одним пакетом,
+    без doc.save(): один UPDATE ... CASE на каждый набор полей.
+    
+    Args:
+        updates: {имя строки Document File: {поле: значение}}
+    """
+    groups = {}
+    for row_name, values in updates.items():
+        if values:
+            groups.setdefault(tuple(sorted(values)), []).append(row_name)
+    
+    for fields, row_names in groups.items():
+        set_clauses = []
+        params = []
+        
+        for field in fields:
+            cases = ' '.join(['WHEN %s THEN %s'] * len(row_names))
+            set_clauses.append(f"`{field}` = CASE `name` {cases} END")
+            for row_name in row_names:
+                params.extend([row_name, updates[row_name][field]])
+        
+        params.append(tuple(row_names))
+        frappe.db.sql(
+            f"UPDATE `tabDocument File` SET {', '.join(set_clauses)} WHERE `name` IN %s",
+            params
+        )
+    
+    if groups:
+        clear_view_cache_for_file_rows(list(updates))
+
+
+def apply_file_row_updates(doc, updates):
+    """
+    Записать результаты синхронизации в строки doc.files (в памяти) и в БД
+    через update_document_file_rows — вместо doc.save() внутри хука.
+    """
+    if not updates:
+        return
+    
+    for file_row in doc.files:
+        if file_row.name in updates:
+            file_row.update(updates[file_row.name])
+    
+    update_document_file_rows(updates)
+
+
+def uploaded_row_values(result):
+    """Значения полей Document File для загруженного (или совпавшего) файла"""
+    return {
+        'file_url': result['file_url'],
+        'nc_file_id': result.get('file_id'),
+        'nc_etag': result.get('etag'),
+        'file_synced': 1,
+        'uploaded_by': frappe.session.user,
+        'uploaded_on': frappe.utils.now()
+    }
+
+
+def _put_file(client, local_path, remote_path, checksum=None):
+    """
+    PUT одного файла. Выполняется в рабочем потоке, поэтому не обращается
+    к frappe (нет frappe.local в потоке). file_id определяется потом
+    одним PROPFIND на папку. Большие файлы загружаются по частям.
+    
+    checksum — SHA1, если его уже посчитала проверка неизменённых файлов
+    (иначе его посчитает upload_file).
+    """
+    response = client.upload_file(local_path, remote_path, checksum=checksum)
+    
+    if response.status_code not in [200, 201, 204]:
+        return {
+            'status': 'failed',
+            'http_status': response.status_code,
+            'message': f'HTTP {response.status_code}'
+        }
+    
+    return {'status': 'uploaded'}
+
+
+def upload_files_in_parallel(jobs, config):
+    """
+    Загрузить файлы пулом потоков ограниченного размера.
+    
+    Args:
+        jobs: [(key, local_path, remote_path[, checksum]), ...]
+        config: NextCloud конфигурация
+    
+    Returns:
+        dict: {key: {status: uploaded|failed|error, message}}
+    """
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+    
+    if not jobs:
+        return {}
+    
+    client = get_webdav_client(config)
+    concurrency = max(1, min(
+        int(config.get('upload_concurrency') or DEFAULT_UPLOAD_CONCURRENCY),
+        client.pool_size,
+        len(jobs)
+    ))
+    
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='nc-upload') as executor:
+        # Копия контекста: наблюдатель запросов (sync_metrics) виден в потоках
+        futures = {
+            job[0]: executor.submit(contextvars.copy_context().run, _put_file, client, *job[1:])
+            for job in jobs
+        }
+    
+    results = {}
+    for key, future in futures.items():
+        error = future.exception()
+        if error is None:
+            results[key] = future.result()
+        else:
+            # Логируем в основном потоке
+            frappe.log_error(title='File Upload Error', message=str(error))
+            results[key] = {'status': 'error', 'message': str(error)}
+    
+    return results
+
+
+def is_remote_file_unchanged(file_row, local_path, entry, checksum_cache=None):
+    """
+    Совпадает ли файл в NextCloud с локальным (тогда PUT не нужен).
+    
+    Сравнение: размер (getcontentlength); при равном размере — ETag файла
+    совпадает с nc_etag, записанным при последней загрузке этой строки
+    (без чтения файла). Иначе (например, строки, загруженные до появления
+    nc_etag) — SHA1 из oc:checksums; локальный SHA1 считается только в
+    этом случае.
+    
+    Args:
+        checksum_cache: dict {local_path: sha1}, чтобы не считать хэш дважды
+    """
+    if not entry or entry.get('is_dir'):
+        return False
+    
+    if entry.get('size') is None or entry['size'] != os.path.getsize(local_path):
+        return False
+    
+    etag = file_row.get('nc_etag')
+    if etag and etag == entry.get('etag'):
+        return True
+    
+    remote_sha1 = (entry.get('checksums') or {}).get('SHA1')
+    if not remote_sha1:
+        return False
+    
+    if checksum_cache is None:
+        checksum_cache = {}
+    if local_path not in checksum_cache:
+        checksum_cache[local_path] = file_checksum(local_path)
+    return checksum_cache[local_path].lower() == remote_sha1.lower()
+
+
+def plan_pending_uploads(doc, folder_path, config):
+    """План загрузки несинхронизированных файлов документа (см. plan_file_uploads)"""
+    return plan_file_uploads(doc.files, folder_path, config)
+
+
+def plan_file_uploads(file_rows, folder_path, config):
+    """
+    План загрузки несинхронизированных строк Document File (file_synced = 0)
+    одной папки.
+    
+    Одним PROPFIND Depth: 1 читается содержимое папки; файлы, которые уже
+    лежат в NextCloud с тем же содержимым (см. is_remote_file_unchanged),
+    не загружаются повторно — например, после массового сброса file_synced.
+    
+    Args:
+        file_rows: строки Document File документа или frappe._dict
+                   (name, file, file_name, file_synced, nc_etag)
+    
+    Returns:
+        tuple: (results, jobs)
+            results: [{row, file_name, status, ...}] — status уже известен
+                     для missing / error / unchanged, у остальных — нет
+            jobs: [(row name, local_path, remote_path, checksum)] для upload_files_in_parallel
+    """
+    from frappe.utils.file_manager import get_file_path
+    
+    results = []
+    candidates = []
+    
+    for file_row in file_rows:
+        if file_row.file_synced or not file_row.file:
+            continue
+        
+        result = {'row': file_row, 'file_name': file_row.file_name}
+        results.append(result)
+        
+        try:
+            local_path = get_file_path(file_row.file)
+            
+            if not os.path.exists(local_path):
+                result['status'] = 'missing'
+                continue
+            
+            result['file_name'] = os.path.basename(local_path)
+            candidates.append((result, local_path))
+        
+        except Exception as e:
+            frappe.log_error(title='File Upload Error', message=str(e))
+            result['status'] = 'error'
+            result['message'] = str(e)
+    
+    listing = (list_nextcloud_folder(folder_path, config) or {}) if candidates else {}
+    checksums = {}
+    jobs = []
+    
+    for result, local_path in candidates:
+        filename = result['file_name']
+        entry = listing.get(filename)
+        
+        try:
+            if is_remote_file_unchanged(result['row'], local_path, entry, checksums):
+                result.update({
+                    'status': 'unchanged',
+                    'file_id': entry.get('file_id'),
+                    'etag': entry.get('etag'),
+                    'file_url': build_nextcloud_file_url(config, folder_path, entry.get('file_id'))
+                })
+                continue
+        except OSError as e:
+            frappe.log_error(title='File Upload Error', message=str(e))
+        
+        jobs.append((result['row'].name, local_path, f"{folder_path}/{filename}", checksums.get(local_path)))
+    
+    return results, jobs
+
+
+def retry_conflicting_uploads(uploads, jobs, folder_path, config):
+    """
+    409 Conflict: папки из кэша нет на сервере → пересоздать цепочку
+    и повторить загрузку этих файлов. uploads обновляется на месте.
+    """
+    conflicts = [job for job in jobs if uploads[job[0]].get('http_status') == 409]
+    if conflicts:
+        forget_known_folders(config, folder_path)
+        ensure_nextcloud_folders(folder_path, config, force=True)
+        uploads.update(upload_files_in_parallel(conflicts, config))
+
+
+def apply_upload_results(results, uploads, folder_path, config):
+    """
+    Перенести результаты PUT в results; file_id и ETag всех загруженных
+    файлов папки — одним PROPFIND Depth: 1.
+    """
+    listing = {}
+    if any(uploads.get(result['row'].name, {}).get('status') == 'uploaded' for result in results):
+        listing = list_nextcloud_folder(folder_path, config) or {}
+    
+    for result in results:
+        upload = uploads.get(result['row'].name)
+        if not upload:
+            continue
+        
+        result.update(upload)
+        if upload['status'] == 'uploaded':
+            entry = listing.get(result['file_name']) or {}
+            result['file_id'] = entry.get('file_id')
+            result['etag'] = entry.get('etag')
+            result['file_url'] = build_nextcloud_file_url(config, folder_path, result['file_id'])
+    
+    return results
+
+
+def _upload_pending_files(doc, folder_path, config):
+    """
+    Загрузить несинхронизированные файлы документа (file_synced = 0)
+    параллельно (upload_concurrency потоков). Файлы с тем же содержимым
+    в NextCloud не загружаются (status = unchanged).
+    
+    Returns:
+        list: [{row, file_name, status: uploaded|unchanged|missing|failed|error, file_url, message}]
+    """
+    results, jobs = plan_pending_uploads(doc, folder_path, config)
+    
+    uploads = upload_files_in_parallel(jobs, config)
+    retry_conflicting_uploads(uploads, jobs, folder_path, config)
+    
+    return apply_upload_results(results, uploads, folder_path, config)
+
+
+def _refresh_synced_file_urls(doc, folder_path, config):
+    """
+    Обновить file_url для уже синхронизированных файлов.
+    
+    Известный nc_file_id → ссылка строится без запросов. Для остальных
+    файлов — один PROPFIND Depth: 1 на папку, file_id сохраняется в строке.
+    
+    Returns:
+        dict: {имя строки: {file_url, nc_file_id}} только для изменившихся строк
+    """
+    from frappe.utils.file_manager import get_file_path
+    
+    updates = {}
+    listing = None
+    
+    for file_row in doc.files:
+        if not file_row.file_synced or not file_row.file:
+            continue
+        
+        try:
+            file_id = file_row.get('nc_file_id')
+            
+            if not file_id:
+                local_path = get_file_path(file_row.file)
+                if not os.path.exists(local_path):
+                    continue
+                
+                if listing is None:
+                    listing = list_nextcloud_folder(folder_path, config) or {}
+                
+                file_id = (listing.get(os.path.basename(local_path)) or {}).get('file_id')
+            
+            values = {
+                'file_url': build_nextcloud_file_url(config, folder_path, file_id),
+                'nc_file_id': file_id
+            }
+            
+            if values['file_url'] != file_row.file_url or values['nc_file_id'] != file_row.get('nc_file_id'):
+                updates[file_row.name] = values
+        
+        except Exception as e:
+            frappe.log_error(title='Update file_url Error', message=str(e))
+    
+    return updates
+
+
+def _move_remote_files(doc, old_folder_path, new_folder_path, config):
+    """
+    Переместить файлы документа из старой папки в новую (WebDAV MOVE).
+    
+    MOVE сохраняет file_id, поэтому для строк с известным nc_file_id
+    PROPFIND не нужен; для остальных — один PROPFIND Depth: 1 на новую папку.
+    
+    Returns:
+        dict: {имя строки: {file_url, nc_file_id}} для перемещённых файлов
+    """
+    ensure_nextcloud_folders(new_folder_path, config)
+    
+    client = get_webdav_client(config)
+    moved = {}
+    
+    for file_row in doc.files:
+        if not file_row.file:
+            continue
+        
+        try:
+            file_name = os.path.basename(file_row.file)
+            new_remote = f"{new_folder_path}/{file_name}"
+            
+            response = client.move(f"{old_folder_path}/{file_name}", new_remote)
+            
+            if response.status_code == 409:
+                # Папки назначения нет на сервере (устаревший кэш)
+                forget_known_folders(config, new_folder_path)
+                ensure_nextcloud_folders(new_folder_path, config, force=True)
+                response = client.move(f"{old_folder_path}/{file_name}", new_remote)
+            
+            if response.status_code in [201, 204]:
+                moved[file_row.name] = {'file_name': file_name, 'nc_file_id': file_row.get('nc_file_id')}
+        
+        except Exception as e:
+            frappe.log_error(title='NextCloud Move Error', message=str(e))
+    
+    listing = None
+    if any(not values['nc_file_id'] for values in moved.values()):
+        listing = list_nextcloud_folder(new_folder_path, config) or {}
+    
+    for values in moved.values():
+        file_name = values.pop('file_name')
+        if not values['nc_file_id'] and listing:
+            values['nc_file_id'] = (listing.get(file_name) or {}).get('file_id')
+        values['file_url'] = build_nextcloud_file_url(config, new_folder_path, values['nc_file_id'])
+    
+    return moved
+
+
+def _delete_remote_files(folder_path, filenames, config):
+    """
+    Удалить файлы из папки NextCloud (WebDAV DELETE).
+    
+    Returns:
+        list: имена удалённых (или уже отсутствующих) файлов
+    """
+    client = get_webdav_client(config)
+    deleted = []
+    
+    for filename in filenames:
+        try:
+            response = client.delete(f"{folder_path}/{filename}")
+            
+            if response.status_code in [204, 404]:
+                deleted.append(filename)
+        
+        except Exception as e:
+            frappe.log_error(title="NextCloud Delete Error", message=str(e))
+    
+    return deleted
+
+
+@instrument_sync('track_folder_changes')
 def track_folder_changes(doc, method=None):
     """Отслеживает изменения полей level_1...level_5 для перемещения файлов"""
     if doc.is_new():
         return
     
+    config = get_nextcloud_config()
+    if not config:
+        return
+    
     old_doc = doc.get_doc_before_save()
     if not old_doc:
         return
@@ -191,11 +874,19 @@ def track_folder_changes(doc, method=None):
     if old_path and new_path and old_path != new_path:
         doc._folder_changed = True
         doc._old_folder_path = old_path
+        
+        # В фоновом режиме перемещение выполнит run_document_sync
+        if is_background_sync(config):
+            return
+        
         move_files_in_nextcloud(doc, old_path)
 
 
 def track_file_deletions(doc, method=None):
     """Отслеживает удаление строк из таблицы files"""
+    if not get_nextcloud_config():
+        return
+    
     old_doc = doc.get_doc_before_save()
     if not old_doc:
         return
@@ -209,115 +900,49 @@ def track_file_deletions(doc, method=None):
         doc._deleted_files = list(deleted_files)
 
 
+@instrument_sync('upload_to_nextcloud')
 def upload_to_nextcloud(doc, method=None):
     """Загрузка новых файлов в NextCloud"""
-    folder_path = get_folder_path(doc)
-    if not folder_path:
+    config = get_nextcloud_config()
+    if not config or is_background_sync(config):
         return
     
-    config = get_nextcloud_config()
-    if not config:
+    folder_path = get_folder_path(doc)
+    if not folder_path:
         return
     
-    project = frappe.get_doc('Project', doc.project)
-    create_nextcloud_folder('Projects', config)
-    create_nextcloud_folder(f"Projects/{sanitize_path(project.project_name)}", config)
+    # ✅ ОБНОВИТЬ file_url для СИНХРОНИЗИРОВАННЫХ файлов (nc_file_id → без PROPFIND)
+    updates = _refresh_synced_file_urls(doc, folder_path, config)
     
-    path_parts = folder_path.split('/')
-    for i in range(1, len(path_parts) + 1):
-        partial_path = '/'.join(path_parts[:i])
-        create_nextcloud_folder(partial_path, config)
+    # ✅ ЗАГРУЗИТЬ НОВЫЕ файлы (file_synced = 0)
+    results = []
+    if any(f.file and not f.file_synced for f in doc.files):
+        ensure_nextcloud_folders(folder_path, config)
+        results = _upload_pending_files(doc, folder_path, config)
     
     uploaded_count = 0
-    
-    for file_row in doc.files:
-        # ✅ ОБНОВИТЬ file_url для СИНХРОНИЗИРОВАННЫХ файлов
-        if file_row.file_synced:
-            try:
-                from frappe.utils.file_manager import get_file_path
-                local_path = get_file_path(file_row.file)
-                
-                if os.path.exists(local_path):
-                    filename = os.path.basename(local_path)
-                    full_path = f"{folder_path}/{filename}"
-                    
-                    # Получить file_id через PROPFIND
-                    file_id = get_nextcloud_file_id(full_path, config)
-                    
-                    if file_id:
-                        # NextCloud Files UI формат (с openfile=true)
-                        file_url = f"{config['url']}/apps/files/files/{file_id}?dir=/{quote(folder_path)}&openfile=true"
-                        file_row.file_url = file_url
-                    else:
-                        # Fallback: ссылка на папку
-                        file_url = f"{config['url']}/apps/files/?dir={quote(folder_path)}"
-                        file_row.file_url = file_url
-            
-            except Exception as e:
-                frappe.log_error(title='Update file_url Error', message=str(e))
-            
-            continue  # Пропустить загрузку (файл уже на NextCloud!)
-        
-        # ✅ ЗАГРУЗИТЬ НОВЫЙ файл (file_synced = 0)
-        
-        if not file_row.file:
-            continue
-        
-        try:
-            from frappe.utils.file_manager import get_file_path
-            local_path = get_file_path(file_row.file)
-            
-            if not os.path.exists(local_path):
-                frappe.msgprint(f'⚠️ Файл не найден: {file_row.file_name}', indicator='orange')
-                continue
-            
-            remote_path = f"{folder_path}/{os.path.basename(local_path)}"
-            
-            full_path = f"{config.get('root_path', '').rstrip('/')}/{remote_path}" if config.get('root_path') and config['root_path'] != '/' else remote_path
-            safe_path = quote(full_path.encode('utf-8'))
-            url = f"{config['url']}/remote.php/dav/files/{config['user']}/{safe_path}"
-            
-            with open(local_path, 'rb') as f:
-                response = requests.put(
-                    url,
-                    data=f,
-                    auth=HTTPBasicAuth(config['user'], config['password']),
-                    timeout=120
-                )
-            
-            if response.status_code in [200, 201, 204]:
-                filename = os.path.basename(local_path)
-                full_path = f"{folder_path}/{filename}"
-                
-                # Получить file_id через PROPFIND
-                file_id = get_nextcloud_file_id(full_path, config)
-                
-                if file_id:
-                    # NextCloud Files UI формат (с openfile=true)
-                    file_url = f"{config['url']}/apps/files/files/{file_id}?dir=/{quote(folder_path)}&openfile=true"
-                else:
-                    # Fallback: ссылка на папку
-                    file_url = f"{config['url']}/apps/files/?dir={quote(folder_path)}"
-                
-                file_row.file_url = file_url
-                file_row.file_synced = 1
-                file_row.uploaded_by = frappe.session.user
-                file_row.uploaded_on = frappe.utils.now()
-                
-                uploaded_count += 1
-                frappe.msgprint(f'✅ {filename} загружен на NextCloud', indicator='green')
+    
+    for result in results:
+        if result['status'] in SYNCED_STATUSES:
+            updates[result['row'].name] = uploaded_row_values(result)
+            
+            uploaded_count += 1
+            if result['status'] == 'uploaded':
+                frappe.msgprint(f"✅ {result['file_name']} загружен на NextCloud", indicator='green')
             else:
-                frappe.msgprint(f'❌ Ошибка загрузки {os.path.basename(local_path)}: HTTP {response.status_code}', indicator='red')
-        
-        except Exception as e:
-            frappe.log_error(title='File Upload Error', message=str(e))
-            frappe.msgprint(f'❌ Ошибка: {str(e)}', indicator='red')
+                frappe.msgprint(f"✅ {result['file_name']} уже есть в NextCloud", indicator='green')
+        elif result['status'] == 'missing':
+            frappe.msgprint(f"⚠️ Файл не найден: {result['file_name']}", indicator='orange')
+        elif result['status'] == 'failed':
+            frappe.msgprint(f"❌ Ошибка загрузки {result['file_name']}: {result['message']}", indicator='red')
+        else:
+            frappe.msgprint(f"❌ Ошибка: {result['message']}", indicator='red')
+    
+    # Результаты — в строки документа (ответ клиенту) и одним UPDATE в БД,
+    # без повторного doc.save() и второго прохода validate / on_update
+    apply_file_row_updates(doc, updates)
     
     if uploaded_count > 0:
-        doc.flags.ignore_version = True
-        doc.flags.ignore_permissions = True
-        doc.save()
-        frappe.db.commit()
         frappe.msgprint(f'💾 Синхронизировано файлов: {uploaded_count}', indicator='blue')
 
 
@@ -326,9 +951,7 @@ def delete_empty_folders_in_nextcloud(folder_path, config):
     Рекурсивно удаляет пустые папки в NextCloud.
     Начинает с самой глубокой папки и идёт вверх.
     """
-    import requests
-    from requests.auth import HTTPBasicAuth
-    from urllib.parse import quote
+    client = get_webdav_client(config)
     
     # Разбиваем путь на части
     parts = folder_path.split('/')
@@ -343,16 +966,7 @@ def delete_empty_folders_in_nextcloud(folder_path, config):
         
         try:
             # Проверяем содержимое папки через WebDAV PROPFIND
-            safe_path = quote(current_path.encode('utf-8'))
-            url = f"{config['webdav_url']}/{safe_path}"
-            
-            response = requests.request(
-                'PROPFIND',
-                url,
-                headers={'Depth': '1'},
-                auth=HTTPBasicAuth(config['username'], config['password']),
-                timeout=10
-            )
+            response = client.propfind(current_path, None, depth='1')
             
             if response.status_code != 207:
                 # Папка не существует или ошибка
@@ -368,13 +982,10 @@ def delete_empty_folders_in_nextcloud(folder_path, config):
             # Если только 1 элемент = папка пустая!
             if len(items) <= 1:
                 # Удаляем пустую папку
-                response = requests.delete(
-                    url,
-                    auth=HTTPBasicAuth(config['username'], config['password']),
-                    timeout=10
-                )
+                response = client.delete(current_path)
                 
                 if response.status_code in [204, 404]:
+                    forget_known_folders(config, current_path)
                     frappe.msgprint(f"🗑️ Удалена пустая папка: {current_path}", indicator="orange")
                 else:
                     frappe.log_error(
@@ -390,6 +1001,7 @@ def delete_empty_folders_in_nextcloud(folder_path, config):
             break
 
 
+@instrument_sync('delete_from_nextcloud')
 def delete_from_nextcloud(doc, method=None):
     """Удаление файлов из NextCloud при удалении из Document"""
     if doc.doctype != "Document":
@@ -399,33 +1011,17 @@ def delete_from_nextcloud(doc, method=None):
         return
     
     config = get_nextcloud_config()
-    folder_path = get_folder_path(doc)
+    if not config or is_background_sync(config):
+        return
     
+    folder_path = get_folder_path(doc)
     if not folder_path:
         return
     
-    if not config:
-        return
+    filenames = [os.path.basename(f) for f in doc._deleted_files]
     
-    for file_path in doc._deleted_files:
-        try:
-            filename = os.path.basename(file_path)
-            remote_path = f"{folder_path}/{filename}"
-            file_url = f"{config['webdav_url']}/{quote(remote_path)}"
-            
-            response = requests.delete(
-                file_url,
-                auth=HTTPBasicAuth(config['username'], config['password'])
-            )
-            
-            if response.status_code in [204, 404]:
-                frappe.msgprint(f"Файл удалён из NextCloud: {filename}", indicator="orange")
-        
-        except Exception as e:
-            frappe.log_error(title="NextCloud Delete Error", message=str(e))
-
-
-
+    for filename in _delete_remote_files(folder_path, filenames, config):
+        frappe.msgprint(f"Файл удалён из NextCloud: {filename}", indicator="orange")
     
     # Удаляем пустые папки после удаления файлов
     try:
@@ -434,6 +1030,7 @@ def delete_from_nextcloud(doc, method=None):
         frappe.log_error(title='Delete Empty Folders Error (Delete)', message=str(e))
 
 
+@instrument_sync('move_files_in_nextcloud')
 def move_files_in_nextcloud(doc, old_folder_path):
     """Перемещение файлов при изменении пути"""
     config = get_nextcloud_config()
@@ -444,70 +1041,614 @@ def move_files_in_nextcloud(doc, old_folder_path):
     if not new_folder_path:
         return
     
-    path_parts = new_folder_path.split('/')
-    for i in range(1, len(path_parts) + 1):
-        partial_path = '/'.join(path_parts[:i])
-        create_nextcloud_folder(partial_path, config)
+    moved = _move_remote_files(doc, old_folder_path, new_folder_path, config)
+    apply_file_row_updates(doc, moved)
+    
+    try:
+        delete_empty_folders_in_nextcloud(old_folder_path, config)
+    except Exception as e:
+        frappe.log_error(title='Delete Empty Folders Error (Move)', message=str(e))
+
+
+# =============================================================================
+# ФОНОВАЯ СИНХРОНИЗАЦИЯ (async_sync)
+# =============================================================================
+# При сохранении Document хуки только записывают намерение (intent) в Redis
+# и ставят задачу run_document_sync в очередь RQ. Загрузка, перемещение и
+# удаление файлов выполняются воркером; результат пишется прямо в строки
+# Document File. Статус задачи: get_nextcloud_sync_status(docname).
+
+SYNC_INTENTS_KEY = 'nextcloud_sync_intents'
+SYNC_STATUS_KEY = 'nextcloud_sync_status'
+# Маркер «задача документа поставлена или выполняется» (SET NX): вместо
+# deduplicate RQ, который пропускает постановку, пока задача ещё started
+SYNC_RUNNING_KEY = 'nextcloud_sync_running'
+SYNC_JOB_TIMEOUT = 1500
+
+
+def enqueue_nextcloud_sync(doc, method=None):
+    """
+    Последний хук on_update: в фоновом режиме записывает намерение
+    синхронизации и ставит задачу в очередь после commit.
+    """
+    config = get_nextcloud_config()
+    if not is_background_sync(config) or not doc.project:
+        return
     
-    moved_count = 0
+    intent = {}
     
-    for file_row in doc.files:
-        if not file_row.file:
-            continue
+    old_folder_path = getattr(doc, '_old_folder_path', None) if getattr(doc, '_folder_changed', False) else None
+    if old_folder_path:
+        intent['move_from'] = old_folder_path
+    
+    deleted_files = getattr(doc, '_deleted_files', None)
+    if deleted_files:
+        # Удалённые строки не перемещались — файлы лежат в старой папке
+        intent['delete_folder'] = old_folder_path or get_folder_path(doc)
+        intent['delete_files'] = [os.path.basename(f) for f in deleted_files]
+    
+    # Маркер загрузки пишется всегда: задача, которая уже выполняется,
+    # увидит его и сделает ещё один проход (новая задача не ставится)
+    if any(f.file and not f.file_synced for f in doc.files):
+        intent['upload'] = 1
+    
+    if not intent:
+        return
+    
+    docname = doc.name
+    frappe.db.after_commit.add(lambda: queue_document_sync(docname, intent))
+
+
+def queue_document_sync(docname, intent=None):
+    """
+    Записать намерение синхронизации и поставить задачу (одна задача на документ).
+    
+    Если задача документа уже поставлена или выполняется (маркер
+    SYNC_RUNNING_KEY занят), новая не ставится: намерение заберёт текущая.
+    """
+    if intent:
+        frappe.cache.rpush(f"{SYNC_INTENTS_KEY}:{docname}", json.dumps(intent))
+    
+    if not acquire_sync_marker(docname):
+        return
+    
+    job_id = f"nextcloud_sync::{docname}::{frappe.generate_hash(length=8)}"
+    set_sync_status(docname, 'queued', reset=True, job_id=job_id)
+    
+    frappe.enqueue(
+        'company_documents.nextcloud_sync.run_document_sync',
+        queue='long',
+        timeout=SYNC_JOB_TIMEOUT,
+        job_id=job_id,
+        docname=docname
+    )
+
+
+def acquire_sync_marker(docname):
+    """Занять маркер задачи документа; False — задачу уже выполняет другой воркер"""
+    return bool(frappe.cache.set(
+        frappe.cache.make_key(f"{SYNC_RUNNING_KEY}:{docname}"), 1, nx=True, ex=SYNC_JOB_TIMEOUT
+    ))
+
+
+def release_sync_marker(docname):
+    frappe.cache.delete_value(f"{SYNC_RUNNING_KEY}:{docname}")
+
+
+def pop_sync_intents(docname):
+    """Забрать все накопленные намерения синхронизации документа"""
+    key = f"{SYNC_INTENTS_KEY}:{docname}"
+    intents = []
+    
+    while True:
+        value = frappe.cache.lpop(key)
+        if value is None:
+            break
+        intents.append(json.loads(value))
+    
+    return intents
+
+
+def set_sync_status(docname, status, reset=False, **values):
+    """Сохранить статус фоновой синхронизации документа в Redis"""
+    current = {} if reset else (frappe.cache.hget(SYNC_STATUS_KEY, docname) or {})
+    current.update(values)
+    current['status'] = status
+    current[f'{status}_at'] = frappe.utils.now()
+    frappe.cache.hset(SYNC_STATUS_KEY, docname, current)
+
+
+@instrument_sync('run_document_sync', arg='docname')
+def run_document_sync(docname):
+    """
+    Фоновая задача: выполнить накопленные перемещения и удаления,
+    загрузить несинхронизированные файлы, записать file_url/file_synced.
+    
+    Перед выходом задача освобождает маркер SYNC_RUNNING_KEY и ещё раз
+    проверяет список намерений: намерение, записанное после последней
+    проверки (queue_document_sync не поставил задачу — маркер был занят),
+    выполняется этой же задачей, если маркер удалось занять снова, или
+    задачей, которую уже поставил queue_document_sync.
+    """
+    set_sync_status(docname, 'started')
+    summary = {'uploaded': 0, 'unchanged': 0, 'moved': 0, 'deleted': 0, 'errors': []}
+    
+    try:
+        config = get_nextcloud_config()
         
-        try:
-            file_name = os.path.basename(file_row.file)
-            old_remote = f"{old_folder_path}/{file_name}"
-            new_remote = f"{new_folder_path}/{file_name}"
+        if not config or not frappe.db.exists('Document', docname):
+            pop_sync_intents(docname)
+            set_sync_status(docname, 'skipped', **summary)
+            release_sync_marker(docname)
+            return
+        
+        attempted = set()
+        
+        while True:
+            intents = pop_sync_intents(docname)
+            doc = frappe.get_doc('Document', docname)
+            attempted.update(f.name for f in doc.files if f.file and not f.file_synced)
+            _run_sync_pass(doc, intents, config, summary)
+            frappe.db.commit()
             
-            old_full = f"{config.get('root_path', '').rstrip('/')}/{old_remote}" if config.get('root_path') and config['root_path'] != '/' else old_remote
-            new_full = f"{config.get('root_path', '').rstrip('/')}/{new_remote}" if config.get('root_path') and config['root_path'] != '/' else new_remote
+            # Новые намерения или строки файлов, добавленные пока задача выполнялась
+            if has_new_sync_work(docname, attempted):
+                continue
             
-            old_safe = quote(old_full.encode('utf-8'))
-            new_safe = quote(new_full.encode('utf-8'))
+            # Итоговый статус пишется до освобождения маркера: статус queued
+            # более новой задачи он уже не перезапишет
+            set_sync_status(docname, 'failed' if summary['errors'] else 'finished', **summary)
+            release_sync_marker(docname)
             
-            source_url = f"{config['url']}/remote.php/dav/files/{config['user']}/{old_safe}"
-            dest_url = f"{config['url']}/remote.php/dav/files/{config['user']}/{new_safe}"
+            if not frappe.cache.llen(f"{SYNC_INTENTS_KEY}:{docname}") or not acquire_sync_marker(docname):
+                break
+            set_sync_status(docname, 'started')
+    
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(title='NextCloud Background Sync Error', message=frappe.get_traceback())
+        summary['errors'].append(str(e))
+        set_sync_status(docname, 'failed', **summary)
+        release_sync_marker(docname)
+        
+        # Намерения, записанные во время прохода, не должны ждать следующего сохранения
+        if frappe.cache.llen(f"{SYNC_INTENTS_KEY}:{docname}"):
+            queue_document_sync(docname)
+
+
+def has_new_sync_work(docname, attempted):
+    """
+    Есть ли работа для ещё одного прохода: новые намерения в Redis или
+    несинхронизированные строки Document File, которых не было в прошлых
+    проходах (строки, загрузка которых не удалась, повторно не берутся).
+    """
+    if frappe.cache.llen(f"{SYNC_INTENTS_KEY}:{docname}"):
+        return True
+    
+    pending = frappe.get_all(
+        'Document File',
+        filters={'parent': docname, 'parenttype': 'Document', 'file_synced': 0, 'file': ['is', 'set']},
+        pluck='name'
+    )
+    return bool(set(pending) - attempted)
+
+
+def _run_sync_pass(doc, intents, config, summary):
+    """Один проход фоновой синхронизации документа"""
+    folder_path = get_folder_path(doc)
+    updates = {}
+    
+    for intent in intents:
+        old_folder_path = intent.get('move_from')
+        if old_folder_path and folder_path and old_folder_path != folder_path:
+            moved = _move_remote_files(doc, old_folder_path, folder_path, config)
+            for row_name, values in moved.items():
+                updates.setdefault(row_name, {}).update(values)
+            summary['moved'] += len(moved)
             
-            response = requests.request(
-                'MOVE',
-                source_url,
-                headers={'Destination': dest_url},
-                auth=HTTPBasicAuth(config['user'], config['password']),
-                timeout=30
-            )
+            try:
+                delete_empty_folders_in_nextcloud(old_folder_path, config)
+            except Exception as e:
+                frappe.log_error(title='Delete Empty Folders Error (Move)', message=str(e))
+        
+        delete_folder = intent.get('delete_folder')
+        if delete_folder and intent.get('delete_files'):
+            summary['deleted'] += len(_delete_remote_files(delete_folder, intent['delete_files'], config))
             
-            if response.status_code in [201, 204]:
-                filename = os.path.basename(file_row.file)
-                filename = os.path.basename(file_row.file)
-                full_path = f"{new_folder_path}/{filename}"
-                
-                # Получить file_id через PROPFIND
-                file_id = get_nextcloud_file_id(full_path, config)
-                
-                if file_id:
-                    # NextCloud Files UI формат (с openfile=true)
-                    file_url = f"{config['url']}/apps/files/files/{file_id}?dir=/{quote(new_folder_path)}&openfile=true"
-                else:
-                    # Fallback: ссылка на папку
-                    file_url = f"{config['url']}/apps/files/?dir={quote(new_folder_path)}"
-                
-                file_row.file_url = file_url
-                moved_count += 1
+            try:
+                delete_empty_folders_in_nextcloud(delete_folder, config)
+            except Exception as e:
+                frappe.log_error(title='Delete Empty Folders Error (Delete)', message=str(e))
+    
+    if folder_path and any(f.file and not f.file_synced for f in doc.files):
+        ensure_nextcloud_folders(folder_path, config)
         
-        except Exception as e:
-            frappe.log_error(title='NextCloud Move Error', message=str(e))
+        for result in _upload_pending_files(doc, folder_path, config):
+            if result['status'] in SYNCED_STATUSES:
+                updates.setdefault(result['row'].name, {}).update(uploaded_row_values(result))
+                summary[result['status']] += 1
+            else:
+                summary['errors'].append(f"{result['file_name']}: {result.get('message') or result['status']}")
+    
+    update_document_file_rows(updates)
+
+
+@frappe.whitelist()
+def get_nextcloud_sync_status(docname):
+    """
+    Статус фоновой синхронизации документа.
+    
+    Returns:
+        dict: {status: queued|started|finished|failed|skipped|unknown,
+               uploaded, unchanged, moved, deleted, errors, <status>_at, pending_files}
+    """
+    frappe.has_permission('Document', 'read', docname, throw=True)
+    
+    status = frappe.cache.hget(SYNC_STATUS_KEY, docname) or {'status': 'unknown'}
+    status['pending_files'] = frappe.db.count(
+        'Document File',
+        {'parent': docname, 'parenttype': 'Document', 'file_synced': 0}
+    )
+    
+    return status
+
+
+# =============================================================================
+# СИНХРОНИЗАЦИЯ ВСЕГО ПРОЕКТА
+# =============================================================================
+# sync_project_to_nextcloud(project) ставит run_project_sync в очередь long.
+# Задача одним запросом выбирает все несинхронизированные файлы проекта,
+# создаёт дерево папок один раз, загружает файлы пакетами с ограниченным
+# параллелизмом и коммитит после каждого пакета. Прогресс отправляется
+# событием realtime PROJECT_SYNC_EVENT (страница Project Documents).
+
+PROJECT_SYNC_EVENT = 'nextcloud_project_sync'
+PROJECT_SYNC_BATCH_SIZE = 50
+
+
+def get_project_pending_file_rows(project):
+    """Несинхронизированные строки Document File всех документов проекта (один запрос)"""
+    return frappe.db.sql("""
+        SELECT
+            df.name, df.parent, df.file, df.file_name, df.file_synced, df.nc_etag,
+            d.level_1, d.level_2, d.level_3, d.level_4, d.level_5
+        FROM `tabDocument File` df
+        INNER JOIN `tabDocument` d ON d.name = df.parent
+        WHERE df.parenttype = 'Document'
+            AND d.project = %(project)s
+            AND df.file_synced = 0
+            AND IFNULL(df.file, '') != ''
+        ORDER BY df.parent, df.idx
+    """, {'project': project}, as_dict=True)
+
+
+@frappe.whitelist()
+def sync_project_to_nextcloud(project):
+    """
+    Загрузить все несинхронизированные файлы проекта в NextCloud (фоновая задача).
+    
+    Returns:
+        dict: {success, queued, job_id} или {success: False, message}
+    """
+    frappe.has_permission('Project', 'read', project, throw=True)
+    frappe.has_permission('Document', 'write', throw=True)
+    
+    if not get_nextcloud_config():
+        return {'success': False, 'message': 'NextCloud не настроен'}
+    
+    job_id = f"nextcloud_project_sync::{project}"
+    frappe.enqueue(
+        'company_documents.nextcloud_sync.run_project_sync',
+        queue='long',
+        timeout=4 * 60 * 60,
+        job_id=job_id,
+        deduplicate=True,
+        project=project,
+        user=frappe.session.user
+    )
+    
+    return {'success': True, 'queued': True, 'job_id': job_id}
+
+
+def publish_project_sync_progress(progress, user=None):
+    """Отправить прогресс синхронизации проекта на страницу Project Documents"""
+    frappe.publish_realtime(PROJECT_SYNC_EVENT, progress, user=user or frappe.session.user)
+
+
+@instrument_sync('run_project_sync', doctype='Project', arg='project')
+def run_project_sync(project, user=None, batch_size=PROJECT_SYNC_BATCH_SIZE):
+    """
+    Фоновая задача: синхронизация всех файлов проекта.
+    
+    Returns:
+        dict: прогресс {project, status, total, processed, uploaded, unchanged,
+              missing, failed, errors}
+    """
+    progress = {
+        'project': project, 'status': 'planning', 'total': 0, 'processed': 0,
+        'uploaded': 0, 'unchanged': 0, 'missing': 0, 'failed': 0, 'errors': []
+    }
     
-    if moved_count > 0:
-        doc.flags.ignore_version = True
-        doc.flags.ignore_permissions = True
-        doc.save()
+    def record(results):
+        updates = {}
+        for result in results:
+            status = result.get('status')
+            if status in SYNCED_STATUSES:
+                updates[result['row'].name] = uploaded_row_values(result)
+                progress[status] += 1
+            elif status == 'missing':
+                progress['missing'] += 1
+            else:
+                progress['failed'] += 1
+                if len(progress['errors']) < 20:
+                    progress['errors'].append(f"{result['file_name']}: {result.get('message') or status}")
+        
+        progress['processed'] += len(results)
+        update_document_file_rows(updates)
         frappe.db.commit()
+        publish_project_sync_progress(progress, user)
     
     try:
-        delete_empty_folders_in_nextcloud(old_folder_path, config)
+        config = get_nextcloud_config()
+        if not config:
+            progress['status'] = 'skipped'
+            publish_project_sync_progress(progress, user)
+            return progress
+        
+        rows = get_project_pending_file_rows(project)
+        progress['total'] = len(rows)
+        publish_project_sync_progress(progress, user)
+        
+        # Группировка по папкам: путь берётся из кэша путей (get_cached_folder_path)
+        folders = {}
+        skipped = []
+        for row in rows:
+            folder_path = get_cached_folder_path(project, [row.level_1, row.level_2, row.level_3, row.level_4, row.level_5])
+            if folder_path:
+                folders.setdefault(folder_path, []).append(row)
+            else:
+                skipped.append({'row': row, 'file_name': row.file_name, 'status': 'error', 'message': 'Папка не задана'})
+        
+        # План: дерево папок создаётся один раз, содержимое каждой папки — один PROPFIND.
+        # Файлы без загрузки (unchanged / missing / error) записываются пакетами.
+        planned = []
+        ready = skipped
+        for folder_path, folder_rows in folders.items():
+            ensure_nextcloud_folders(folder_path, config)
+            results, jobs = plan_file_uploads(folder_rows, folder_path, config)
+            
+            results_by_row = {result['row'].name: result for result in results}
+            ready.extend(result for result in results if result.get('status'))
+            planned.extend((folder_path, job, results_by_row[job[0]]) for job in jobs)
+            
+            if len(ready) >= batch_size:
+                record(ready)
+                ready = []
+        
+        if ready:
+            record(ready)
+        
+        progress['status'] = 'uploading'
+        
+        # Загрузка пакетами: один пул потоков на пакет, commit после каждого
+        for start in range(0, len(planned), batch_size):
+            batch = planned[start:start + batch_size]
+            uploads = upload_files_in_parallel([job for _, job, _ in batch], config)
+            
+            by_folder = {}
+            for folder_path, job, result in batch:
+                folder_jobs, folder_results = by_folder.setdefault(folder_path, ([], []))
+                folder_jobs.append(job)
+                folder_results.append(result)
+            
+            batch_results = []
+            for folder_path, (folder_jobs, folder_results) in by_folder.items():
+                retry_conflicting_uploads(uploads, folder_jobs, folder_path, config)
+                batch_results.extend(apply_upload_results(folder_results, uploads, folder_path, config))
+            
+            record(batch_results)
+        
+        progress['status'] = 'failed' if progress['failed'] else 'finished'
+    
     except Exception as e:
-        frappe.log_error(title='Delete Empty Folders Error (Move)', message=str(e))
+        frappe.db.rollback()
+        frappe.log_error(title='NextCloud Project Sync Error', message=frappe.get_traceback())
+        progress['status'] = 'failed'
+        progress['errors'].append(str(e))
+    
+    publish_project_sync_progress(progress, user)
+    return progress
+
+
+# =============================================================================
+# ПЕРЕИМЕНОВАНИЕ ПАПКИ (Folder Structure Template.folder_name)
+# =============================================================================
+# Путь документа строится из folder_name уровней, поэтому после
+# переименования FST пути всех документов папки меняются без изменения
+# level_1..level_5 — track_folder_changes этого не видит. Хук on_update FST
+# ставит одну фоновую задачу: один WebDAV MOVE папки на каждую папку проекта
+# (вместе с вложенными папками и файлами) и пакетная замена пути в file_url
+# строк Document File.
+
+FOLDER_RENAME_MOVED_STATUSES = ('moved', 'already_moved', 'merged')
+
+
+def queue_folder_rename(doc, method=None):
+    """Хук Folder Structure Template.on_update: задача переименования после commit"""
+    old_doc = doc.get_doc_before_save()
+    if not old_doc or not old_doc.folder_name or old_doc.folder_name == doc.folder_name:
+        return
+    
+    if not doc.folder_name or not get_nextcloud_config():
+        return
+    
+    kwargs = {'fst': doc.name, 'old_name': old_doc.folder_name, 'new_name': doc.folder_name}
+    frappe.db.after_commit.add(lambda: frappe.enqueue(
+        'company_documents.nextcloud_sync.run_folder_rename',
+        queue='long',
+        timeout=60 * 60,
+        **kwargs
+    ))
+
+
+def get_fst_level(fst):
+    """Номер уровня (1..) папки FST в дереве — число предков + 1 (nested set)"""
+    bounds = frappe.db.get_value('Folder Structure Template', fst, ['lft', 'rgt'], as_dict=True)
+    if not bounds:
+        return None
+    
+    return frappe.db.sql("""
+        SELECT COUNT(*) + 1
+        FROM `tabFolder Structure Template`
+        WHERE lft < %(lft)s AND rgt > %(rgt)s
+    """, bounds)[0][0]
+
+
+def get_renamed_folder_prefixes(fst, level):
+    """Проекты и уровни 1..level документов папки fst: [{project, levels}]"""
+    level_fields = [f'level_{i}' for i in range(1, level + 1)]
+    rows = frappe.db.sql(f"""
+        SELECT DISTINCT project, {', '.join(level_fields)}
+        FROM `tabDocument`
+        WHERE level_{level} = %(fst)s AND IFNULL(project, '') != ''
+    """, {'fst': fst}, as_dict=True)
+    
+    return [{'project': row.project, 'levels': [row[f] for f in level_fields]} for row in rows]
+
+
+def _merge_remote_folder(client, old_path, new_path, config):
+    """
+    Папка назначения уже есть (например, файл загружен до задачи):
+    перенести содержимое старой папки по одному элементу.
+    
+    Returns:
+        bool: всё перенесено
+    """
+    listing = list_nextcloud_folder(old_path, config)
+    if listing is None:
+        return False
+    
+    merged = True
+    for name in listing:
+        response = client.move(f"{old_path}/{name}", f"{new_path}/{name}", overwrite=False)
+        if response.status_code not in [201, 204]:
+            merged = False
+            frappe.log_error(
+                title='NextCloud Folder Rename Error',
+                message=f"{old_path}/{name} → {new_path}/{name}: HTTP {response.status_code}"
+            )
+    
+    if merged:
+        client.delete(old_path)
+    return merged
+
+
+def move_remote_folder(old_path, new_path, config):
+    """
+    Один MOVE папки. Returns: moved | already_moved | merged | not_found | failed
+    """
+    client = get_webdav_client(config)
+    
+    try:
+        response = client.move(old_path, new_path, overwrite=False)
+        
+        if response.status_code in [201, 204]:
+            status = 'moved'
+        elif response.status_code == 404:
+            # Повторный запуск задачи: папка уже перенесена
+            exists = client.propfind(new_path, None, depth='0').status_code == 207
+            status = 'already_moved' if exists else 'not_found'
+        elif response.status_code == 412:
+            status = 'merged' if _merge_remote_folder(client, old_path, new_path, config) else 'failed'
+        else:
+            frappe.log_error(
+                title='NextCloud Folder Rename Error',
+                message=f"{old_path} → {new_path}: HTTP {response.status_code}"
+            )
+            status = 'failed'
+    
+    except Exception as e:
+        frappe.log_error(title='NextCloud Folder Rename Error', message=str(e))
+        return 'failed'
+    
+    forget_known_folders(config, old_path)
+    return status
+
+
+def rewrite_folder_file_urls(project, levels, old_path, new_path):
+    """
+    Заменить путь папки в file_url строк Document File документов папки
+    одним UPDATE (ссылки вида ...?dir=/<путь>... из build_nextcloud_file_url).
+    """
+    values = {
+        'project': project,
+        'old_file': f"dir=/{quote(old_path)}",
+        'new_file': f"dir=/{quote(new_path)}",
+        'old_dir': f"dir={quote(old_path)}",
+        'new_dir': f"dir={quote(new_path)}"
+    }
+    conditions = []
+    for i, level in enumerate(levels, start=1):
+        conditions.append(f"d.level_{i} = %(level_{i})s")
+        values[f'level_{i}'] = level
+    
+    frappe.db.sql(f"""
+        UPDATE `tabDocument File` df
+        INNER JOIN `tabDocument` d ON d.name = df.parent AND df.parenttype = 'Document'
+        SET df.file_url = REPLACE(REPLACE(df.file_url, %(old_file)s, %(new_file)s), %(old_dir)s, %(new_dir)s)
+        WHERE d.project = %(project)s AND {' AND '.join(conditions)}
+            AND (LOCATE(%(old_file)s, df.file_url) > 0 OR LOCATE(%(old_dir)s, df.file_url) > 0)
+    """, values)
+
+
+@instrument_sync('run_folder_rename', doctype='Folder Structure Template', arg='fst')
+def run_folder_rename(fst, old_name, new_name):
+    """
+    Фоновая задача: перенести папки проектов после переименования FST.
+    
+    Returns:
+        dict: {fst, old_name, new_name, folders: [{project, from, to, status}]}
+    """
+    from company_documents.view_cache import bump_view_version
+    
+    summary = {'fst': fst, 'old_name': old_name, 'new_name': new_name, 'folders': []}
+    
+    # Кэш имён папок мог быть заполнен старым folder_name между сбросом в
+    # хуке и commit — новые пути считаются по свежим данным
+    _delete_folder_path_cache()
+    
+    config = get_nextcloud_config()
+    level = get_fst_level(fst)
+    if not config or not level or level > 5:
+        return summary
+    
+    # Текущее имя (а не new_name): A → B → C сводится к одному переносу A → C
+    folder_name = sanitize_path(get_fst_folder_names().get(fst) or new_name)
+    
+    for prefix in get_renamed_folder_prefixes(fst, level):
+        new_path = resolve_folder_path(prefix['project'], prefix['levels'])
+        if not new_path:
+            continue
+        
+        # Пустой промежуточный уровень обрывает путь раньше папки fst —
+        # последний сегмент тогда не переименованная папка, переносить нечего
+        if new_path.rsplit('/', 1)[-1] != folder_name:
+            summary['folders'].append({'project': prefix['project'], 'from': None, 'to': new_path, 'status': 'skipped'})
+            continue
+        
+        old_path = f"{new_path.rsplit('/', 1)[0]}/{sanitize_path(old_name)}"
+        if old_path == new_path:
+            continue
+        
+        status = move_remote_folder(old_path, new_path, config)
+        summary['folders'].append({'project': prefix['project'], 'from': old_path, 'to': new_path, 'status': status})
+        
+        if status in FOLDER_RENAME_MOVED_STATUSES:
+            rewrite_folder_file_urls(prefix['project'], prefix['levels'], old_path, new_path)
+            bump_view_version(prefix['project'])
+            frappe.db.commit()
+    
+    return summary
 
 
 def upload_file_to_nextcloud(local_path, remote_path, config):
@@ -515,19 +1656,9 @@ def upload_file_to_nextcloud(local_path, remote_path, config):
     Загружает ОДИН файл в NextCloud.
     Используется функцией sync_document_to_nextcloud() (вызов из UI).
     """
-
+    
     try:
-        full_path = f"{config.get('root_path', '').rstrip('/')}/{remote_path}" if config.get('root_path') and config['root_path'] != '/' else remote_path
-        safe_path = quote(full_path.encode('utf-8'))
-        url = f"{config['url']}/remote.php/dav/files/{config['user']}/{safe_path}"
-        
-        with open(local_path, 'rb') as f:
-            response = requests.put(
-                url,
-                data=f,
-                auth=HTTPBasicAuth(config['user'], config['password']),
-                timeout=120
-            )
+        response = get_webdav_client(config).upload_file(local_path, remote_path)
         
         return response.status_code in [200, 201, 204]
     except Exception as e:
@@ -536,6 +1667,7 @@ def upload_file_to_nextcloud(local_path, remote_path, config):
 
 
 @frappe.whitelist()
+@instrument_sync('sync_document_to_nextcloud', arg='docname')
 def sync_document_to_nextcloud(docname):
     """
     Загружает все несинхронизированные файлы из Document в NextCloud.
@@ -558,64 +1690,33 @@ def sync_document_to_nextcloud(docname):
             frappe.msgprint('NextCloud не настроен', indicator='red')
             return {'success': False}
         
-        project = frappe.get_doc('Project', doc.project)
-        create_nextcloud_folder('Projects', config)
-        create_nextcloud_folder(f"Projects/{sanitize_path(project.project_name)}", config)
+        # Фоновый режим: загрузку выполнит run_document_sync
+        if is_background_sync(config):
+            queue_document_sync(docname)
+            return {'success': True, 'queued': True}
         
-        path_parts = folder_path.split('/')
-        for i in range(1, len(path_parts) + 1):
-            partial_path = '/'.join(path_parts[:i])
-            create_nextcloud_folder(partial_path, config)
+        ensure_nextcloud_folders(folder_path, config)
         
-        folder_url = f"{config['url']}/apps/files/?dir={quote(folder_path)}"
+        results = _upload_pending_files(doc, folder_path, config)
+        updates = {}
         
-        uploaded = 0
-        
-        for f in doc.files:
-            if f.file_synced:
-                continue
-            
-            if not f.file:
-                continue
-            
-            try:
-                from frappe.utils.file_manager import get_file_path
-                local = get_file_path(f.file)
-                
-                if not os.path.exists(local):
-                    frappe.msgprint(f'Файл не найден: {f.file_name}', indicator='orange')
-                    continue
-                
-                remote = f"{folder_path}/{os.path.basename(local)}"
-                
-                if upload_file_to_nextcloud(local, remote, config):
-                    # Получить file_id для прямой ссылки на файл
-                    filename = os.path.basename(local)
-                    full_path = f"{folder_path}/{filename}"
-                    file_id = get_nextcloud_file_id(full_path, config)
-                    
-                    if file_id:
-                        f.file_url = f"{config['url']}/apps/files/files/{file_id}?dir=/{quote(folder_path)}&openfile=true"
-                    else:
-                        f.file_url = folder_url  # Fallback на папку
-                    
-                    f.file_synced = 1
-                    uploaded += 1
-                    frappe.msgprint(f'OK {filename}', indicator='green')
-                else:
-                    frappe.msgprint(f'Ошибка загрузки: {os.path.basename(local)}', indicator='red')
-            
-            except Exception as e:
-                frappe.log_error(title='File Upload Error', message=str(e))
-                frappe.msgprint(f'Ошибка: {str(e)}', indicator='red')
+        for result in results:
+            if result['status'] in SYNCED_STATUSES:
+                updates[result['row'].name] = uploaded_row_values(result)
+                frappe.msgprint(f"OK {result['file_name']}", indicator='green')
+            elif result['status'] == 'missing':
+                frappe.msgprint(f"Файл не найден: {result['file_name']}", indicator='orange')
+            elif result['status'] == 'failed':
+                frappe.msgprint(f"Ошибка загрузки: {result['file_name']}", indicator='red')
+            else:
+                frappe.msgprint(f"Ошибка: {result['message']}", indicator='red')
         
-        if uploaded > 0:
-            doc.flags.ignore_version = True
-            doc.flags.ignore_permissions = True
-            doc.save()
+        if updates:
+            # Строки обновляются одним пакетом, без doc.save() и повторных хуков
+            update_document_file_rows(updates)
             frappe.db.commit()
-            frappe.msgprint(f'Выгружено {uploaded} файл(ов)', indicator='blue')
-            return {'success': True, 'uploaded': uploaded}
+            frappe.msgprint(f'Выгружено {len(updates)} файл(ов)', indicator='blue')
+            return {'success': True, 'uploaded': len(updates)}
         
         return {'success': False}
     
@@ -642,3 +1743,24 @@ def test_nextcloud_connection():
     except Exception as e:
         frappe.log_error(title='NextCloud Test Error', message=str(e))
         return {'success': False, 'message': str(e)}
+
+
+@frappe.whitelist()
+def get_nextcloud_client_stats(reset=False):
+    """
+    Счётчики WebDAV клиентов текущего воркера: запросы, handshakes,
+    переиспользованные соединения. Показывает эффект keep-alive пула.
+    """
+    frappe.only_for('System Manager')
+    
+    stats = []
+    for client in get_all_clients():
+        client_stats = client.get_stats()
+        client_stats['url'] = client.base_url
+        client_stats['user'] = client.user
+        stats.append(client_stats)
+        
+        if frappe.utils.cint(reset):
+            client.reset_stats()
+    
+    return stats
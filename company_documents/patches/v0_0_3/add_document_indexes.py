@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""Составные индексы tabDocument / tabDocument File на существующих сайтах (см. install.py)"""
+
+from company_documents.install import ensure_indexes
+
+
+def execute():
+	ensure_indexes(["Document", "Document File"])
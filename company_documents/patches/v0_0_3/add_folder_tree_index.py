@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""Индекс (lft, rgt) Folder Structure Template на существующих сайтах (см. install.py)"""
+
+from company_documents.install import ensure_indexes
+
+
+def execute():
+	ensure_indexes(["Folder Structure Template"])
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики синхронизации с NextCloud: каждый WebDAV запрос хуков и задач.
+
+Запрос (webdav_client.request_observer) записывается с методом, статусом,
+задержкой, байтами и хуком, который его выполнил. Записи копятся в памяти
+и после commit / rollback сбрасываются в Redis одним pipeline:
+
+    nextcloud_sync_metrics:hour:<YYYYMMDDHH>   hash, счётчики за час (TTL 8 дней):
+        req:<method> / err:<method> / ms:<method> / sent:<method> / recv:<method>
+        hist:<method>:<граница, мс>            гистограмма задержек
+        hook:<hook>:<method>                   запросы по хукам
+        saves / save_ms / save_req             сохранения документов
+    nextcloud_sync_metrics:saves               list, последние сохранения (JSON)
+
+Сохранение — все инструментированные хуки одного документа до commit
+(вложенные вызовы хуков входят в то же сохранение).
+
+Использование:
+    @instrument_sync('upload_to_nextcloud')
+    def upload_to_nextcloud(doc, method=None): ...
+
+    frappe.call('company_documents.sync_metrics.get_nextcloud_sync_metrics', hours=24)
+"""
+
+import functools
+import json
+import threading
+import time
+
+import frappe
+
+from company_documents.webdav_client import request_observer
+
+METRICS_PREFIX = "nextcloud_sync_metrics"
+METRICS_HOUR_TTL = 8 * 24 * 60 * 60
+METRICS_SAVES_LIMIT = 2000
+
+# Границы гистограммы задержек запроса, мс (последняя — всё остальное)
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class SyncRecorder:
+	"""
+	Запросы одного сохранения документа. Вызывается (как наблюдатель
+	request_observer) и из рабочих потоков загрузки — только добавляет
+	запись под блокировкой, без frappe.
+	"""
+
+	def __init__(self, doctype, name):
+		self.doctype = doctype
+		self.name = name
+		self.hook = None
+		self.depth = 0
+		self.ops = []
+		self.started = time.time()
+		self.lock = threading.Lock()
+		self.summary = {
+			"doctype": doctype,
+			"name": name,
+			"ts": round(self.started),
+			"requests": 0,
+			"errors": 0,
+			"duration_ms": 0,
+			"request_ms": 0,
+			"bytes_sent": 0,
+			"bytes_received": 0,
+			"by_method": {},
+			"hooks": {},
+		}
+
+	def __call__(self, op):
+		with self.lock:
+			self.ops.append(dict(op, hook=self.hook))
+
+	def drain(self):
+		"""Забрать накопленные запросы и добавить их в итог сохранения"""
+		with self.lock:
+			ops, self.ops = self.ops, []
+
+		summary = self.summary
+		for op in ops:
+			summary["requests"] += 1
+			summary["errors"] += 1 if is_failed(op) else 0
+			summary["request_ms"] = round(summary["request_ms"] + op["latency_ms"], 1)
+			summary["bytes_sent"] += op.get("bytes_sent") or 0
+			summary["bytes_received"] += op.get("bytes_received") or 0
+			summary["by_method"][op["method"]] = summary["by_method"].get(op["method"], 0) + 1
+			hook = summary["hooks"].setdefault(op["hook"] or "-", {"requests": 0, "ms": 0})
+			hook["requests"] += 1
+
+		return ops
+
+	def add_hook_time(self, hook, elapsed_ms):
+		summary = self.summary
+		summary["duration_ms"] = round(summary["duration_ms"] + elapsed_ms, 1)
+		entry = summary["hooks"].setdefault(hook, {"requests": 0, "ms": 0})
+		entry["ms"] = round(entry["ms"] + elapsed_ms, 1)
+
+
+def is_failed(op):
+	return bool(op.get("error")) or (op.get("status") or 0) >= 500
+
+
+def _recorders():
+	if not hasattr(frappe.local, "nextcloud_sync_recorders"):
+		frappe.local.nextcloud_sync_recorders = {}
+	return frappe.local.nextcloud_sync_recorders
+
+
+def _schedule_flush():
+	# Колбэки commit / rollback одноразовые — регистрируются заново
+	frappe.db.after_commit.add(flush_sync_metrics)
+	frappe.db.after_rollback.add(flush_sync_metrics)
+
+
+def _get_recorder(doctype, name):
+	recorders = _recorders()
+	key = (doctype, name)
+	recorder = recorders.get(key)
+
+	if recorder is None:
+		recorder = recorders[key] = SyncRecorder(doctype, name)
+		_schedule_flush()
+
+	return recorder
+
+
+def instrument_sync(hook, doctype="Document", arg="doc"):
+	"""
+	Декоратор хука / задачи синхронизации: WebDAV запросы внутри функции
+	записываются с именем хука.
+
+	Args:
+	    hook: имя хука в метриках
+	    doctype: тип документа, если передаётся имя, а не документ
+	    arg: имя первого аргумента (документ или его имя) — для вызова через
+	         frappe.enqueue с именованными аргументами
+	"""
+
+	def decorator(fn):
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			target = args[0] if args else kwargs.get(arg)
+			recorder = _get_recorder(getattr(target, "doctype", doctype), getattr(target, "name", target))
+
+			previous_hook = recorder.hook
+			token = request_observer.set(recorder)
+			recorder.hook = hook
+			recorder.depth += 1
+			started = time.perf_counter()
+
+			try:
+				return fn(*args, **kwargs)
+			finally:
+				elapsed = (time.perf_counter() - started) * 1000
+				recorder.depth -= 1
+				recorder.hook = previous_hook
+				request_observer.reset(token)
+				# Время вложенного хука уже входит во внешний
+				if previous_hook is None:
+					recorder.add_hook_time(hook, elapsed)
+
+		return wrapper
+
+	return decorator
+
+
+def _bucket(latency_ms):
+	for bound in LATENCY_BUCKETS:
+		if latency_ms <= bound:
+			return str(bound)
+	return "inf"
+
+
+def _hour_key(timestamp):
+	return frappe.cache.make_key(
+		f"{METRICS_PREFIX}:hour:{time.strftime('%Y%m%d%H', time.localtime(timestamp))}"
+	)
+
+
+def _saves_key():
+	return frappe.cache.make_key(f"{METRICS_PREFIX}:saves")
+
+
+def flush_sync_metrics():
+	"""
+	Записать накопленные запросы в Redis (after_commit / after_rollback).
+
+	Счётчики запросов пишутся при каждом commit; итог сохранения — когда
+	хуки документа завершились (commit внутри хука пишет только счётчики).
+	"""
+	recorders = _recorders()
+	if not recorders:
+		return
+
+	try:
+		pipe = frappe.cache.pipeline()
+		hour_keys = set()
+
+		for key, recorder in list(recorders.items()):
+			hour_key = _hour_key(time.time())
+
+			for op in recorder.drain():
+				method = op["method"]
+				hour_keys.add(hour_key)
+				pipe.hincrby(hour_key, f"req:{method}", 1)
+				if is_failed(op):
+					pipe.hincrby(hour_key, f"err:{method}", 1)
+				pipe.hincrby(hour_key, f"ms:{method}", round(op["latency_ms"]))
+				pipe.hincrby(hour_key, f"sent:{method}", op.get("bytes_sent") or 0)
+				pipe.hincrby(hour_key, f"recv:{method}", op.get("bytes_received") or 0)
+				pipe.hincrby(hour_key, f"hist:{method}:{_bucket(op['latency_ms'])}", 1)
+				pipe.hincrby(hour_key, f"hook:{op['hook'] or '-'}:{method}", 1)
+
+			if recorder.depth:
+				continue
+
+			recorders.pop(key)
+			summary = recorder.summary
+			# Сохранение без запросов к NextCloud не попадает в статистику
+			if not summary["requests"]:
+				continue
+
+			hour_keys.add(hour_key)
+			pipe.hincrby(hour_key, "saves", 1)
+			pipe.hincrby(hour_key, "save_ms", int(summary["duration_ms"]))
+			pipe.hincrby(hour_key, "save_req", summary["requests"])
+			pipe.lpush(_saves_key(), json.dumps(summary))
+
+		for hour_key in hour_keys:
+			pipe.expire(hour_key, METRICS_HOUR_TTL)
+		pipe.ltrim(_saves_key(), 0, METRICS_SAVES_LIMIT - 1)
+		pipe.execute()
+
+	except Exception as e:
+		# Метрики не должны ломать сохранение документа
+		frappe.log_error(title="NextCloud Sync Metrics Error", message=str(e))
+
+	# Хуки ещё выполняются (commit внутри хука) — итог запишет следующий commit
+	if recorders:
+		_schedule_flush()
+
+
+# =============================================================================
+# ЧТЕНИЕ МЕТРИК
+# =============================================================================
+
+
+def percentile(values, q):
+	"""Перцентиль q (0..100) по ближайшему рангу"""
+	if not values:
+		return None
+	ordered = sorted(values)
+	index = max(round(q / 100 * len(ordered) + 0.5) - 1, 0)
+	return ordered[min(index, len(ordered) - 1)]
+
+
+def histogram_percentile(histogram, q):
+	"""Перцентиль по гистограмме {граница: count} — верхняя граница корзины"""
+	total = sum(histogram.values())
+	if not total:
+		return None
+
+	rank = q / 100 * total
+	seen = 0
+	for bound in [*LATENCY_BUCKETS, "inf"]:
+		seen += histogram.get(str(bound), 0)
+		if seen >= rank:
+			# Хвост за последней границей — не меньше последней границы
+			return bound if bound != "inf" else LATENCY_BUCKETS[-1]
+	return None
+
+
+def read_hours(hours):
+	"""Хэши за последние hours часов: [(час, {поле: int})] от старых к новым"""
+	now = time.time()
+	keys = [
+		(time.strftime("%Y-%m-%d %H:00", time.localtime(now - i * 3600)), _hour_key(now - i * 3600))
+		for i in range(max(int(hours), 1) - 1, -1, -1)
+	]
+
+	pipe = frappe.cache.pipeline()
+	for _, key in keys:
+		pipe.execute_command("HGETALL", key)
+
+	result = []
+	for (hour, _), raw in zip(keys, pipe.execute(), strict=True):
+		values = {frappe.safe_decode(k): int(v) for k, v in (raw or {}).items()}
+		result.append((hour, values))
+	return result
+
+
+def read_saves(since):
+	"""Сохранения из списка nextcloud_sync_metrics:saves не старше since (unix time)"""
+	saves = []
+	for raw in frappe.cache.execute_command("LRANGE", _saves_key(), 0, METRICS_SAVES_LIMIT - 1) or []:
+		save = json.loads(frappe.safe_decode(raw))
+		if save["ts"] >= since:
+			saves.append(save)
+	return saves
+
+
+def get_sync_metrics(hours=24):
+	"""
+	Сводка метрик за последние hours часов.
+
+	Returns:
+	    dict: {
+	        hours: [{hour, requests, errors, saves}],
+	        methods: {method: {requests, errors, avg_ms, p50_ms, p95_ms, bytes_sent, bytes_received}},
+	        hooks: {hook: {method: requests}},
+	        saves: {count, requests_p50, requests_p95, duration_p50_ms, duration_p95_ms, slowest: [...]}
+	    }
+	"""
+	hours = max(frappe.utils.cint(hours) or 24, 1)
+	by_hour = read_hours(hours)
+
+	methods = {}
+	hooks = {}
+	timeline = []
+
+	for hour, values in by_hour:
+		row = {"hour": hour, "requests": 0, "errors": 0, "saves": values.get("saves", 0)}
+
+		for field, value in values.items():
+			kind, _, rest = field.partition(":")
+			if kind == "hook":
+				hook, _, method = rest.rpartition(":")
+				hooks.setdefault(hook, {})
+				hooks[hook][method] = hooks[hook].get(method, 0) + value
+				continue
+			if kind not in ("req", "err", "ms", "sent", "recv", "hist"):
+				continue
+
+			method, _, bucket = rest.partition(":")
+			stats = methods.setdefault(
+				method,
+				{"requests": 0, "errors": 0, "ms": 0, "bytes_sent": 0, "bytes_received": 0, "hist": {}},
+			)
+			if kind == "req":
+				stats["requests"] += value
+				row["requests"] += value
+			elif kind == "err":
+				stats["errors"] += value
+				row["errors"] += value
+			elif kind == "ms":
+				stats["ms"] += value
+			elif kind == "sent":
+				stats["bytes_sent"] += value
+			elif kind == "recv":
+				stats["bytes_received"] += value
+			else:
+				stats["hist"][bucket] = stats["hist"].get(bucket, 0) + value
+
+		timeline.append(row)
+
+	for stats in methods.values():
+		hist = stats.pop("hist")
+		stats["avg_ms"] = round(stats.pop("ms") / stats["requests"], 1) if stats["requests"] else None
+		stats["p50_ms"] = histogram_percentile(hist, 50)
+		stats["p95_ms"] = histogram_percentile(hist, 95)
+
+	saves = read_saves(time.time() - hours * 3600)
+	requests = [s["requests"] for s in saves]
+	durations = [s["duration_ms"] for s in saves]
+
+	return {
+		"hours": timeline,
+		"methods": methods,
+		"hooks": hooks,
+		"saves": {
+			"count": len(saves),
+			"requests_p50": percentile(requests, 50),
+			"requests_p95": percentile(requests, 95),
+			"duration_p50_ms": percentile(durations, 50),
+			"duration_p95_ms": percentile(durations, 95),
+			"slowest": sorted(saves, key=lambda s: s["duration_ms"], reverse=True)[:10],
+		},
+	}
+
+
+@frappe.whitelist()
+def get_nextcloud_sync_metrics(hours=24):
+	"""
+	Задержки (p50 / p95) и число WebDAV запросов по методам, хукам и
+	сохранениям документов за последние hours часов.
+	"""
+	frappe.only_for("System Manager")
+	return get_sync_metrics(hours)
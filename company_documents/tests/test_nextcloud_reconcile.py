@@ -0,0 +1,173 @@
+import os
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from company_documents.benchmarks.sync_benchmark import create_local_files
+from company_documents.benchmarks.webdav_stub import start_webdav_stub
+from company_documents.nextcloud_reconcile import (
+	RECONCILE_REPORTS_KEY,
+	apply_diff,
+	diff_project,
+	get_project_root,
+	reconcile_project,
+	reconcile_project_with_nextcloud,
+)
+from company_documents.nextcloud_sync import get_folder_path, list_nextcloud_folder
+from company_documents.webdav_client import get_webdav_client
+
+
+class TestNextCloudReconcile(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.server = start_webdav_stub()
+		cls.config = cls.server.nextcloud_config()
+		cls.folder = (
+			frappe.get_doc(
+				{
+					"doctype": "Folder Structure Template",
+					"folder_name": f"_Test Reconcile {frappe.generate_hash(length=6)}",
+				}
+			)
+			.insert(ignore_permissions=True)
+			.name
+		)
+		cls.local_files = []
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.stop()
+		for path in cls.local_files:
+			if os.path.exists(path):
+				os.remove(path)
+		super().tearDownClass()
+
+	def setUp(self):
+		for target in (
+			"company_documents.nextcloud_sync.get_nextcloud_config",
+			"company_documents.nextcloud_reconcile.get_nextcloud_config",
+		):
+			config_patch = patch(target, return_value=self.config)
+			config_patch.start()
+			self.addCleanup(config_patch.stop)
+
+		self.client = get_webdav_client(self.config)
+		self.project = (
+			frappe.get_doc(
+				{
+					"doctype": "Project",
+					"project_name": f"_Test Reconcile {frappe.generate_hash(length=6)}",
+					"status": "Open",
+				}
+			)
+			.insert(ignore_permissions=True)
+			.name
+		)
+
+	def make_document(self, file_count):
+		"""Документ проекта, файлы которого загружены в заглушку хуками on_update"""
+		files = create_local_files(file_count, 4, f"_test_reconcile_{frappe.generate_hash(length=6)}")
+		self.local_files.extend(path for _, _, path in files)
+
+		return frappe.get_doc(
+			{
+				"doctype": "Document",
+				"project": self.project,
+				"level_1": self.folder,
+				"files": [
+					{"file": file_url, "file_name": file_name, "file_synced": 0}
+					for file_url, file_name, _ in files
+				],
+			}
+		).insert(ignore_permissions=True)
+
+	def remote_path(self, doc, row):
+		return f"{get_folder_path(doc)}/{os.path.basename(row.file)}"
+
+	def get_row(self, row):
+		return frappe.db.get_value(
+			"Document File", row.name, ["file_url", "file_synced", "nc_file_id"], as_dict=True
+		)
+
+	def test_diff_detects_each_kind(self):
+		doc = self.make_document(3)
+		missing, wrong, synced = doc.files
+		self.assertTrue(all(row.file_synced for row in doc.files))
+
+		self.client.delete(self.remote_path(doc, missing))
+		frappe.db.set_value("Document File", wrong.name, "file_url", "https://wrong.example/f")
+		orphan_path = f"{get_project_root(self.project)}/_orphan.bin"
+		self.client.put(orphan_path, b"orphan")
+
+		diff = diff_project(self.project, self.config)
+
+		self.assertEqual(diff["rows"], 3)
+		self.assertEqual([item["row"] for item in diff["missing_remote"]], [missing.name])
+		self.assertEqual([item["row"] for item in diff["wrong_url"]], [wrong.name])
+		self.assertEqual(diff["wrong_url"][0]["file_url"], wrong.file_url)
+		self.assertEqual([item["path"] for item in diff["orphan_remote"]], [orphan_path])
+		self.assertNotIn(synced.name, {item["row"] for item in diff["missing_remote"] + diff["wrong_url"]})
+
+	def test_apply_fixes_urls_and_resets_missing_files(self):
+		doc = self.make_document(2)
+		wrong, missing = doc.files
+		frappe.db.set_value("Document File", wrong.name, "file_url", "https://wrong.example/f")
+		self.client.delete(self.remote_path(doc, missing))
+
+		result = apply_diff(diff_project(self.project, self.config), self.config)
+
+		self.assertEqual((result["fixed_urls"], result["moved"], result["reset"]), (1, 0, 1))
+		self.assertEqual(self.get_row(wrong).file_url, wrong.file_url)
+
+		reset = self.get_row(missing)
+		self.assertEqual(reset.file_synced, 0)
+		self.assertFalse(reset.nc_file_id)
+
+	def test_apply_moves_single_orphan_with_same_name(self):
+		doc = self.make_document(1)
+		row = doc.files[0]
+		path = self.remote_path(doc, row)
+		filename = os.path.basename(path)
+
+		elsewhere = f"{get_project_root(self.project)}/_Elsewhere"
+		self.client.mkcol(elsewhere)
+		self.client.move(path, f"{elsewhere}/{filename}")
+
+		diff = diff_project(self.project, self.config)
+		self.assertEqual(len(diff["missing_remote"]), 1)
+		self.assertEqual(len(diff["orphan_remote"]), 1)
+
+		result = apply_diff(diff, self.config)
+
+		self.assertEqual((result["moved"], result["reset"]), (1, 0))
+		self.assertIn(filename, list_nextcloud_folder(get_folder_path(doc), self.config))
+		moved = self.get_row(row)
+		self.assertEqual(moved.file_synced, 1)
+		self.assertEqual(moved.nc_file_id, row.nc_file_id)
+		self.assertEqual(diff_project(self.project, self.config)["orphan_remote"], [])
+
+	def test_orphans_deleted_only_on_request(self):
+		self.make_document(1)
+		orphan_path = f"{get_project_root(self.project)}/_orphan.bin"
+		self.client.put(orphan_path, b"orphan")
+
+		self.assertEqual(apply_diff(diff_project(self.project, self.config), self.config)["deleted"], 0)
+		self.assertEqual(len(diff_project(self.project, self.config)["orphan_remote"]), 1)
+
+		result = apply_diff(diff_project(self.project, self.config), self.config, delete_orphans=True)
+		self.assertEqual(result["deleted"], 1)
+		self.assertEqual(diff_project(self.project, self.config)["orphan_remote"], [])
+
+	def test_status_returns_last_apply(self):
+		frappe.cache.hdel(RECONCILE_REPORTS_KEY, self.project)
+		self.assertIsNone(reconcile_project_with_nextcloud(self.project)["last_apply"])
+
+		applied = reconcile_project(self.project, apply=True)
+		self.assertIn("applied", applied)
+		self.assertTrue(applied["applied_at"])
+
+		last_apply = reconcile_project_with_nextcloud(self.project)["last_apply"]
+		self.assertEqual(last_apply["applied_at"], applied["applied_at"])
+		self.assertEqual(last_apply["applied"], applied["applied"])
@@ -0,0 +1,241 @@
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import frappe
+from frappe.model.document import Document
+from frappe.tests.utils import FrappeTestCase
+
+from company_documents.benchmarks.webdav_stub import start_webdav_stub
+from company_documents.nextcloud_reconcile import get_project_root
+from company_documents.nextcloud_sync import is_remote_file_unchanged, run_folder_rename
+
+
+@contextmanager
+def count_document_events():
+	"""Вызовы save() и событий (validate, on_update, ...) документов Document внутри блока"""
+	calls = []
+	original_save = Document.save
+	original_run_method = Document.run_method
+
+	def counting_save(doc, *args, **kwargs):
+		if doc.doctype == "Document":
+			calls.append("save")
+		return original_save(doc, *args, **kwargs)
+
+	def counting_run_method(doc, method, *args, **kwargs):
+		if doc.doctype == "Document":
+			calls.append(method)
+		return original_run_method(doc, method, *args, **kwargs)
+
+	with (
+		patch.object(Document, "save", counting_save),
+		patch.object(Document, "run_method", counting_run_method),
+	):
+		yield calls
+
+
+class TestNextCloudSync(FrappeTestCase):
+	FILES_PER_SAVE = 3
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.server = start_webdav_stub()
+		suffix = frappe.generate_hash(length=6)
+
+		project = frappe.get_doc(
+			{"doctype": "Project", "project_name": f"_Test Sync {suffix}", "status": "Open"}
+		).insert(ignore_permissions=True)
+		cls.project = project.name
+
+		cls.folder = (
+			frappe.get_doc({"doctype": "Folder Structure Template", "folder_name": f"_Test Folder {suffix}"})
+			.insert(ignore_permissions=True)
+			.name
+		)
+
+		cls.local_files = []
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.stop()
+		for path in cls.local_files:
+			if os.path.exists(path):
+				os.remove(path)
+		super().tearDownClass()
+
+	def setUp(self):
+		config_patch = patch(
+			"company_documents.nextcloud_sync.get_nextcloud_config",
+			return_value=self.server.nextcloud_config(),
+		)
+		config_patch.start()
+		self.addCleanup(config_patch.stop)
+
+	def make_file_rows(self, count):
+		"""Строки Document File с локальными файлами в private/files"""
+		folder = frappe.get_site_path("private", "files")
+		os.makedirs(folder, exist_ok=True)
+
+		rows = []
+		for _ in range(count):
+			file_name = f"_test_sync_{frappe.generate_hash(length=8)}.bin"
+			path = os.path.join(folder, file_name)
+			with open(path, "wb") as f:
+				f.write(os.urandom(4096))
+			self.local_files.append(path)
+			rows.append({"file": f"/private/files/{file_name}", "file_name": file_name, "file_synced": 0})
+		return rows
+
+	def assert_single_pass(self, calls):
+		self.assertEqual(calls.count("validate"), 1, calls)
+		self.assertEqual(calls.count("on_update"), 1, calls)
+
+	def assert_files_synced(self, doc):
+		rows = frappe.get_all(
+			"Document File",
+			filters={"parent": doc.name, "parenttype": "Document"},
+			fields=["file_synced", "nc_file_id", "file_url"],
+		)
+		self.assertEqual(len(rows), len(doc.files))
+		for row in rows:
+			self.assertEqual(row.file_synced, 1)
+			self.assertTrue(row.nc_file_id)
+			self.assertTrue(row.file_url)
+
+		self.assertEqual(self.server.count_files(get_project_root(self.project)), len(doc.files))
+
+	def test_upload_runs_hooks_once(self):
+		doc = frappe.get_doc(
+			{
+				"doctype": "Document",
+				"project": self.project,
+				"level_1": self.folder,
+				"files": self.make_file_rows(self.FILES_PER_SAVE),
+			}
+		)
+
+		with count_document_events() as calls:
+			doc.insert(ignore_permissions=True)
+
+		self.assert_single_pass(calls)
+		self.assertNotIn("save", calls)
+		self.assert_files_synced(doc)
+
+		# Добавление файлов к существующему документу — тоже один проход
+		doc.reload()
+		for row in self.make_file_rows(self.FILES_PER_SAVE):
+			doc.append("files", row)
+
+		with count_document_events() as calls:
+			doc.save(ignore_permissions=True)
+
+		self.assert_single_pass(calls)
+		self.assertEqual(calls.count("save"), 1, calls)
+		# Хуки не пересохраняют документ: modified в БД — от этого save()
+		self.assertEqual(frappe.db.get_value("Document", doc.name, "modified"), doc.modified)
+		self.assert_files_synced(doc)
+
+
+class TestRemoteFileUnchanged(FrappeTestCase):
+	"""Решение «не загружать повторно» (is_remote_file_unchanged)"""
+
+	def setUp(self):
+		content = os.urandom(2048)
+		with tempfile.NamedTemporaryFile(delete=False) as f:
+			f.write(content)
+		self.path = f.name
+		self.addCleanup(os.remove, self.path)
+		self.sha1 = hashlib.sha1(content).hexdigest()
+
+	def entry(self, **values):
+		return dict({"size": 2048, "etag": '"etag-1"', "checksums": {}}, **values)
+
+	def test_size_mismatch(self):
+		row = frappe._dict(nc_etag='"etag-1"')
+		self.assertFalse(is_remote_file_unchanged(row, self.path, self.entry(size=100)))
+
+	def test_missing_or_folder(self):
+		row = frappe._dict(nc_etag='"etag-1"')
+		self.assertFalse(is_remote_file_unchanged(row, self.path, None))
+		self.assertFalse(is_remote_file_unchanged(row, self.path, self.entry(is_dir=True)))
+
+	def test_etag_match_skips_hashing(self):
+		row = frappe._dict(nc_etag='"etag-1"')
+		with patch("company_documents.nextcloud_sync.file_checksum") as file_checksum:
+			self.assertTrue(
+				is_remote_file_unchanged(row, self.path, self.entry(checksums={"SHA1": "0" * 40}))
+			)
+		file_checksum.assert_not_called()
+
+	def test_legacy_row_without_etag_uses_checksum(self):
+		row = frappe._dict(nc_etag=None)
+		checksums = {}
+		self.assertTrue(
+			is_remote_file_unchanged(row, self.path, self.entry(checksums={"SHA1": self.sha1}), checksums)
+		)
+		self.assertEqual(checksums, {self.path: self.sha1})
+		self.assertFalse(is_remote_file_unchanged(row, self.path, self.entry(checksums={"SHA1": "0" * 40})))
+
+	def test_stale_etag_falls_back_to_checksum(self):
+		row = frappe._dict(nc_etag='"etag-old"')
+		self.assertTrue(is_remote_file_unchanged(row, self.path, self.entry(checksums={"SHA1": self.sha1})))
+
+	def test_no_etag_and_no_checksum(self):
+		row = frappe._dict(nc_etag=None)
+		with patch("company_documents.nextcloud_sync.file_checksum") as file_checksum:
+			self.assertFalse(is_remote_file_unchanged(row, self.path, self.entry()))
+		file_checksum.assert_not_called()
+
+
+class TestFolderRename(FrappeTestCase):
+	"""Пути переноса run_folder_rename (WebDAV MOVE подменён)"""
+
+	def setUp(self):
+		suffix = frappe.generate_hash(length=6)
+		self.project = (
+			frappe.get_doc({"doctype": "Project", "project_name": f"_Test Rename {suffix}", "status": "Open"})
+			.insert(ignore_permissions=True)
+			.name
+		)
+		self.parent, self.renamed = (
+			frappe.get_doc({"doctype": "Folder Structure Template", "folder_name": f"_Test {name} {suffix}"})
+			.insert(ignore_permissions=True)
+			.name
+			for name in ("Parent", "Renamed")
+		)
+		self.folder_name = frappe.db.get_value("Folder Structure Template", self.renamed, "folder_name")
+
+	def rename(self, levels):
+		prefixes = [{"project": self.project, "levels": levels}]
+		with (
+			patch(
+				"company_documents.nextcloud_sync.get_nextcloud_config", return_value={"url": "http://stub"}
+			),
+			patch("company_documents.nextcloud_sync.get_fst_level", return_value=len(levels)),
+			patch("company_documents.nextcloud_sync.get_renamed_folder_prefixes", return_value=prefixes),
+			patch("company_documents.nextcloud_sync.move_remote_folder", return_value="not_found") as move,
+		):
+			summary = run_folder_rename(self.renamed, "_Old Name", self.folder_name)
+		return summary["folders"], move
+
+	def test_moves_renamed_folder(self):
+		folders, move = self.rename([self.parent, self.renamed])
+
+		move.assert_called_once()
+		old_path, new_path = move.call_args.args[:2]
+		self.assertEqual(old_path.rsplit("/", 1), [new_path.rsplit("/", 1)[0], "_Old Name"])
+		self.assertEqual(new_path.rsplit("/", 1)[-1], self.folder_name)
+		self.assertEqual(folders[0]["status"], "not_found")
+
+	def test_gap_level_is_skipped(self):
+		# level_2 пуст: путь обрывается на Parent, его переносить нельзя
+		folders, move = self.rename([self.parent, None, self.renamed])
+
+		move.assert_not_called()
+		self.assertEqual(len(folders), 1)
+		self.assertEqual(folders[0]["status"], "skipped")
+		self.assertFalse(folders[0]["to"].endswith(self.folder_name))
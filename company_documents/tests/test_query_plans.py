@@ -0,0 +1,32 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from company_documents.benchmarks.query_plans import (
+	CHECKED_TABLES,
+	MIN_TABLE_ROWS,
+	check_query_plans,
+	get_table_rows,
+)
+from company_documents.bulk import generate_documents
+
+
+class TestQueryPlans(FrappeTestCase):
+	"""Запросы API не делают полный просмотр tabDocument / tabDocument File"""
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.project = f"_Test Query Plans {frappe.generate_hash(length=6)}"
+		# Таблицы меньше MIN_TABLE_ROWS проверка пропускает
+		generate_documents(cls.project, MIN_TABLE_ROWS + 200, max_files=2, seed=cls.project)
+		for table in CHECKED_TABLES:
+			frappe.db.sql(f"ANALYZE TABLE `{table}`")
+
+	def test_tables_are_checked(self):
+		for table in CHECKED_TABLES:
+			self.assertGreaterEqual(get_table_rows(table), MIN_TABLE_ROWS, table)
+
+	def test_no_full_scans(self):
+		# AssertionError со списком endpoint → таблица, если индекса нет
+		plans = check_query_plans(self.project, verbose=False)
+		self.assertTrue(plans)
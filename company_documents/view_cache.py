@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш ответов API страницы Project Documents в Redis.
+
+Ключ ответа: вид (overview / tree / view / rollup / children) + проект + версия + хэш параметров.
+Версия = глобальный счётчик (названия папок FST) + счётчик проекта.
+Любое изменение документов проекта увеличивает счётчик — старые ответы
+больше не читаются и истекают по TTL. Тёплая загрузка страницы не
+обращается к tabDocument.
+
+Сброс (увеличение версии):
+    Document          on_update / on_trash / after_rename
+    Document File     on_update / on_trash, update_document_file_rows()
+    Folder Structure Template  on_update / after_rename / on_trash (глобально)
+
+Использование:
+    return cached_project_view('overview', project, args, lambda: compute())
+"""
+
+import hashlib
+
+import frappe
+
+VIEW_CACHE_PREFIX = "project_documents_view"
+VIEW_VERSION_PREFIX = "project_documents_view_version"
+VIEW_STATS_KEY = "project_documents_view_stats"
+VIEW_CACHE_TTL = 6 * 60 * 60
+
+# Версия для всех проектов (меняется при изменении Folder Structure Template)
+GLOBAL_VERSION = "__all__"
+
+
+def _version_key(project):
+	return frappe.cache.make_key(f"{VIEW_VERSION_PREFIX}:{project}")
+
+
+def get_view_version(project):
+	"""Текущая версия кэша проекта: '<глобальная>.<проекта>'"""
+	global_version, project_version = frappe.cache.mget([_version_key(GLOBAL_VERSION), _version_key(project)])
+	return f"{int(global_version or 0)}.{int(project_version or 0)}"
+
+
+def bump_view_version(*projects):
+	"""
+	Сбросить кэш проектов (без проектов — всех проектов).
+
+	Версия увеличивается после commit: иначе параллельный запрос мог бы
+	закэшировать ещё не закоммиченное состояние под новой версией.
+	"""
+	projects = {p for p in projects if p} if projects else {GLOBAL_VERSION}
+
+	def incr():
+		for project in projects:
+			frappe.cache.incr(_version_key(project))
+
+	frappe.db.after_commit.add(incr)
+
+
+def _count(kind, result):
+	frappe.cache.hincrby(frappe.cache.make_key(VIEW_STATS_KEY), f"{kind}:{result}", 1)
+
+
+def cached_project_view(kind, project, args, compute):
+	"""
+	Вернуть ответ из кэша или вычислить и сохранить.
+
+	Args:
+	    kind: вид ответа (overview, tree, view, rollup, children)
+	    project: имя проекта
+	    args: dict параметров запроса (входят в ключ)
+	    compute: функция без аргументов, вычисляющая ответ
+	"""
+	args_hash = hashlib.md5(
+		frappe.as_json({k: v for k, v in (args or {}).items() if v not in (None, "")}, indent=None).encode()
+	).hexdigest()[:16]
+	key = f"{VIEW_CACHE_PREFIX}:{kind}:{project}:{get_view_version(project)}:{args_hash}"
+
+	payload = frappe.cache.get_value(key)
+	if payload is not None:
+		_count(kind, "hit")
+		return payload
+
+	_count(kind, "miss")
+	payload = compute()
+	frappe.cache.set_value(key, payload, expires_in_sec=VIEW_CACHE_TTL)
+	return payload
+
+
+# =============================================================================
+# ХУКИ
+# =============================================================================
+
+
+def clear_document_view_cache(doc, method=None, *args):
+	"""Document: on_update / on_trash / after_rename"""
+	projects = [doc.get("project")]
+
+	old_doc = doc.get_doc_before_save() if method == "on_update" else None
+	if old_doc and old_doc.get("project") != doc.get("project"):
+		projects.append(old_doc.get("project"))
+
+	bump_view_version(*projects)
+
+
+def clear_document_file_view_cache(doc, method=None, *args):
+	"""Document File: on_update / on_trash (изменения вне сохранения Document)"""
+	if doc.get("parenttype") == "Document" and doc.get("parent"):
+		bump_view_version(frappe.db.get_value("Document", doc.parent, "project"))
+
+
+def clear_folder_view_cache(doc=None, method=None, *args):
+	"""Folder Structure Template: названия папок есть в ответах всех проектов"""
+	bump_view_version()
+
+
+def clear_view_cache_for_file_rows(row_names):
+	"""Сбросить кэш проектов, которым принадлежат строки Document File"""
+	if not row_names:
+		return
+
+	projects = frappe.db.sql_list(
+		"""
+        SELECT DISTINCT d.project
+        FROM `tabDocument File` df
+        INNER JOIN `tabDocument` d ON d.name = df.parent
+        WHERE df.name IN %(names)s AND df.parenttype = 'Document'
+    """,
+		{"names": tuple(row_names)},
+	)
+
+	if projects:
+		bump_view_version(*projects)
+
+
+@frappe.whitelist()
+def get_view_cache_stats(reset=False):
+	"""
+	Счётчики попаданий и промахов кэша по видам ответа.
+
+	Returns:
+	    dict: {kind: {hit, miss, hit_rate}}
+	"""
+	frappe.only_for("System Manager")
+
+	key = frappe.cache.make_key(VIEW_STATS_KEY)
+	# Значения счётчиков не pickle — читаем без RedisWrapper.hgetall
+	raw = frappe.cache.execute_command("HGETALL", key) or {}
+
+	stats = {}
+	for field, value in raw.items():
+		kind, _, result = frappe.safe_decode(field).partition(":")
+		stats.setdefault(kind, {"hit": 0, "miss": 0})[result] = int(value)
+
+	for values in stats.values():
+		total = values["hit"] + values["miss"]
+		values["hit_rate"] = round(values["hit"] / total, 3) if total else 0
+
+	if frappe.utils.cint(reset):
+		frappe.cache.delete(key)
+
+	return stats
@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+"""
+WebDAV клиент для NextCloud.
+
+Один клиент на воркер (процесс): пул keep-alive соединений через
+requests.Session, общая авторизация и заголовки, настраиваемые размер
+пула и таймауты. Клиент считает запросы и TCP/TLS handshakes, чтобы была
+видна экономия от переиспользования соединений.
+
+Большие файлы загружаются по частям (NextCloud chunking v2) с
+продолжением прерванной загрузки.
+
+Использование:
+    client = get_webdav_client(config)
+    client.request('MKCOL', 'Projects/TEST')
+    client.upload_file('/path/to/file.pdf', 'Projects/TEST/file.pdf')
+"""
+
+import contextvars
+import hashlib
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from urllib.parse import quote, unquote, urlparse
+from xml.sax.saxutils import escape
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+from requests.utils import super_len
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_TIMEOUT = 30
+DEFAULT_UPLOAD_TIMEOUT = 120
+DEFAULT_CHUNK_SIZE_MB = 10
+DEFAULT_CHUNK_THRESHOLD_MB = 50
+
+FOLDER_PROPFIND_XML = """<?xml version="1.0"?>
+<d:propfind xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns" xmlns:nc="http://nextcloud.org/ns">
+  <d:prop>
+    <oc:fileid/>
+    <d:getetag/>
+    <d:getcontentlength/>
+    <d:resourcetype/>
+    <oc:checksums/>
+  </d:prop>
+</d:propfind>"""
+
+
+TREE_SEARCH_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<d:searchrequest xmlns:d="DAV:" xmlns:oc="http://owncloud.org/ns">
+  <d:basicsearch>
+    <d:select>
+      <d:prop>
+        <oc:fileid/>
+        <d:getetag/>
+        <d:getcontentlength/>
+        <d:resourcetype/>
+        <oc:checksums/>
+      </d:prop>
+    </d:select>
+    <d:from>
+      <d:scope>
+        <d:href>{scope}</d:href>
+        <d:depth>infinity</d:depth>
+      </d:scope>
+    </d:from>
+    <d:where>
+      <d:not>
+        <d:is-collection/>
+      </d:not>
+    </d:where>
+  </d:basicsearch>
+</d:searchrequest>"""
+
+
+# Наблюдатель запросов текущего контекста (sync_metrics): вызывается для каждого
+# запроса с {method, status, latency_ms, bytes_sent, bytes_received, error}.
+# ContextVar, а не атрибут клиента: клиент общий для процесса, а рабочие
+# потоки загрузки получают контекст через contextvars.copy_context().
+request_observer = contextvars.ContextVar("nextcloud_request_observer", default=None)
+
+
+def parse_folder_listing(content):
+	"""
+	Разобрать ответ PROPFIND Depth: 1.
+
+	Returns:
+	    dict: {href без завершающего '/': {name, file_id, etag, size, is_dir, checksums}}
+	    checksums: {'SHA1': '...', 'MD5': '...'} — если NextCloud их хранит
+	"""
+	ns = {"d": "DAV:", "oc": "http://owncloud.org/ns"}
+	root = ET.fromstring(content)
+	entries = {}
+
+	for response in root.findall("d:response", ns):
+		href = unquote(response.findtext("d:href", default="", namespaces=ns)).rstrip("/")
+
+		props = {}
+		for propstat in response.findall("d:propstat", ns):
+			if " 200 " not in (propstat.findtext("d:status", default="", namespaces=ns) or ""):
+				continue
+			prop = propstat.find("d:prop", ns)
+			if prop is not None:
+				props["file_id"] = prop.findtext("oc:fileid", namespaces=ns)
+				props["etag"] = (prop.findtext("d:getetag", namespaces=ns) or "").strip('"') or None
+				size = prop.findtext("d:getcontentlength", namespaces=ns)
+				props["size"] = int(size) if size else None
+				props["is_dir"] = prop.find("d:resourcetype/d:collection", ns) is not None
+				props["checksums"] = parse_checksums(prop.findtext("oc:checksums/oc:checksum", namespaces=ns))
+
+		entries[href] = dict(props, name=href.rsplit("/", 1)[-1])
+
+	return entries
+
+
+class FileSlice:
+	"""
+	Файловый объект для тела PUT: отрезок [offset, offset + length) файла.
+
+	requests читает тело блоками через read(), поэтому в памяти находится
+	не больше одного блока, а не весь чанк.
+	"""
+
+	def __init__(self, path, offset, length, digest=None):
+		self.length = length
+		self.remaining = length
+		self.digest = digest
+		self._file = open(path, "rb")
+		self._file.seek(offset)
+
+	def __len__(self):
+		return self.length
+
+	def read(self, size=-1):
+		if self.remaining <= 0:
+			return b""
+		if size is None or size < 0 or size > self.remaining:
+			size = self.remaining
+		data = self._file.read(size)
+		self.remaining -= len(data)
+		# SHA1 считается по мере отправки — файл читается один раз
+		if self.digest is not None:
+			self.digest.update(data)
+		return data
+
+	def close(self):
+		self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def parse_checksums(value):
+	"""'SHA1:abc MD5:def' → {'SHA1': 'abc', 'MD5': 'def'}"""
+	checksums = {}
+	for item in (value or "").split():
+		algorithm, _, digest = item.partition(":")
+		if digest:
+			checksums[algorithm.upper()] = digest.lower()
+	return checksums
+
+
+def file_checksum(local_path, block_size=1024 * 1024):
+	"""SHA1 локального файла (читается блоками, без загрузки в память целиком)"""
+	digest = hashlib.sha1()
+	with open(local_path, "rb") as f:
+		for block in iter(lambda: f.read(block_size), b""):
+			digest.update(block)
+	return digest.hexdigest()
+
+
+# Клиенты текущего процесса: {ключ конфигурации: NextCloudWebDAVClient}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+	"""
+	HTTPAdapter, который считает новые соединения (handshakes).
+
+	urllib3 хранит счётчик num_connections в каждом connection pool.
+	Пулы, вытесненные из PoolManager, суммируются при закрытии,
+	чтобы счётчик не терялся.
+	"""
+
+	def init_poolmanager(self, *args, **kwargs):
+		super().init_poolmanager(*args, **kwargs)
+		self.disposed_connections = 0
+		pools = self.poolmanager.pools
+
+		def dispose(pool):
+			self.disposed_connections += getattr(pool, "num_connections", 0)
+			pool.close()
+
+		pools.dispose_func = dispose
+
+	def count_connections(self):
+		pools = self.poolmanager.pools
+		total = self.disposed_connections
+		for key in list(pools.keys()):
+			pool = pools.get(key)
+			if pool is not None:
+				total += getattr(pool, "num_connections", 0)
+		return total
+
+
+class NextCloudWebDAVClient:
+	"""Пул keep-alive соединений к /remote.php/dav/files/<user>/ одного NextCloud."""
+
+	def __init__(self, config):
+		self.base_url = config["url"].rstrip("/")
+		self.user = config["user"]
+		self.root_path = config.get("root_path")
+		self.dav_root = f"{self.base_url}/remote.php/dav/files/{self.user}"
+
+		self.pool_size = int(config.get("pool_size") or DEFAULT_POOL_SIZE)
+		self.connect_timeout = int(config.get("connect_timeout") or DEFAULT_CONNECT_TIMEOUT)
+		self.timeout = int(config.get("timeout") or DEFAULT_TIMEOUT)
+		self.upload_timeout = int(config.get("upload_timeout") or DEFAULT_UPLOAD_TIMEOUT)
+
+		# Chunked upload: 0 в chunk_threshold отключает загрузку по частям
+		self.chunk_size = int(config.get("chunk_size") or DEFAULT_CHUNK_SIZE_MB) * 1024 * 1024
+		chunk_threshold = config.get("chunk_threshold")
+		if chunk_threshold is None:
+			chunk_threshold = DEFAULT_CHUNK_THRESHOLD_MB
+		self.chunk_threshold = int(chunk_threshold) * 1024 * 1024
+		self.uploads_root = f"{self.base_url}/remote.php/dav/uploads/{self.user}"
+
+		self.session = requests.Session()
+		self.session.auth = HTTPBasicAuth(self.user, config["password"])
+		self.session.headers.update({"User-Agent": "company_documents-nextcloud-sync"})
+
+		self.adapter = CountingHTTPAdapter(
+			pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0
+		)
+		self.session.mount("https://", self.adapter)
+		self.session.mount("http://", self.adapter)
+
+		self._lock = threading.Lock()
+		self.reset_stats()
+
+	# -------------------------------------------------------------------------
+	# Пути
+	# -------------------------------------------------------------------------
+
+	def remote_path(self, path):
+		"""Путь относительно NextCloud root → путь относительно домашней папки пользователя"""
+		path = path.lstrip("/")
+		if self.root_path and self.root_path != "/":
+			return f"{self.root_path.strip('/')}/{path}"
+		return path
+
+	def url_for(self, path):
+		"""Полный WebDAV URL для пути относительно NextCloud root"""
+		return f"{self.dav_root}/{quote(self.remote_path(path).encode('utf-8'))}"
+
+	# -------------------------------------------------------------------------
+	# HTTP
+	# -------------------------------------------------------------------------
+
+	def request(self, method, path, headers=None, data=None, timeout=None, url=None):
+		"""
+		Выполнить WebDAV запрос через общий пул соединений.
+
+		Args:
+		    method: HTTP/WebDAV метод (MKCOL, PUT, PROPFIND, MOVE, DELETE)
+		    path: путь относительно NextCloud root (игнорируется, если передан url)
+		    headers: дополнительные заголовки
+		    data: тело запроса (str, bytes или файловый объект)
+		    timeout: read timeout в секундах (по умолчанию self.timeout)
+		    url: готовый URL (для путей вне /files/, например /uploads/)
+
+		Returns:
+		    requests.Response
+		"""
+		target = url or self.url_for(path)
+		read_timeout = timeout or self.timeout
+
+		with self._lock:
+			self.stats["requests"] += 1
+			self.stats["by_method"][method] = self.stats["by_method"].get(method, 0) + 1
+
+		observer = request_observer.get()
+		op = None
+		if observer is not None:
+			op = {"method": method, "status": None, "bytes_sent": super_len(data) if data is not None else 0}
+			started = time.perf_counter()
+
+		try:
+			response = self.session.request(
+				method, target, headers=headers, data=data, timeout=(self.connect_timeout, read_timeout)
+			)
+		except requests.RequestException as e:
+			with self._lock:
+				self.stats["errors"] += 1
+			if op is not None:
+				op.update(
+					latency_ms=(time.perf_counter() - started) * 1000,
+					bytes_received=0,
+					error=type(e).__name__,
+				)
+				observer(op)
+			raise
+
+		if op is not None:
+			op.update(
+				status=response.status_code,
+				latency_ms=(time.perf_counter() - started) * 1000,
+				bytes_received=len(response.content),
+			)
+			observer(op)
+
+		return response
+
+	def mkcol(self, path):
+		return self.request("MKCOL", path)
+
+	def put(self, path, data, headers=None):
+		return self.request("PUT", path, headers=headers, data=data, timeout=self.upload_timeout)
+
+	def propfind(self, path, body, depth="0"):
+		return self.request("PROPFIND", path, headers={"Depth": str(depth)}, data=body)
+
+	def move(self, source_path, dest_path, overwrite=True):
+		headers = {"Destination": self.url_for(dest_path), "Overwrite": "T" if overwrite else "F"}
+		return self.request("MOVE", source_path, headers=headers)
+
+	def delete(self, path):
+		return self.request("DELETE", path)
+
+	def search_tree(self, path):
+		"""
+		Все файлы поддерева одним запросом WebDAV SEARCH (depth infinity).
+
+		Returns:
+		    requests.Response: 207 с теми же свойствами, что FOLDER_PROPFIND_XML
+		"""
+		scope = f"/files/{self.user}/{self.remote_path(path).strip('/')}"
+		return self.request(
+			"SEARCH",
+			None,
+			headers={"Content-Type": "text/xml; charset=utf-8"},
+			data=TREE_SEARCH_XML.format(scope=escape(scope)).encode("utf-8"),
+			timeout=self.upload_timeout,
+			url=f"{self.base_url}/remote.php/dav/",
+		)
+
+	def relative_path(self, href):
+		"""href из parse_folder_listing (уже раскодирован) → путь относительно NextCloud root"""
+		prefix = urlparse(self.dav_root).path.rstrip("/") + "/" + self.remote_path("")
+		return href[len(prefix) :].strip("/") if href.startswith(prefix) else None
+
+	# -------------------------------------------------------------------------
+	# Загрузка файлов (обычная и chunked, NextCloud chunking v2)
+	# -------------------------------------------------------------------------
+
+	def upload_file(self, local_path, remote_path, headers=None, checksum=None):
+		"""
+		Загрузить локальный файл. Файлы не меньше chunk_threshold
+		загружаются по частям через /remote.php/dav/uploads/.
+
+		checksum (SHA1) передаётся в OC-Checksum: NextCloud сохраняет его
+		и возвращает в oc:checksums, по нему потом сравнивается содержимое.
+		Checksum передаётся всегда: для обычного PUT (файлы меньше порога)
+		хэш считается перед отправкой, если не посчитан заранее; при загрузке
+		по частям — во время отправки чанков.
+
+		Returns:
+		    requests.Response: ответ PUT (или финального MOVE для chunked)
+		"""
+		size = os.path.getsize(local_path)
+
+		if self.chunk_threshold and size >= self.chunk_threshold and size > self.chunk_size:
+			return self.put_chunked(local_path, remote_path, size, headers=headers, checksum=checksum)
+
+		checksum = checksum or file_checksum(local_path)
+		headers = dict(headers or {}, **{"OC-Checksum": f"SHA1:{checksum}"})
+
+		with open(local_path, "rb") as f:
+			return self.put(remote_path, f, headers=headers)
+
+	def upload_id(self, local_path, remote_path, size):
+		"""
+		Детерминированный id папки загрузки: повторная попытка того же файла
+		(тот же путь, размер, mtime и размер чанка) попадает в ту же папку
+		и продолжает загрузку с последнего чанка.
+		"""
+		mtime = int(os.path.getmtime(local_path))
+		key = f"{self.remote_path(remote_path)}|{size}|{mtime}|{self.chunk_size}"
+		return "cd-" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+	def uploaded_chunks(self, upload_url):
+		"""Уже загруженные чанки папки загрузки: {номер чанка: размер}"""
+		response = self.request(
+			"PROPFIND", None, headers={"Depth": "1"}, data=FOLDER_PROPFIND_XML, url=upload_url
+		)
+		if response.status_code != 207:
+			return {}
+
+		chunks = {}
+		for entry in parse_folder_listing(response.content).values():
+			if entry.get("is_dir") or not entry["name"].isdigit():
+				continue
+			chunks[int(entry["name"])] = entry.get("size") or 0
+		return chunks
+
+	def put_chunked(self, local_path, remote_path, size=None, headers=None, checksum=None):
+		"""
+		Загрузка по частям (NextCloud chunking v2):
+		MKCOL uploads/<id> → PUT uploads/<id>/<n> → MOVE uploads/<id>/.file.
+
+		Прогресс хранится на стороне NextCloud в папке загрузки: если папка
+		уже существует, загруженные целиком чанки пропускаются.
+
+		Без checksum SHA1 файла считается по мере отправки чанков (пропущенные
+		чанки только читаются) и передаётся в OC-Checksum финального MOVE.
+		"""
+		if size is None:
+			size = os.path.getsize(local_path)
+
+		destination = self.url_for(remote_path)
+		upload_url = f"{self.uploads_root}/{self.upload_id(local_path, remote_path, size)}"
+		chunk_headers = {"Destination": destination, "OC-Total-Length": str(size)}
+
+		response = self.request("MKCOL", None, headers={"Destination": destination}, url=upload_url)
+		if response.status_code == 405:
+			# Папка загрузки уже есть — продолжаем прерванную загрузку
+			done = self.uploaded_chunks(upload_url)
+		elif response.status_code in [200, 201]:
+			done = {}
+		else:
+			return response
+
+		chunk_count = (size + self.chunk_size - 1) // self.chunk_size
+		digest = None if checksum else hashlib.sha1()
+
+		for number in range(1, chunk_count + 1):
+			offset = (number - 1) * self.chunk_size
+			length = min(self.chunk_size, size - offset)
+			# Копия: хэш неудачной отправки чанка не попадёт в итоговый
+			chunk_digest = digest.copy() if digest is not None else None
+
+			if done.get(number) == length:
+				if chunk_digest is not None:
+					with FileSlice(local_path, offset, length, chunk_digest) as body:
+						while body.read(1024 * 1024):
+							pass
+					digest = chunk_digest
+				continue
+
+			with FileSlice(local_path, offset, length, chunk_digest) as body:
+				response = self.request(
+					"PUT",
+					None,
+					headers=dict(chunk_headers, **{"Content-Length": str(length)}),
+					data=body,
+					timeout=self.upload_timeout,
+					url=f"{upload_url}/{number:05d}",
+				)
+
+			if response.status_code not in [200, 201, 204]:
+				return response
+			digest = chunk_digest
+
+		checksum = checksum or digest.hexdigest()
+
+		# Дополнительные заголовки (OC-Checksum) относятся к собранному файлу
+		return self.request(
+			"MOVE",
+			None,
+			headers=dict(
+				headers or {},
+				**{
+					"Destination": destination,
+					"OC-Total-Length": str(size),
+					"Overwrite": "T",
+					"OC-Checksum": f"SHA1:{checksum}",
+				},
+			),
+			timeout=self.upload_timeout,
+			url=f"{upload_url}/.file",
+		)
+
+	# -------------------------------------------------------------------------
+	# Статистика
+	# -------------------------------------------------------------------------
+
+	def reset_stats(self):
+		self.stats = {"requests": 0, "errors": 0, "by_method": {}}
+		self._handshakes_base = self.adapter.count_connections()
+
+	def get_stats(self):
+		"""Счётчики запросов и handshakes с момента последнего reset_stats()"""
+		with self._lock:
+			stats = {
+				"requests": self.stats["requests"],
+				"errors": self.stats["errors"],
+				"by_method": dict(self.stats["by_method"]),
+			}
+		stats["handshakes"] = self.adapter.count_connections() - self._handshakes_base
+		stats["reused"] = max(stats["requests"] - stats["errors"] - stats["handshakes"], 0)
+		stats["pool_size"] = self.pool_size
+		return stats
+
+	def close(self):
+		self.session.close()
+
+
+def _client_key(config):
+	return (
+		config["url"].rstrip("/"),
+		config["user"],
+		config["password"],
+		config.get("root_path"),
+		config.get("pool_size"),
+		config.get("connect_timeout"),
+		config.get("timeout"),
+		config.get("upload_timeout"),
+		config.get("chunk_size"),
+		config.get("chunk_threshold"),
+	)
+
+
+def get_webdav_client(config):
+	"""
+	Вернуть WebDAV клиент текущего воркера для данной конфигурации.
+
+	Клиент создаётся один раз на процесс и переиспользуется всеми функциями
+	nextcloud_sync. При изменении настроек (URL, пароль, пул, таймауты)
+	создаётся новый клиент, старый закрывается.
+	"""
+	key = _client_key(config)
+	client = _clients.get(key)
+	if client is not None:
+		return client
+
+	with _clients_lock:
+		client = _clients.get(key)
+		if client is None:
+			stale = [k for k in _clients if k[:2] == key[:2]]
+			for k in stale:
+				_clients.pop(k).close()
+			client = NextCloudWebDAVClient(config)
+			_clients[key] = client
+	return client
+
+
+def get_all_clients():
+	"""Все клиенты текущего процесса (для статистики)"""
+	return list(_clients.values())